@@ -1,20 +1,98 @@
+import errno
+import glob
+import messages
+import mmap
+import os
+import pickle
+import select
+import struct
+import tempfile
 import zmq
 
+TCP = 'tcp'
+IN_PROCESS = 'inprocess'
+SHARED_MEMORY = 'shm'
+TRANSPORTS = [TCP, IN_PROCESS, SHARED_MEMORY]
 
-class Server(object):
+
+class Transport(object):
+    """Channel carrying messages between the simulator and the controller.
+
+    Subclasses move raw payloads with recv and send, while serialize and
+    deserialize convert between payloads and message objects.
+    """
+    def recv(self):
+        raise NotImplementedError, 'Transport must implement recv'
+
+    def send(self, data):
+        raise NotImplementedError, 'Transport must implement send'
+
+    def serialize(self, message):
+        return pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+
+    def deserialize(self, data):
+        return pickle.loads(data)
+
+    def recv_message(self):
+        return self.deserialize(self.recv())
+
+    def send_message(self, message):
+        self.send(self.serialize(message))
+
+    def recv_request(self):
+        """Receive a request, returning a token naming it and the message.
+
+        Server ends may hold several requests at once, answering each by
+        passing its token to send_reply.
+        """
+        raise NotImplementedError, 'Transport must implement recv_request'
+
+    def send_reply(self, token, message):
+        raise NotImplementedError, 'Transport must implement send_reply'
+
+    def get_pollable(self):
+        """Socket or file descriptor that is readable when a message waits."""
+        raise NotImplementedError, 'Transport must implement get_pollable'
+
+    def close(self):
+        pass
+
+
+class Server(Transport):
+    """Controller end of a TCP connection.
+
+    A ROUTER socket keeps the envelope of each request, so further requests
+    can be read before earlier ones are answered.
+    """
     def __init__(self, port=5555):
         context = zmq.Context()
-        self.socket = context.socket(zmq.REP)
+        self.socket = context.socket(zmq.ROUTER)
         self.socket.bind('tcp://*:{}'.format(port))
+        self.envelope = None
 
     def recv(self):
-        return self.socket.recv()
+        frames = self.socket.recv_multipart()
+        self.envelope = frames[:-1]
+        return frames[-1]
 
     def send(self, message):
-        self.socket.send(message)
+        self.socket.send_multipart(self.envelope + [message])
+
+    def recv_request(self):
+        data = self.recv()
+        return (self.envelope, self.deserialize(data))
+
+    def send_reply(self, envelope, message):
+        self.socket.send_multipart(envelope + [self.serialize(message)])
 
+    def get_pollable(self):
+        return self.socket
 
-class Client(object):
+    def close(self):
+        self.socket.close()
+
+
+class Client(Transport):
     def __init__(self, address='localhost', port=5555):
         context = zmq.Context()
         self.socket = context.socket(zmq.REQ)
@@ -24,4 +102,526 @@ class Client(object):
         return self.socket.recv()
 
     def send(self, message):
-        self.socket.send(message)
\ No newline at end of file
+        self.socket.send(message)
+
+    def close(self):
+        self.socket.close()
+
+
+class InProcessClient(Transport):
+    """Client calling a MessageRouter that lives in the same process.
+
+    Messages are handed to the router by reference, so nothing is serialized
+    and no socket is involved.
+    """
+    def __init__(self, router):
+        self.router = router
+        self.replies = []
+
+    def send_message(self, message):
+        self.replies.append(self.router.process_message(message))
+
+    def recv_message(self):
+        return self.replies.pop(0)
+
+
+class PipeTransport(Transport):
+    """Either end of a multiprocessing pipe between controller processes."""
+    def __init__(self, connection):
+        self.connection = connection
+
+    def recv(self):
+        return self.connection.recv_bytes()
+
+    def send(self, data):
+        self.connection.send_bytes(data)
+
+    def get_pollable(self):
+        return self.connection.fileno()
+
+
+def shared_memory_path(port=5555):
+    """Ring buffer file shared by a controller and simulator using a port."""
+    if os.path.isdir('/dev/shm'):
+        directory = '/dev/shm'
+    else:
+        directory = tempfile.gettempdir()
+    return os.path.join(directory, 'multiagent-rl-{}'.format(port))
+
+
+def remove_shared_memory(path):
+    """Delete a ring buffer file, its named pipes and any overflow files."""
+    for filename in ([path, path + '.req', path + '.rep'] +
+        glob.glob(path + '.*.overflow')):
+        if os.path.exists(filename):
+            os.unlink(filename)
+
+
+def is_process_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class lazy_field(object):
+    """Attribute computed by a method on first access and then stored."""
+    def __init__(self, method):
+        self.method = method
+        self.name = method.__name__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.method(instance)
+        instance.__dict__[self.name] = value
+        return value
+
+
+class SharedStateMessage(messages.StateMessage):
+    """State message read in place from a shared memory slot.
+
+    Scalar fields are read when the message is built and the others the
+    first time they are used, straight from the mapped memory, so the
+    message is only valid until the reply is written over its slot.
+    """
+    def __init__(self, transport, offset):
+        messages.BaseMessage.__init__(self, msg_type=messages.STATE)
+        (self.agent_id, self.reward, executed_action, test_mode,
+            self._num_positions, self._num_fragile, self._num_food,
+            self._num_walls, self._num_legal) = transport.STATE_FIELDS.unpack_from(
+            transport.buffer, offset)
+        self._transport = transport
+        self._positions_offset = offset + transport.STATE_FIELDS.size
+        self._fragile_offset = (self._positions_offset +
+            self._num_positions * transport.POSITION.size)
+        self._food_offset = (self._fragile_offset +
+            self._num_fragile * transport.FRAGILE.size)
+        self._walls_offset = (self._food_offset +
+            self._num_food * transport.CELL.size)
+        self._legal_offset = (self._walls_offset +
+            self._num_walls * transport.CELL.size)
+
+        self.executed_action = transport._decode_action(executed_action)
+        if test_mode == transport.NO_VALUE:
+            self.test_mode = None
+        else:
+            self.test_mode = bool(test_mode)
+
+    def _unpack_all(self, fields, offset, count):
+        return [fields.unpack_from(self._transport.buffer,
+            offset + i * fields.size) for i in range(count)]
+
+    @lazy_field
+    def agent_positions(self):
+        decode = self._transport._decode_coordinate
+        return {id_: (decode(y), decode(x)) for id_, y, x in self._unpack_all(
+            self._transport.POSITION, self._positions_offset,
+            self._num_positions)}
+
+    @lazy_field
+    def fragile_agents(self):
+        return dict(self._unpack_all(self._transport.FRAGILE,
+            self._fragile_offset, self._num_fragile))
+
+    @lazy_field
+    def food_positions(self):
+        return self._unpack_all(self._transport.CELL, self._food_offset,
+            self._num_food)
+
+    @lazy_field
+    def wall_positions(self):
+        return self._unpack_all(self._transport.CELL, self._walls_offset,
+            self._num_walls)
+
+    @lazy_field
+    def legal_actions(self):
+        return [self._transport._decode_action(code) for code, in
+            self._unpack_all(self._transport.ACTION_CODE, self._legal_offset,
+            self._num_legal)]
+
+    def copy(self):
+        """Plain StateMessage holding the fields, valid after the reply."""
+        return messages.StateMessage(agent_id=self.agent_id,
+            agent_positions=self.agent_positions,
+            food_positions=self.food_positions,
+            fragile_agents=self.fragile_agents,
+            wall_positions=self.wall_positions,
+            legal_actions=self.legal_actions, reward=self.reward,
+            executed_action=self.executed_action, test_mode=self.test_mode)
+
+    def __reduce__(self):
+        return (messages.StateMessage, (), self.copy().__dict__)
+
+
+class SharedMemoryTransport(Transport):
+    """Ring of fixed-size request/reply slots in a memory-mapped file.
+
+    The simulator writes a request into the next free slot and the controller
+    overwrites it with the reply. Messages sent every step are packed field
+    by field straight into the mapped memory, and states are read back in
+    place as SharedStateMessage. Other messages are stored as pickles, and
+    pickles too large for a slot spill to an overflow file next to the ring.
+    A pair of named pipes carries one byte per request and per reply, so
+    both ends block without polling.
+    """
+    MAGIC = 0x4c52414d
+    HEADER = struct.Struct('<IIIi')
+    NEXT_SLOT = struct.Struct('<I')
+    SLOT_HEADER = struct.Struct('<III')
+
+    FREE = 0
+    REQUEST = 1
+    REPLY = 2
+
+    PICKLED = 0
+    PACKED_STATE = 1
+    PACKED_ACTION = 2
+    PACKED_ACK = 3
+    PACKED_REQUEST = 4
+    PACKED_START = 5
+    OVERFLOW = 6
+
+    ACTIONS = ['North', 'South', 'East', 'West', 'Stop']
+    REQUESTS = [messages.INIT, messages.REQUEST_BEHAVIOR_COUNT,
+        messages.REQUEST_POLICY, messages.REQUEST_STATS]
+    REQUEST_CLASSES = [messages.InitMessage,
+        messages.RequestBehaviorCountMessage, messages.RequestPolicyMessage,
+        messages.RequestStatsMessage]
+    NO_VALUE = 255
+    NO_AGENT = -1
+
+    STATE_FIELDS = struct.Struct('<idBBHHHHB')
+    ACTION_FIELDS = struct.Struct('<iB')
+    REQUEST_FIELDS = struct.Struct('<Bi')
+    START_FIELDS = struct.Struct('<iii')
+    POSITION = struct.Struct('<hdd')
+    FRAGILE = struct.Struct('<hd')
+    CELL = struct.Struct('<hh')
+    ACTION_CODE = struct.Struct('<B')
+
+    def _open(self, path, num_slots, slot_size, create):
+        if create:
+            self._remove_stale(path)
+            for fifo in [path + '.req', path + '.rep']:
+                os.mkfifo(fifo)
+            with open(path, 'w+b') as f:
+                f.write('\0' * (self.HEADER.size + self.NEXT_SLOT.size +
+                    num_slots * slot_size))
+        elif not os.path.exists(path):
+            raise IOError('No shared memory controller at {}'.format(path))
+
+        self.path = path
+        self.file = open(path, 'r+b')
+        self.buffer = mmap.mmap(self.file.fileno(), 0)
+
+        if create:
+            self.HEADER.pack_into(self.buffer, 0, self.MAGIC, num_slots,
+                slot_size, os.getpid())
+
+        (magic, self.num_slots, self.slot_size,
+            self.server_pid) = self.HEADER.unpack_from(self.buffer, 0)
+        if magic != self.MAGIC:
+            raise IOError('{} is not a shared memory ring buffer'.format(path))
+        if not is_process_alive(self.server_pid):
+            raise IOError('Stale shared memory ring buffer at {}, its '
+                'controller (pid {}) is gone'.format(path, self.server_pid))
+
+        # Opening read-write never blocks waiting for the other end
+        self.request_fd = os.open(path + '.req', os.O_RDWR)
+        self.reply_fd = os.open(path + '.rep', os.O_RDWR)
+
+    def _remove_stale(self, path):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                header = f.read(self.HEADER.size)
+            if len(header) == self.HEADER.size:
+                magic, _, _, pid = self.HEADER.unpack(header)
+                if (magic == self.MAGIC and pid != os.getpid() and
+                    is_process_alive(pid)):
+                    raise IOError('Controller (pid {}) is already serving '
+                        '{}'.format(pid, path))
+        remove_shared_memory(path)
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+        os.close(self.request_fd)
+        os.close(self.reply_fd)
+
+    def _slot_offset(self, slot):
+        return self.HEADER.size + self.NEXT_SLOT.size + slot * self.slot_size
+
+    def _slot_status(self, slot):
+        return self.SLOT_HEADER.unpack_from(self.buffer,
+            self._slot_offset(slot))
+
+    def _set_slot_status(self, slot, status, kind=0, length=0):
+        self.SLOT_HEADER.pack_into(self.buffer, self._slot_offset(slot),
+            status, kind, length)
+
+    def _encode_action(self, action):
+        if action in self.ACTIONS:
+            return self.ACTIONS.index(action)
+        return self.NO_VALUE
+
+    def _decode_action(self, code):
+        if code == self.NO_VALUE:
+            return None
+        return self.ACTIONS[code]
+
+    def _decode_coordinate(self, value):
+        if value == int(value):
+            return int(value)
+        return value
+
+    def _pack_state(self, message, offset, end):
+        positions = message.agent_positions.items()
+        fragile_agents = message.fragile_agents.items()
+        food_positions = message.food_positions
+        wall_positions = message.wall_positions
+        legal_actions = message.legal_actions
+
+        size = (self.STATE_FIELDS.size + len(positions) * self.POSITION.size +
+            len(fragile_agents) * self.FRAGILE.size +
+            (len(food_positions) + len(wall_positions)) * self.CELL.size +
+            len(legal_actions) * self.ACTION_CODE.size)
+        if offset + size > end:
+            return None
+
+        if message.test_mode is None:
+            test_mode = self.NO_VALUE
+        else:
+            test_mode = int(message.test_mode)
+
+        self.STATE_FIELDS.pack_into(self.buffer, offset, message.agent_id,
+            message.reward, self._encode_action(message.executed_action),
+            test_mode, len(positions), len(fragile_agents),
+            len(food_positions), len(wall_positions), len(legal_actions))
+        cursor = offset + self.STATE_FIELDS.size
+
+        for id_, pos in positions:
+            self.POSITION.pack_into(self.buffer, cursor, id_, pos[0], pos[1])
+            cursor += self.POSITION.size
+
+        for id_, status in fragile_agents:
+            self.FRAGILE.pack_into(self.buffer, cursor, id_, status)
+            cursor += self.FRAGILE.size
+
+        for pos in food_positions + wall_positions:
+            self.CELL.pack_into(self.buffer, cursor, pos[0], pos[1])
+            cursor += self.CELL.size
+
+        for action in legal_actions:
+            self.ACTION_CODE.pack_into(self.buffer, cursor,
+                self._encode_action(action))
+            cursor += self.ACTION_CODE.size
+
+        return size
+
+    def _pack_fields(self, fields, offset, *values):
+        try:
+            fields.pack_into(self.buffer, offset, *values)
+        except struct.error:
+            return False
+        return True
+
+    def _write_overflow(self, data, offset):
+        fd, overflow_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+            prefix=os.path.basename(self.path) + '.', suffix='.overflow')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self.buffer[offset:offset + len(overflow_path)] = overflow_path
+        return (self.OVERFLOW, len(overflow_path))
+
+    def _read_overflow(self, offset, length):
+        overflow_path = self.buffer[offset:offset + length]
+        with open(overflow_path, 'rb') as f:
+            data = f.read()
+        os.unlink(overflow_path)
+        return pickle.loads(data)
+
+    def write_slot(self, slot, message):
+        """Store message in the slot payload, returning (kind, length)."""
+        offset = self._slot_offset(slot) + self.SLOT_HEADER.size
+        end = self._slot_offset(slot) + self.slot_size
+
+        if message.msg_type == messages.STATE:
+            length = self._pack_state(message, offset, end)
+            if length is not None:
+                return (self.PACKED_STATE, length)
+        elif (message.msg_type == messages.ACTION and
+            message.action in self.ACTIONS):
+            if self._pack_fields(self.ACTION_FIELDS, offset, message.agent_id,
+                self._encode_action(message.action)):
+                return (self.PACKED_ACTION, self.ACTION_FIELDS.size)
+        elif message.msg_type == messages.ACK:
+            return (self.PACKED_ACK, 0)
+        elif message.msg_type in self.REQUESTS:
+            if message.agent_id is None:
+                agent_id = self.NO_AGENT
+            else:
+                agent_id = message.agent_id
+            if self._pack_fields(self.REQUEST_FIELDS, offset,
+                self.REQUESTS.index(message.msg_type), agent_id):
+                return (self.PACKED_REQUEST, self.REQUEST_FIELDS.size)
+        elif message.msg_type == messages.START:
+            if self._pack_fields(self.START_FIELDS, offset, message.agent_id,
+                message.map_width, message.map_height):
+                return (self.PACKED_START, self.START_FIELDS.size)
+
+        data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+        if offset + len(data) > end:
+            return self._write_overflow(data, offset)
+        self.buffer[offset:offset + len(data)] = data
+        return (self.PICKLED, len(data))
+
+    def read_slot(self, slot):
+        """Rebuild the message stored in the slot payload."""
+        _, kind, length = self._slot_status(slot)
+        offset = self._slot_offset(slot) + self.SLOT_HEADER.size
+
+        if kind == self.PACKED_STATE:
+            return SharedStateMessage(self, offset)
+        elif kind == self.PACKED_ACTION:
+            agent_id, action = self.ACTION_FIELDS.unpack_from(self.buffer,
+                offset)
+            return messages.ActionMessage(agent_id=agent_id,
+                action=self._decode_action(action))
+        elif kind == self.PACKED_ACK:
+            return messages.AckMessage()
+        elif kind == self.PACKED_REQUEST:
+            code, agent_id = self.REQUEST_FIELDS.unpack_from(self.buffer,
+                offset)
+            if agent_id == self.NO_AGENT:
+                agent_id = None
+            return self.REQUEST_CLASSES[code](agent_id=agent_id)
+        elif kind == self.PACKED_START:
+            agent_id, map_width, map_height = self.START_FIELDS.unpack_from(
+                self.buffer, offset)
+            return messages.StartMessage(agent_id=agent_id,
+                map_width=map_width, map_height=map_height)
+        elif kind == self.OVERFLOW:
+            return self._read_overflow(offset, length)
+        else:
+            return pickle.loads(self.buffer[offset:offset + length])
+
+
+class SharedMemoryServer(SharedMemoryTransport):
+    """Controller end of the ring buffer.
+
+    Creating a server replaces ring files left behind by a controller that
+    is no longer running, and close removes them.
+    """
+    def __init__(self, port=5555, num_slots=16, slot_size=16384, path=None):
+        if path is None:
+            path = shared_memory_path(port)
+        self._open(path, num_slots, slot_size, create=True)
+        self.next_slot = 0
+        self.current_slot = None
+
+    def close(self):
+        super(SharedMemoryServer, self).close()
+        remove_shared_memory(self.path)
+
+    def recv(self):
+        os.read(self.request_fd, 1)
+        slot = self.next_slot
+        self.next_slot = (self.next_slot + 1) % self.num_slots
+
+        if self._slot_status(slot)[0] != self.REQUEST:
+            raise IOError('Shared memory slot {} holds no request'.format(slot))
+
+        self.current_slot = slot
+        return slot
+
+    def deserialize(self, slot):
+        return self.read_slot(slot)
+
+    def serialize(self, message):
+        return self.write_slot(self.current_slot, message)
+
+    def _answer(self, slot, kind, length):
+        self._set_slot_status(slot, self.REPLY, kind, length)
+        os.write(self.reply_fd, '\0')
+
+    def send(self, data):
+        kind, length = data
+        self._answer(self.current_slot, kind, length)
+
+    def recv_request(self):
+        slot = self.recv()
+        return (slot, self.read_slot(slot))
+
+    def send_reply(self, slot, message):
+        kind, length = self.write_slot(slot, message)
+        self._answer(slot, kind, length)
+
+    def get_pollable(self):
+        return self.request_fd
+
+
+class SharedMemoryClient(SharedMemoryTransport):
+    """Simulator end of the ring buffer.
+
+    Clients of a single simulator process may share the ring, each one
+    keeping any number of requests in flight up to the number of slots.
+    Waiting for a reply gives up once the controller process is gone.
+    """
+    LIVENESS_INTERVAL = 1.0
+
+    # Wake-up bytes read, per ring, for replies no client has claimed yet
+    reply_credits = {}
+
+    def __init__(self, port=5555, path=None):
+        if path is None:
+            path = shared_memory_path(port)
+        self._open(path, None, None, create=False)
+        self.pending_slots = []
+
+    def _allocate_slot(self):
+        next_slot, = self.NEXT_SLOT.unpack_from(self.buffer, self.HEADER.size)
+        if self._slot_status(next_slot)[0] != self.FREE:
+            raise IOError('Shared memory ring buffer is full')
+
+        self.NEXT_SLOT.pack_into(self.buffer, self.HEADER.size,
+            (next_slot + 1) % self.num_slots)
+        return next_slot
+
+    def _read_wake_up(self):
+        while not select.select([self.reply_fd], [], [],
+            self.LIVENESS_INTERVAL)[0]:
+            if not is_process_alive(self.server_pid):
+                raise IOError('Shared memory controller (pid {}) is '
+                    'gone'.format(self.server_pid))
+        os.read(self.reply_fd, 1)
+
+    def send_message(self, message):
+        slot = self._allocate_slot()
+        kind, length = self.write_slot(slot, message)
+        self._set_slot_status(slot, self.REQUEST, kind, length)
+        self.pending_slots.append(slot)
+        os.write(self.request_fd, '\0')
+
+    def recv_message(self):
+        slot = self.pending_slots.pop(0)
+        credits = self.reply_credits
+
+        # Every reply writes one byte and every claimed reply consumes one.
+        # Bytes read while waiting may belong to other clients' replies, so
+        # they are credited to whichever reply is claimed next.
+        while self._slot_status(slot)[0] != self.REPLY:
+            self._read_wake_up()
+            credits[self.path] = credits.get(self.path, 0) + 1
+
+        if credits.get(self.path, 0) > 0:
+            credits[self.path] -= 1
+        else:
+            self._read_wake_up()
+
+        message = self.read_slot(slot)
+        self._set_slot_status(slot, self.FREE)
+        return message
@@ -2,23 +2,32 @@
 
 from __future__ import division
 import argparse
+import collections
 import communication as comm
-import pickle
+import copy
+import multiprocessing
 import agents
 import messages
+import metrics
 import state
+import time
+import zmq
 
 
 PORT = 5555
 
 class MessageRouter(object):
-    def __init__(self, port):
-        self.server = comm.Server(port=port)
+    def __init__(self, server=None, stats_report=None):
+        self.server = server
+        self.stats_report = stats_report
+        self.metrics = metrics.MessageMetrics()
         self.agents = {}
         self.agent_classes = {}
         self.agent_teams = {}
         self.game_states = {}
         self.game_number = {}
+        self.last_action = 'Stop'
+        self.pending_prediction = None
 
     def register_agent(self, message):
         print 'Registered %s\tID: %d\tClass: %s' % (message.agent_team, message.agent_id, message.agent_class.__name__)
@@ -37,8 +46,11 @@ class MessageRouter(object):
             and id_ != agent_id]
 
     def receive_message(self):
-        message = pickle.loads(self.server.recv())
-        return message
+        with self.metrics.timing('recv_wait'):
+            data = self.server.recv()
+
+        with self.metrics.timing('deserialize'):
+            return self.server.deserialize(data)
 
     def create_action_message(self, agent_id, action):
         message = messages.ActionMessage(agent_id=agent_id, action=action)
@@ -58,7 +70,11 @@ class MessageRouter(object):
         self.agents[agent_id].reset_behavior_count()
 
     def send_message(self, message):
-        self.server.send(pickle.dumps(message))
+        with self.metrics.timing('serialize'):
+            data = self.server.serialize(message)
+
+        with self.metrics.timing('send'):
+            self.server.send(data)
 
     def update_agent_state(self, state):
         agent_id = state.agent_id
@@ -70,90 +86,308 @@ class MessageRouter(object):
             self.game_states[agent_id].observe_fragile_agent(id_, status)
 
     def choose_action(self, state):
-        self.update_agent_state(state)
+        with self.metrics.timing('update_agent_state'):
+            self.update_agent_state(state)
+
         agent_state = self.game_states[state.agent_id]
-        agent_action = self.agents[state.agent_id].choose_action(agent_state, state.executed_action, state.reward, state.legal_actions, state.test_mode)
 
-        for id_ in self.game_states:
-            agent_state.predict_agent(id_, agent_action)
+        with self.metrics.timing('choose_action'):
+            agent_action = self.agents[state.agent_id].choose_action(agent_state, state.executed_action, state.reward, state.legal_actions, state.test_mode)
+
+        self.pending_prediction = (state.agent_id, agent_action)
 
         return agent_action
 
+    def predict_agents(self):
+        """Propagate beliefs with the last chosen action, if not done yet."""
+        if self.pending_prediction is None:
+            return
+
+        agent_id, agent_action = self.pending_prediction
+        self.pending_prediction = None
+        agent_state = self.game_states[agent_id]
+
+        # Every agent the state tracks, whichever worker owns its game state
+        with self.metrics.timing('predict_agent'):
+            for id_ in agent_state.agent_maps:
+                agent_state.predict_agent(id_, agent_action)
+
     def create_policy_message(self, agent_id):
         policy = self.agents[agent_id].get_policy()
         return messages.PolicyMessage(agent_id=agent_id, policy=policy)
 
-    def run(self):
-        self.last_action = 'Stop'
+    def process_message(self, received_message):
+        """Handle a message from the simulator and return the reply."""
+        reply_message = self.handle_message(received_message)
+        self.predict_agents()
+        return reply_message
+
+    def handle_message(self, received_message):
+        """Create the reply to a message, recording how long it took."""
+        start = time.time()
+        reply_message = self.create_reply_message(received_message)
+
+        self.metrics.count_message(received_message.msg_type)
+        self.metrics.record_message(received_message.msg_type,
+            time.time() - start)
+
+        return reply_message
+
+    def create_reply_message(self, received_message):
+        if received_message.msg_type == messages.STATE:
+            game_state = self.game_states[received_message.agent_id]
+            game_state.set_walls(received_message.wall_positions)
+            game_state.set_food_positions(received_message.food_positions)
+
+            agent_action = self.choose_action(received_message)
+            self.last_action = agent_action
+            return self.create_action_message(received_message.agent_id, agent_action)
+        elif received_message.msg_type == messages.INIT:
+            agent_id = received_message.agent_id
+            ally_ids = self.get_agent_allies(agent_id)
+            enemy_ids = self.get_agent_enemies(agent_id)
+
+            if agent_id in self.agents:
+                del self.agents[agent_id]
+
+            self.game_number[agent_id] = 0
+            self.agents[agent_id] = self.agent_classes[agent_id](agent_id, ally_ids, enemy_ids)
+            print 'Initialized %s\tID: %d\tClass: %s' % (self.agent_teams[agent_id], agent_id, self.agent_classes[agent_id].__name__)
+            return self.create_ack_message()
+        elif received_message.msg_type == messages.START:
+            width = received_message.map_width
+            height = received_message.map_height
+            agent_id = received_message.agent_id
+            ally_ids = self.get_agent_allies(agent_id)
+            enemy_ids = self.get_agent_enemies(agent_id)
+
+            if self.agent_teams[agent_id] == 'pacman':
+                eater = True
+            else:
+                eater = False
+
+            if agent_id in self.game_states:
+                del self.game_states[agent_id]
+
+            self.game_states[agent_id] = state.GameState(width, height, [],
+                agent_id=agent_id, ally_ids=ally_ids, enemy_ids=enemy_ids,
+                eater=eater, iteration=self.game_number[agent_id])
+            print 'Started game #%d  \tID: %d\tClass: %s' % (self.game_number[agent_id], agent_id, self.agent_classes[agent_id].__name__)
+
+            self.game_number[agent_id] += 1
+            return self.create_ack_message()
+        elif received_message.msg_type == messages.REGISTER:
+            self.register_agent(received_message)
+            return self.create_ack_message()
+        elif received_message.msg_type == messages.REQUEST_BEHAVIOR_COUNT:
+            reply_message = self.create_behavior_count_message(received_message.agent_id)
+            self.reset_behavior_count(received_message.agent_id)
+            return reply_message
+        elif received_message.msg_type == messages.REQUEST_POLICY:
+            return self.create_policy_message(received_message.agent_id)
+        elif received_message.msg_type == messages.POLICY:
+            # In-process transports share the sender's objects, so the agent
+            # must not learn on top of the simulator's copy of the policy
+            policy = copy.deepcopy(received_message.policy)
+            self.agents[received_message.agent_id].set_policy(policy)
+            return self.create_ack_message()
+        elif received_message.msg_type == messages.REQUEST_STATS:
+            return messages.StatsMessage(metrics=copy.deepcopy(self.metrics))
+
+    def get_metrics(self):
+        return self.metrics
 
+    def run(self):
         while True:
             received_message = self.receive_message()
+            self.send_message(self.handle_message(received_message))
+
+            # Predicting after replying lets the simulator carry on meanwhile
+            self.predict_agents()
+
+            if self.stats_report:
+                self.stats_report.update(self.get_metrics)
+
+
+def run_worker(connection):
+    router = MessageRouter(comm.PipeTransport(connection))
+
+    try:
+        router.run()
+    except (KeyboardInterrupt, EOFError):
+        pass
+
+
+class PendingReply(object):
+    """Request forwarded to one or more workers and their replies so far."""
+    def __init__(self, token, message, num_replies):
+        self.token = token
+        self.message = message
+        self.num_replies = num_replies
+        self.replies = []
+
+    def add_reply(self, reply):
+        """Store a worker reply, returning whether all have arrived."""
+        self.replies.append(reply)
+        return self.is_complete()
+
+    def is_complete(self):
+        return len(self.replies) == self.num_replies
+
+    def get_reply(self):
+        if self.message.msg_type == messages.REQUEST_STATS:
+            merged = metrics.MessageMetrics()
+
+            for reply in self.replies:
+                merged.merge(reply.metrics)
+
+            return messages.StatsMessage(metrics=merged)
+
+        return self.replies[0]
+
+
+class ShardedMessageRouter(object):
+    """Front router spreading agents over worker processes.
+
+    Each worker runs a MessageRouter owning the game states and learners of
+    the agents whose ID maps to it, so belief updates and learning of
+    different agents run on different cores. Registrations are broadcast,
+    since every worker needs all teams to find allies and enemies, and
+    stats requests are broadcast and merged.
+
+    The front keeps reading requests while workers are busy and answers
+    each one as soon as its workers reply, so as many agents are served at
+    once as the simulator keeps requests in flight, up to one per worker.
+    Each worker handles its own requests in order.
+    """
+    def __init__(self, server=None, num_workers=2, stats_report=None):
+        self.server = server
+        self.stats_report = stats_report
+        self.workers = []
+        self.processes = []
+        self.pending = []
+        self.poller = zmq.Poller()
+        self.pollables = {}
+
+        for index in range(num_workers):
+            front_connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_worker,
+                args=(worker_connection,))
+            process.daemon = True
+            process.start()
+            worker = comm.PipeTransport(front_connection)
+            self.workers.append(worker)
+            self.processes.append(process)
+            self.pending.append(collections.deque())
+            self.register_pollable(worker.get_pollable(), index)
+
+        if server is not None:
+            self.register_pollable(server.get_pollable(), None)
+
+    def register_pollable(self, pollable, worker_index):
+        self.poller.register(pollable, zmq.POLLIN)
+        self.pollables[pollable] = worker_index
+
+    def get_worker_index(self, agent_id):
+        return agent_id % len(self.workers)
+
+    def forward_message(self, token, message):
+        """Send a message to the workers it concerns without waiting."""
+        if message.msg_type in [messages.REGISTER, messages.REQUEST_STATS]:
+            indices = range(len(self.workers))
+        else:
+            indices = [self.get_worker_index(message.agent_id)]
+
+        pending = PendingReply(token, message, len(indices))
+
+        for index in indices:
+            self.workers[index].send_message(message)
+            self.pending[index].append(pending)
+
+        return pending
+
+    def receive_reply(self, index):
+        """Take the oldest reply of a worker, answering its request if done."""
+        pending = self.pending[index].popleft()
+
+        if (pending.add_reply(self.workers[index].recv_message()) and
+            pending.token is not None):
+            self.server.send_reply(pending.token, pending.get_reply())
+
+    def wait_reply(self, pending):
+        """Receive worker replies until a forwarded message is answered."""
+        for index in range(len(self.workers)):
+            while not pending.is_complete() and pending in self.pending[index]:
+                self.receive_reply(index)
+
+        return pending.get_reply()
+
+    def get_metrics(self):
+        """Merge the metrics of all workers."""
+        return self.process_message(messages.RequestStatsMessage()).metrics
+
+    def process_message(self, received_message):
+        return self.wait_reply(self.forward_message(None, received_message))
+
+    def poll(self, timeout=None):
+        """Serve whatever requests and worker replies are ready."""
+        for pollable, _ in self.poller.poll(timeout):
+            index = self.pollables[pollable]
+
+            if index is None:
+                self.forward_message(*self.server.recv_request())
+            else:
+                self.receive_reply(index)
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+            process.join()
+
+    def run(self):
+        while True:
+            self.poll()
+
+            if self.stats_report:
+                self.stats_report.update(self.get_metrics)
 
-            if received_message.msg_type == messages.STATE:
-                game_state = self.game_states[received_message.agent_id]
-                game_state.set_walls(received_message.wall_positions)
-                game_state.set_food_positions(received_message.food_positions)
-
-                agent_action = self.choose_action(received_message)
-                reply_message = self.create_action_message(received_message.agent_id, agent_action)
-                self.send_message(reply_message)
-
-                self.last_action = agent_action
-            elif received_message.msg_type == messages.INIT:
-                agent_id = received_message.agent_id
-                ally_ids = self.get_agent_allies(agent_id)
-                enemy_ids = self.get_agent_enemies(agent_id)
-
-                if agent_id in self.agents:
-                    del self.agents[agent_id]
-
-                self.game_number[agent_id] = 0
-                self.agents[agent_id] = self.agent_classes[agent_id](agent_id, ally_ids, enemy_ids)
-                self.send_message(self.create_ack_message())
-                print 'Initialized %s\tID: %d\tClass: %s' % (self.agent_teams[agent_id], agent_id, self.agent_classes[agent_id].__name__)
-            elif received_message.msg_type == messages.START:
-                width = received_message.map_width
-                height = received_message.map_height
-                agent_id = received_message.agent_id
-                ally_ids = self.get_agent_allies(agent_id)
-                enemy_ids = self.get_agent_enemies(agent_id)
-
-                if self.agent_teams[agent_id] == 'pacman':
-                    eater = True
-                else:
-                    eater = False
-
-                if agent_id in self.game_states:
-                    del self.game_states[agent_id]
-
-                self.game_states[agent_id] = state.GameState(width, height, [],
-                    agent_id=agent_id, ally_ids=ally_ids, enemy_ids=enemy_ids,
-                    eater=eater, iteration=self.game_number[agent_id])
-                self.send_message(self.create_ack_message())
-                print 'Started game #%d  \tID: %d\tClass: %s' % (self.game_number[agent_id], agent_id, self.agent_classes[agent_id].__name__)
-
-                self.game_number[agent_id] += 1
-            elif received_message.msg_type == messages.REGISTER:
-                self.register_agent(received_message)
-                self.send_message(self.create_ack_message())
-            elif received_message.msg_type == messages.REQUEST_BEHAVIOR_COUNT:
-                self.send_message(self.create_behavior_count_message(received_message.agent_id))
-                self.reset_behavior_count(received_message.agent_id)
-            elif received_message.msg_type == messages.REQUEST_POLICY:
-                self.send_message(self.create_policy_message(received_message.agent_id))
-            elif received_message.msg_type == messages.POLICY:
-                self.agents[received_message.agent_id].set_policy(received_message.policy)
-                self.send_message(self.create_ack_message())
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run controller system.')
     parser.add_argument('--port', dest='port', type=int, default=5555,
                         help='TCP port to connect to adapter')
+    parser.add_argument('--transport', dest='transport', type=str,
+                        default=comm.TCP, choices=[comm.TCP, comm.SHARED_MEMORY],
+                        help='channel to the simulator: tcp, or shm for a '
+                        'shared memory ring buffer named after the port')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=1,
+                        help='number of processes to shard agents across')
+    parser.add_argument('--stats-file', dest='stats_filename', type=str,
+                        help='periodically write message metrics to this file')
+    parser.add_argument('--stats-interval', dest='stats_interval', type=float,
+                        default=60, help='seconds between metrics reports')
     args = parser.parse_args()
 
-    router = MessageRouter(args.port)
+    if args.transport == comm.SHARED_MEMORY:
+        server = comm.SharedMemoryServer(port=args.port)
+    else:
+        server = comm.Server(port=args.port)
+
+    if args.stats_filename:
+        stats_report = metrics.PeriodicReport(args.stats_filename,
+            args.stats_interval)
+    else:
+        stats_report = None
+
+    if args.workers > 1:
+        router = ShardedMessageRouter(server, num_workers=args.workers,
+            stats_report=stats_report)
+    else:
+        router = MessageRouter(server, stats_report=stats_report)
 
     try:
         router.run()
     except KeyboardInterrupt:
-        print '\n\nInterrupted execution\n'
\ No newline at end of file
+        print '\n\nInterrupted execution\n'
+    finally:
+        server.close()
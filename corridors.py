@@ -0,0 +1,221 @@
+import heapq
+
+
+class CorridorGraph(object):
+    """Junction/corridor graph of a maze.
+
+    Junctions are the open cells that do not have exactly two open
+    neighbours: crossings, corners of open areas and dead ends. Every other
+    cell lies on a corridor, a run of cells between two junctions, and is
+    located by its corridor and its offset along it. Shortest distances and
+    first hops are only stored between junctions, so queries between cells
+    combine the few ways out of a corridor with the junction tables.
+
+    Positions are (y, x) tuples, as in state.Map.
+    """
+    def __init__(self, width, height, walls):
+        self.width = width
+        self.height = height
+        self._walls = set(walls)
+
+        self.junctions = []
+        self.junction_index = {}
+        self.corridors = []
+        self.corridor_ends = []
+        self.cell_corridor = {}
+
+        self._find_junctions()
+        self._find_corridors()
+        self._calculate_junction_paths()
+
+    def _is_open(self, pos):
+        return (0 <= pos[0] < self.height and 0 <= pos[1] < self.width and
+            pos not in self._walls)
+
+    def _neighbors(self, pos):
+        candidates = [(pos[0] + 1, pos[1]), (pos[0] - 1, pos[1]),
+            (pos[0], pos[1] + 1), (pos[0], pos[1] - 1)]
+        return [p for p in candidates if self._is_open(p)]
+
+    def _add_junction(self, pos):
+        self.junction_index[pos] = len(self.junctions)
+        self.junctions.append(pos)
+
+    def _find_junctions(self):
+        for y in range(self.height):
+            for x in range(self.width):
+                pos = (y, x)
+                if self._is_open(pos) and len(self._neighbors(pos)) != 2:
+                    self._add_junction(pos)
+
+    def _follow_corridor(self, junction, first):
+        cells = []
+        previous, current = junction, first
+
+        while current not in self.junction_index:
+            cells.append(current)
+            following = [p for p in self._neighbors(current) if p != previous]
+            previous, current = current, following[0]
+
+        return cells, current
+
+    def _add_corridor(self, start, cells, end):
+        corridor_id = len(self.corridors)
+        self.corridors.append(cells)
+        self.corridor_ends.append((start, end))
+
+        for offset, cell in enumerate(cells):
+            self.cell_corridor[cell] = (corridor_id, offset)
+
+    def _find_corridors(self):
+        for y in range(self.height):
+            for x in range(self.width):
+                pos = (y, x)
+                if not self._is_open(pos) or pos in self.junction_index:
+                    continue
+
+                if pos not in self.cell_corridor:
+                    start = self._corridor_start(pos)
+                    if start is None:
+                        # A loop without junctions gets one to enter it by
+                        self._add_junction(pos)
+                        start = pos
+
+                    for first in self._neighbors(start):
+                        if first not in self.junction_index and first not in self.cell_corridor:
+                            cells, end = self._follow_corridor(start, first)
+                            self._add_corridor(start, cells, end)
+
+    def _corridor_start(self, pos):
+        previous, current = None, pos
+
+        while current not in self.junction_index:
+            following = [p for p in self._neighbors(current) if p != previous]
+            previous, current = current, following[0]
+            if current == pos:
+                return None
+
+        return current
+
+    def _junction_edges(self):
+        """Edges out of every junction, as (length, neighbor junction, hop)."""
+        edges = [[] for _ in self.junctions]
+
+        for corridor_id, cells in enumerate(self.corridors):
+            start, end = self.corridor_ends[corridor_id]
+            length = len(cells) + 1
+            edges[self.junction_index[start]].append((length, self.junction_index[end], (corridor_id, 0)))
+            edges[self.junction_index[end]].append((length, self.junction_index[start], (corridor_id, len(cells) - 1)))
+
+        for index, junction in enumerate(self.junctions):
+            for neighbor in self._neighbors(junction):
+                if neighbor in self.junction_index:
+                    neighbor_index = self.junction_index[neighbor]
+                    edges[index].append((1, neighbor_index, (None, neighbor_index)))
+
+        return edges
+
+    def _calculate_junction_paths(self):
+        edges = self._junction_edges()
+        self.junction_distances = []
+        self.junction_hops = []
+
+        for source in range(len(self.junctions)):
+            distances = [None] * len(self.junctions)
+            hops = [None] * len(self.junctions)
+            queue = [(0, source, None)]
+
+            while queue:
+                distance, index, hop = heapq.heappop(queue)
+                if distances[index] is not None:
+                    continue
+                distances[index] = distance
+                hops[index] = hop
+
+                for length, neighbor, first in edges[index]:
+                    if distances[neighbor] is None:
+                        heapq.heappush(queue, (distance + length, neighbor, hop or first))
+
+            self.junction_distances.append(distances)
+            self.junction_hops.append(hops)
+
+    def locate(self, pos):
+        """Corridor and offset of a corridor cell, or None for junctions."""
+        return self.cell_corridor.get(pos)
+
+    def _cell(self, hop):
+        """Cell of a hop: a (corridor, offset) location, or (None, junction index)."""
+        corridor_id, offset = hop
+        if corridor_id is None:
+            return self.junctions[offset]
+        return self.corridors[corridor_id][offset]
+
+    def _exits(self, pos):
+        """Ways from a cell to the junctions: (junction index, distance, first hop)."""
+        if pos in self.junction_index:
+            return [(self.junction_index[pos], 0, None)]
+
+        corridor_id, offset = self.cell_corridor[pos]
+        cells = self.corridors[corridor_id]
+        start, end = self.corridor_ends[corridor_id]
+        before = (corridor_id, offset - 1) if offset > 0 else (None, self.junction_index[start])
+        after = (corridor_id, offset + 1) if offset < len(cells) - 1 else (None, self.junction_index[end])
+        return [(self.junction_index[start], offset + 1, before),
+            (self.junction_index[end], len(cells) - offset, after)]
+
+    def _entries(self, pos):
+        """Ways from the junctions to a cell: (junction index, distance, first hop)."""
+        if pos in self.junction_index:
+            return [(self.junction_index[pos], 0, None)]
+
+        corridor_id, offset = self.cell_corridor[pos]
+        cells = self.corridors[corridor_id]
+        start, end = self.corridor_ends[corridor_id]
+        return [(self.junction_index[start], offset + 1, (corridor_id, 0)),
+            (self.junction_index[end], len(cells) - offset, (corridor_id, len(cells) - 1))]
+
+    def _shortest(self, pos1, pos2):
+        """Length and first hop of a shortest path, or (None, None)."""
+        if pos1 == pos2:
+            return 0, None
+
+        best = (None, None)
+        location1 = self.cell_corridor.get(pos1)
+        location2 = self.cell_corridor.get(pos2)
+
+        if location1 and location2 and location1[0] == location2[0]:
+            step = 1 if location2[1] > location1[1] else -1
+            best = (abs(location2[1] - location1[1]), (location1[0], location1[1] + step))
+
+        for exit_index, exit_distance, exit_hop in self._exits(pos1):
+            distances = self.junction_distances[exit_index]
+            for entry_index, entry_distance, entry_hop in self._entries(pos2):
+                if distances[entry_index] is None:
+                    continue
+
+                distance = exit_distance + distances[entry_index] + entry_distance
+                if best[0] is None or distance < best[0]:
+                    hop = exit_hop or self.junction_hops[exit_index][entry_index] or entry_hop
+                    best = (distance, hop)
+
+        return best
+
+    def calculate_distance(self, pos1, pos2):
+        """Maze distance between two open cells, or None if unreachable."""
+        return self._shortest(pos1, pos2)[0]
+
+    def calculate_next_position(self, pos1, pos2):
+        """First cell of a shortest path between two open cells.
+
+        The first hop between junctions is stored per pair of junctions and
+        resolved to a cell by its corridor and offset. Returns pos1 itself
+        when both are the same, and None if pos2 cannot be reached.
+        """
+        distance, hop = self._shortest(pos1, pos2)
+
+        if distance is None:
+            return None
+        elif distance == 0:
+            return pos1
+        else:
+            return self._cell(hop)
@@ -8,6 +8,8 @@ REQUEST_BEHAVIOR_COUNT = 'RequestBehaviorCount'
 BEHAVIOR_COUNT = 'BehaviorCount'
 REQUEST_POLICY = 'RequestPolicy'
 POLICY = 'Policy'
+REQUEST_STATS = 'RequestStats'
+STATS = 'Stats'
 
 class BaseMessage(object):
     def __init__(self, msg_type=None):
@@ -86,4 +88,16 @@ class PolicyMessage(BaseMessage):
     def __init__(self, agent_id=None, policy=None):
         super(PolicyMessage, self).__init__(msg_type=POLICY)
         self.agent_id = agent_id
-        self.policy = policy
\ No newline at end of file
+        self.policy = policy
+
+
+class RequestStatsMessage(BaseMessage):
+    def __init__(self, agent_id=None):
+        super(RequestStatsMessage, self).__init__(msg_type=REQUEST_STATS)
+        self.agent_id = agent_id
+
+
+class StatsMessage(BaseMessage):
+    def __init__(self, metrics=None):
+        super(StatsMessage, self).__init__(msg_type=STATS)
+        self.metrics = metrics
@@ -0,0 +1,194 @@
+"""Counters and latency histograms for message handling"""
+
+from __future__ import division
+import contextlib
+import time
+
+
+class LatencyHistogram(object):
+    """HDR-style histogram of durations.
+
+    Durations are recorded as integer microseconds in log-linear buckets:
+    values below 2^precision_bits are exact, and each larger power of two is
+    split into 2^(precision_bits - 1) linear buckets, so any recorded value
+    is off by less than 2^(1 - precision_bits) relative to the true one,
+    whatever its magnitude, while only buckets actually hit take memory.
+    """
+    def __init__(self, precision_bits=6):
+        self.precision_bits = precision_bits
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def get_bucket(self, value):
+        shift = max(value.bit_length() - self.precision_bits, 0)
+        return (shift << self.precision_bits) | (value >> shift)
+
+    def get_bucket_limit(self, bucket):
+        """Return the largest value falling in the given bucket."""
+        shift = bucket >> self.precision_bits
+        mantissa = bucket & ((1 << self.precision_bits) - 1)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, duration):
+        """Record a duration given in seconds."""
+        value = int(duration * 1e6)
+        bucket = self.get_bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += duration
+
+        if self.min is None or duration < self.min:
+            self.min = duration
+
+        if self.max is None or duration > self.max:
+            self.max = duration
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+        self.count += other.count
+        self.total += other.total
+
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def get_mean(self):
+        if self.count == 0:
+            return 0.0
+
+        return self.total / self.count
+
+    def get_percentile(self, percentile):
+        """Return the duration in seconds below which the given percentage of
+        records fall."""
+        if self.count == 0:
+            return 0.0
+
+        threshold = self.count * percentile / 100
+        seen = 0
+
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return min(self.get_bucket_limit(bucket) / 1e6, self.max)
+
+        return self.max
+
+    def get_summary(self):
+        return {
+            'count': self.count,
+            'mean': self.get_mean(),
+            'min': self.min or 0.0,
+            'max': self.max or 0.0,
+            'p50': self.get_percentile(50),
+            'p90': self.get_percentile(90),
+            'p99': self.get_percentile(99),
+            'p99.9': self.get_percentile(99.9),
+        }
+
+
+class MessageMetrics(object):
+    """Message counters and per-phase latencies of a message router.
+
+    Phases are the steps a message goes through, such as waiting for it,
+    deserializing it or choosing an action, while handling latencies are
+    kept per message type.
+    """
+    def __init__(self):
+        self.start_time = time.time()
+        self.message_counts = {}
+        self.phases = {}
+        self.message_types = {}
+
+    def count_message(self, msg_type):
+        self.message_counts[msg_type] = self.message_counts.get(msg_type, 0) + 1
+
+    def record(self, phase, duration):
+        if phase not in self.phases:
+            self.phases[phase] = LatencyHistogram()
+
+        self.phases[phase].record(duration)
+
+    def record_message(self, msg_type, duration):
+        if msg_type not in self.message_types:
+            self.message_types[msg_type] = LatencyHistogram()
+
+        self.message_types[msg_type].record(duration)
+
+    @contextlib.contextmanager
+    def timing(self, phase):
+        start = time.time()
+        yield
+        self.record(phase, time.time() - start)
+
+    def merge(self, other):
+        self.start_time = min(self.start_time, other.start_time)
+
+        for msg_type, count in other.message_counts.items():
+            self.message_counts[msg_type] = (
+                self.message_counts.get(msg_type, 0) + count)
+
+        for histograms, other_histograms in [
+            (self.phases, other.phases),
+            (self.message_types, other.message_types)]:
+            for key, histogram in other_histograms.items():
+                if key not in histograms:
+                    histograms[key] = LatencyHistogram()
+                histograms[key].merge(histogram)
+
+    def get_summary(self):
+        return {
+            'uptime': time.time() - self.start_time,
+            'message_counts': dict(self.message_counts),
+            'phases': dict((phase, histogram.get_summary())
+                for phase, histogram in self.phases.items()),
+            'message_types': dict((msg_type, histogram.get_summary())
+                for msg_type, histogram in self.message_types.items()),
+        }
+
+    def format_report(self):
+        summary = self.get_summary()
+        lines = ['Uptime: %.1f s' % summary['uptime'], '', 'Messages:']
+
+        for msg_type, count in sorted(summary['message_counts'].items()):
+            lines.append('  %-24s %d' % (msg_type, count))
+
+        for title, histograms in [('Phases', summary['phases']),
+                                  ('Handling', summary['message_types'])]:
+            lines.append('')
+            lines.append('%-26s %8s %10s %10s %10s %10s %10s' % (
+                title + ' (ms):', 'count', 'mean', 'p50', 'p99', 'p99.9', 'max'))
+
+            for name, histogram in sorted(histograms.items()):
+                lines.append('  %-24s %8d %10.3f %10.3f %10.3f %10.3f %10.3f' % (
+                    name, histogram['count'], histogram['mean'] * 1e3,
+                    histogram['p50'] * 1e3, histogram['p99'] * 1e3,
+                    histogram['p99.9'] * 1e3, histogram['max'] * 1e3))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.format_report())
+
+
+class PeriodicReport(object):
+    """Rewrites a metrics report file at most once every interval seconds."""
+    def __init__(self, filename, interval=60):
+        self.filename = filename
+        self.interval = interval
+        self.last_time = time.time()
+
+    def update(self, get_metrics):
+        now = time.time()
+
+        if now - self.last_time >= self.interval:
+            get_metrics().dump(self.filename)
+            self.last_time = now
@@ -5,26 +5,29 @@ from simulator import graphicsDisplay
 from simulator import game
 
 import communication as comm
+import controller
 import messages
 import pickle
 import random
 import argparse
 import agents
+import multiprocessing
 import os
 
 NOISE = 0
 
 class CommunicatingAgent(game.Agent):
-    def __init__(self, agent_id, port):
+    def __init__(self, agent_id, client):
         super(CommunicatingAgent, self).__init__()
         self.agent_id = agent_id
-        self.client = comm.Client(port=port)
+        self.client = client
         self.previous_score = 0
         self.previous_action = 'Stop'
         self.invalid_action = False
         self.actions = []
         self.init = True
         self.test_mode = False
+        self.pipeline = None
 
     def enable_test_mode(self):
         self.test_mode = True
@@ -41,7 +44,10 @@ class CommunicatingAgent(game.Agent):
 
         return (pos[0] + ex, pos[1] + ey)
 
-    def create_state_message(self, state):
+    def create_state_message(self, state, legal_actions=None):
+        if legal_actions is None:
+            legal_actions = state.getLegalActions(self.agent_id)
+
         agent_positions = {}
         agent_positions[0] = state.getPacmanPosition()[::-1]
         for id_, pos in enumerate(state.getGhostPositions()):
@@ -80,7 +86,7 @@ class CommunicatingAgent(game.Agent):
             food_positions=food_positions,
             fragile_agents=fragile_agents,
             wall_positions=wall_positions,
-            legal_actions=state.getLegalActions(self.agent_id),
+            legal_actions=legal_actions,
             reward=reward,
             executed_action=self.previous_action,
             test_mode=self.test_mode)
@@ -109,25 +115,38 @@ class CommunicatingAgent(game.Agent):
         self.receive_message()
 
     def send_message(self, message):
-        self.client.send(pickle.dumps(message))
+        self.client.send_message(message)
 
     def receive_message(self):
-        return pickle.loads(self.client.recv())
+        return self.client.recv_message()
 
     def act_when_invalid(self, state):
         raise NotImplementedError
 
-    def getAction(self, state):
-        message = self.create_state_message(state)
-        self.send_message(message)
-
+    def receive_action_message(self):
         message = self.receive_message()
         while message.agent_id != self.agent_id:
             message = self.receive_message()
 
+        return message
+
+    def getAction(self, state):
+        legal_actions = state.getLegalActions(self.agent_id)
+
+        if self.pipeline is None or not self.pipeline.is_prefetched(self):
+            message = self.create_state_message(state, legal_actions)
+            self.send_message(message)
+
+        message = self.receive_action_message()
+
+        if self.pipeline is not None:
+            self.pipeline.record(self, legal_actions, message.action)
+            self.pipeline.prefetch(self, state)
+            self.pipeline.tick()
+
         self.previous_action = message.action
 
-        if message.action not in state.getLegalActions(self.agent_id):
+        if message.action not in legal_actions:
             self.invalid_action = True
             return self.act_when_invalid(state)
         else:
@@ -136,8 +155,8 @@ class CommunicatingAgent(game.Agent):
 
 
 class CommunicatingPacmanAgent(CommunicatingAgent):
-    def __init__(self, port):
-        super(CommunicatingPacmanAgent, self).__init__(0, port)
+    def __init__(self, client):
+        super(CommunicatingPacmanAgent, self).__init__(0, client)
         self.actions = ['North', 'South', 'East', 'West', 'Stop']
 
     def act_when_invalid(self, state):
@@ -148,8 +167,8 @@ class CommunicatingPacmanAgent(CommunicatingAgent):
 
 
 class CommunicatingGhostAgent(CommunicatingAgent):
-    def __init__(self, agent_id, port):
-        super(CommunicatingGhostAgent, self).__init__(agent_id, port)
+    def __init__(self, agent_id, client):
+        super(CommunicatingGhostAgent, self).__init__(agent_id, client)
         self.previous_action = 'North'
         self.actions = ['North', 'South', 'East', 'West']
 
@@ -160,6 +179,74 @@ class CommunicatingGhostAgent(CommunicatingAgent):
         return self.previous_score - current_score
 
 
+class ActionPipeline(object):
+    """Prefetches the actions of the agents about to move.
+
+    When an agent acts, state messages for up to max_staleness agents after
+    it are sent right away, built from the same state, so the controller
+    chooses their actions while the simulator applies the moves in between.
+    The staleness of an action is the number of moves applied between
+    building its state message and executing it.
+    """
+    def __init__(self, agents, max_staleness=1):
+        self.agents = agents
+        # An agent's own next request needs the action it is about to take
+        self.max_staleness = min(max_staleness, len(agents) - 1)
+        self.moves = 0
+        self.requests = {}
+        self.staleness = {}
+        self.stale_invalid_actions = 0
+
+        for agent in agents:
+            agent.pipeline = self
+
+    def is_prefetched(self, agent):
+        return agent.agent_id in self.requests
+
+    def prefetch(self, agent, state):
+        index = self.agents.index(agent)
+
+        for offset in range(1, self.max_staleness + 1):
+            next_agent = self.agents[(index + offset) % len(self.agents)]
+
+            if not self.is_prefetched(next_agent):
+                legal_actions = state.getLegalActions(next_agent.agent_id)
+                next_agent.send_message(
+                    next_agent.create_state_message(state, legal_actions))
+                self.requests[next_agent.agent_id] = (self.moves, legal_actions)
+
+    def record(self, agent, legal_actions, action):
+        """Record the staleness of an action, given the actions legal in the
+        state it is executed in."""
+        if self.is_prefetched(agent):
+            sent_at, stale_legal_actions = self.requests.pop(agent.agent_id)
+            staleness = self.moves - sent_at
+
+            if (action in stale_legal_actions and
+                action not in legal_actions):
+                self.stale_invalid_actions += 1
+        else:
+            staleness = 0
+
+        self.staleness[staleness] = self.staleness.get(staleness, 0) + 1
+
+    def tick(self):
+        self.moves += 1
+
+    def drain(self):
+        """Discard actions prefetched for moves that never happened."""
+        for agent in self.agents:
+            if self.is_prefetched(agent):
+                agent.receive_action_message()
+                del self.requests[agent.agent_id]
+
+    def get_stats(self):
+        return {
+            'staleness': dict(self.staleness),
+            'stale_invalid_actions': self.stale_invalid_actions,
+        }
+
+
 def create_layout(layout_file):
     layout = simulator_layout.getLayout(layout_file)
 
@@ -168,17 +255,27 @@ def create_layout(layout_file):
 
     return layout
 
-def create_pacman(agent_class, port):
-    agent = CommunicatingPacmanAgent(port=port)
+def create_client(transport, port, router=None):
+    if transport == comm.IN_PROCESS:
+        return comm.InProcessClient(router)
+    elif transport == comm.SHARED_MEMORY:
+        return comm.SharedMemoryClient(port=port)
+    elif transport == comm.TCP:
+        return comm.Client(port=port)
+    else:
+        raise ValueError, 'Transport must be either tcp, inprocess, or shm'
+
+def create_pacman(agent_class, client):
+    agent = CommunicatingPacmanAgent(client=client)
     agent.register_agent('pacman', agent_class)
     print 'Created Pacman\tID: %d\tClass: %s' % (agent.agent_id, agent_class.__name__)
     return agent
 
-def create_ghosts(num_ghosts, agent_class, port):
+def create_ghosts(agent_class, clients):
     agents = []
 
-    for i in range(num_ghosts):
-        agent = CommunicatingGhostAgent(i+1, port=port)
+    for i, client in enumerate(clients):
+        agent = CommunicatingGhostAgent(i+1, client=client)
         agent.register_agent('ghost', agent_class)
         print 'Created ghost\tID: %d\tClass: %s' % (agent.agent_id, agent_class.__name__)
         agents.append(agent)
@@ -201,6 +298,239 @@ def save_results(filename, results):
     with open(filename, 'w') as f:
         f.write(pickle.dumps(results))
 
+def create_agents(pacman_class, ghost_class, num_ghosts, transport, port,
+                  router=None):
+    pacman = create_pacman(pacman_class, create_client(transport, port, router))
+    ghosts = create_ghosts(ghost_class,
+        [create_client(transport, port, router) for _ in range(num_ghosts)])
+
+    learners = []
+
+    if pacman_class == agents.BehaviorLearningPacmanAgent:
+        learners.append(pacman)
+
+    if ghost_class == agents.BehaviorLearningGhostAgent:
+        learners.extend(ghosts)
+
+    return pacman, ghosts, learners
+
+def create_results(learners):
+    results = {
+        'learn_scores': [],
+        'test_scores': [],
+        'behavior_count': {}
+    }
+
+    for agent in learners:
+        results['behavior_count'][agent.agent_id] = {}
+
+    return results
+
+def get_agent_name(agent):
+    if agent.agent_id == 0:
+        return 'Pacman'
+    else:
+        return 'Ghost %d' % agent.agent_id
+
+def load_policies(agents_, policies):
+    print 'Loading policies to agents'
+    for agent in agents_:
+        if agent.agent_id in policies:
+            print 'Loading %s policy' % get_agent_name(agent)
+            agent.send_message(messages.PolicyMessage(
+                agent_id=agent.agent_id,
+                policy=policies[agent.agent_id]))
+            agent.receive_message()
+
+def request_policies(learners):
+    policies = {}
+
+    for agent in learners:
+        agent.send_message(messages.RequestPolicyMessage(agent.agent_id))
+        msg = agent.receive_message()
+        policies[agent.agent_id] = msg.policy
+
+    return policies
+
+def log_behavior_count(learners, results):
+    for agent in learners:
+        msg = messages.RequestBehaviorCountMessage(agent_id=agent.agent_id)
+        agent.send_message(msg)
+        behavior_count_msg = agent.receive_message()
+        print get_agent_name(agent), 'behavior count:', behavior_count_msg.count
+        for behavior, count in behavior_count_msg.count.items():
+            if behavior not in results['behavior_count'][agent.agent_id]:
+                results['behavior_count'][agent.agent_id][behavior] = []
+            results['behavior_count'][agent.agent_id][behavior].append(count)
+
+def play_games(layout, pacman, ghosts, learners, display, learn_games,
+               test_games, policies=None, pipeline=None, record=False,
+               first_game=0):
+    """Play learning games followed by test games, and return their scores
+    and behavior counts."""
+    results = create_results(learners)
+
+    for i in range(learn_games + test_games):
+        print '\nGame #%d' % (first_game + i + 1)
+
+        # Start new game
+        pacman.start_game(layout.width, layout.height)
+        for ghost in ghosts:
+            ghost.start_game(layout.width, layout.height)
+
+        if policies:
+            load_policies([pacman] + ghosts, policies)
+
+        if i >= learn_games:
+            pacman.enable_test_mode()
+
+            for ghost in ghosts:
+                ghost.enable_test_mode()
+
+        # Communicating agents only read states to build messages
+        games = pacman_simulator.runGames(layout, pacman, ghosts, display, 1,
+            record, trustAgents=True)
+
+        if pipeline:
+            pipeline.drain()
+
+        # Do this so as agents can receive the last reward
+        pacman.send_message(pacman.create_state_message(games[0].state))
+        pacman.receive_message()
+
+        for ghost in ghosts:
+            ghost.send_message(ghost.create_state_message(games[0].state))
+            ghost.receive_message()
+
+        log_behavior_count(learners, results)
+
+        # Log score
+        if i >= learn_games:
+            results['test_scores'].append(games[0].state.getScore())
+        else:
+            results['learn_scores'].append(games[0].state.getScore())
+
+    return results
+
+def run_in_process(job):
+    """Run the games of a job against its own in-process controller.
+
+    This is the work done by each process of the pool in parallel runs, so it
+    only takes and returns picklable values."""
+    global NOISE
+    NOISE = job['noise']
+    random.seed(job['seed'])
+
+    layout = create_layout(job['layout_file'])
+    router = controller.MessageRouter()
+    pacman, ghosts, learners = create_agents(job['pacman_class'],
+        job['ghost_class'], job['num_ghosts'], comm.IN_PROCESS, None, router)
+
+    if job['max_staleness'] > 0:
+        pipeline = ActionPipeline([pacman] + ghosts, job['max_staleness'])
+    else:
+        pipeline = None
+
+    pacman.init_agent()
+    for ghost in ghosts:
+        ghost.init_agent()
+
+    results = play_games(layout, pacman, ghosts, learners,
+        textDisplay.NullGraphics(), job['learn_games'], job['test_games'],
+        policies=job['policies'], pipeline=pipeline,
+        first_game=job['first_game'])
+
+    if pipeline:
+        results['pipeline'] = pipeline.get_stats()
+
+    return results
+
+def run_in_pool(jobs, num_processes):
+    pool = multiprocessing.Pool(min(num_processes, len(jobs)))
+
+    try:
+        return pool.map(run_in_process, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+def split_games(num_games, num_parts):
+    """Split a number of games into at most num_parts contiguous runs, given
+    as (first game, number of games) pairs."""
+    parts = []
+    first_game = 0
+
+    for i in range(num_parts):
+        size = num_games // num_parts + (1 if i < num_games % num_parts else 0)
+        if size > 0:
+            parts.append((first_game, size))
+        first_game += size
+
+    return parts
+
+def merge_pipeline_stats(stats, other):
+    if stats is None:
+        stats = {'staleness': {}, 'stale_invalid_actions': 0}
+
+    for staleness, count in other['staleness'].items():
+        stats['staleness'][staleness] = (
+            stats['staleness'].get(staleness, 0) + count)
+
+    stats['stale_invalid_actions'] += other['stale_invalid_actions']
+    return stats
+
+def append_results(results, other):
+    """Append the games of other results to results, in order."""
+    results['learn_scores'].extend(other['learn_scores'])
+    results['test_scores'].extend(other['test_scores'])
+
+    for agent_id, behavior_count in other['behavior_count'].items():
+        counts = results['behavior_count'].setdefault(agent_id, {})
+        for behavior, values in behavior_count.items():
+            counts.setdefault(behavior, []).extend(values)
+
+    if 'pipeline' in other:
+        results['pipeline'] = merge_pipeline_stats(results.get('pipeline'),
+                                                   other['pipeline'])
+
+def average_values(lists):
+    """Average lists of per-game values game by game, over the lists long
+    enough to have a value for each game."""
+    length = max([len(values) for values in lists] + [0])
+    averages = []
+
+    for i in range(length):
+        game_values = [values[i] for values in lists if i < len(values)]
+        averages.append(float(sum(game_values)) / len(game_values))
+
+    return averages
+
+def average_results(seed_results):
+    """Average the results of runs with different seeds game by game, keeping
+    each run's own results under 'seed_results'."""
+    results = create_results([])
+
+    for key in ['learn_scores', 'test_scores']:
+        results[key] = average_values([r[key] for r in seed_results])
+
+    for agent_id in seed_results[0]['behavior_count']:
+        behaviors = set()
+        for r in seed_results:
+            behaviors.update(r['behavior_count'][agent_id])
+
+        results['behavior_count'][agent_id] = dict(
+            (behavior, average_values([r['behavior_count'][agent_id].get(behavior, [])
+                                       for r in seed_results]))
+            for behavior in behaviors)
+
+    for r in seed_results:
+        if 'pipeline' in r:
+            results['pipeline'] = merge_pipeline_stats(results.get('pipeline'),
+                                                       r['pipeline'])
+
+    results['seed_results'] = seed_results
+    return results
+
 def main():
     parser = argparse.ArgumentParser(description='Run Pacman adapter system.')
     parser.add_argument('-l', '--learn-num', dest='learn', type=int, default=100,
@@ -225,10 +555,37 @@ def main():
                         help='introduce noise in position measurements')
     parser.add_argument('--port', dest='port', type=int, default=5555,
                         help='TCP port to connect to controller')
+    parser.add_argument('--transport', dest='transport', type=str,
+                        choices=comm.TRANSPORTS,
+                        help='channel to the controller: tcp (the default), shm '
+                        'for a shared memory ring buffer with a local '
+                        'controller, or inprocess to run the controller '
+                        'inside the simulator')
+    parser.add_argument('--max-staleness', dest='max_staleness', type=int,
+                        default=0, help='prefetch actions of up to this many '
+                        'upcoming agents, each built from a state that many '
+                        'moves old (0 waits for every action in turn)')
+    parser.add_argument('--parallel', dest='parallel', type=int, default=1,
+                        help='number of processes playing test games or '
+                        'seeds, each with its own in-process controller')
+    parser.add_argument('--seeds', dest='seeds', type=int, default=1,
+                        help='run this many independent seeds, learning '
+                        'from scratch in each with an in-process controller '
+                        'and no display, and average their results')
     parser.set_defaults(graphics=False)
 
     args = parser.parse_args()
 
+    if args.seeds > 1:
+        if args.graphics:
+            parser.error('--graphics cannot be used with --seeds, whose runs '
+                         'have no display')
+        if args.transport not in [None, comm.IN_PROCESS]:
+            parser.error('--transport %s cannot be used with --seeds, whose '
+                         'runs each have an in-process controller' % args.transport)
+    if args.transport is None:
+        args.transport = comm.TCP
+
     if args.experiment_number == 1:
         layout_file = 'simulator/layouts/classic1Ghost'
         num_ghosts = 1
@@ -281,130 +638,99 @@ def main():
     else:
         display_type = 'None'
 
-    layout = create_layout(layout_file)
-    map_width = layout.width
-    map_height = layout.height
-
     display = create_display(display_type=display_type)
 
-    results = {
-        'learn_scores': [],
-        'test_scores': [],
-        'behavior_count': {}
-    }
-
-    pacman = create_pacman(pacman_class, args.port)
-    ghosts = create_ghosts(num_ghosts, ghost_class, args.port)
-
-    if pacman_class == agents.BehaviorLearningPacmanAgent:
-        results['behavior_count'][pacman.agent_id] = {}
-
-    if ghost_class == agents.BehaviorLearningGhostAgent:
-        for ghost in ghosts:
-            results['behavior_count'][ghost.agent_id] = {}
-
     # Load policies from file
     if policy_filename and os.path.isfile(policy_filename):
         print 'Loading policies from file'
         with open(policy_filename) as f:
             policies = pickle.loads(f.read())
 
-    # Initialize agents
-    pacman.init_agent()
-    for ghost in ghosts:
-        ghost.init_agent()
-
-    for i in range(learn_games + test_games):
-        print '\nGame #%d' % (i+1)
-
-        # Start new game
-        pacman.start_game(map_width, map_height)
-        for ghost in ghosts:
-            ghost.start_game(map_width, map_height)
-
-        # Load policies to agents
-        if policy_filename and os.path.isfile(policy_filename):
-            print 'Loading policies to agents'
-            if pacman.agent_id in policies:
-                print 'Loading Pacman policy'
-                pacman.send_message(messages.PolicyMessage(
-                    agent_id=pacman.agent_id,
-                    policy=policies[pacman.agent_id]))
-                pacman.receive_message()
+    job = {
+        'layout_file': layout_file,
+        'num_ghosts': num_ghosts,
+        'pacman_class': pacman_class,
+        'ghost_class': ghost_class,
+        'noise': NOISE,
+        'max_staleness': args.max_staleness,
+        'policies': policies,
+    }
 
+    if args.seeds > 1:
+        # Independent seeds each learn and test from scratch in a process
+        jobs = []
+        for seed in range(args.seeds):
+            seed_job = dict(job, seed=seed, learn_games=learn_games,
+                            test_games=test_games, first_game=0)
+            jobs.append(seed_job)
 
-            for ghost in ghosts:
-                if ghost.agent_id in policies:
-                    print 'Loading ghost %d policy' % ghost.agent_id
-                    ghost.send_message(messages.PolicyMessage(
-                        agent_id=ghost.agent_id,
-                        policy=policies[ghost.agent_id]))
-                    ghost.receive_message()
+        results = average_results(run_in_pool(jobs, args.parallel))
 
-        if i >= learn_games:
-            pacman.enable_test_mode()
+        if policy_filename:
+            print 'Policies are not saved when running several seeds'
+    else:
+        layout = create_layout(layout_file)
 
-            for ghost in ghosts:
-                ghost.enable_test_mode()
+        # The in-process router replaces the separate controller process
+        if args.transport == comm.IN_PROCESS:
+            router = controller.MessageRouter()
+        else:
+            router = None
 
-        games = pacman_simulator.runGames(layout, pacman, ghosts, display, 1, record)
+        pacman, ghosts, learners = create_agents(pacman_class, ghost_class,
+            num_ghosts, args.transport, args.port, router)
 
-        # Do this so as agents can receive the last reward
-        pacman.send_message(pacman.create_state_message(games[0].state))
-        pacman.receive_message()
+        if args.max_staleness > 0:
+            pipeline = ActionPipeline([pacman] + ghosts, args.max_staleness)
+        else:
+            pipeline = None
 
+        # Initialize agents
+        pacman.init_agent()
         for ghost in ghosts:
-            ghost.send_message(ghost.create_state_message(games[0].state))
-            ghost.receive_message()
-
-        # Log behavior count
-        if pacman_class == agents.BehaviorLearningPacmanAgent:
-            msg = messages.RequestBehaviorCountMessage(agent_id=pacman.agent_id)
-            pacman.send_message(msg)
-            behavior_count_msg = pacman.receive_message()
-            print 'Pacman behavior count:', behavior_count_msg.count
-            for behavior, count in behavior_count_msg.count.items():
-                if behavior not in results['behavior_count'][pacman.agent_id]:
-                    results['behavior_count'][pacman.agent_id][behavior] = []
-                results['behavior_count'][pacman.agent_id][behavior].append(count)
-
-        if ghost_class == agents.BehaviorLearningGhostAgent:
-            for ghost in ghosts:
-                msg = messages.RequestBehaviorCountMessage(agent_id=ghost.agent_id)
-                ghost.send_message(msg)
-                behavior_count_msg = ghost.receive_message()
-                print 'Ghost', ghost.agent_id, 'behavior count:', behavior_count_msg.count
-                for behavior, count in behavior_count_msg.count.items():
-                    if behavior not in results['behavior_count'][ghost.agent_id]:
-                        results['behavior_count'][ghost.agent_id][behavior] = []
-                    results['behavior_count'][ghost.agent_id][behavior].append(count)
-
-        # Log score
-        if i >= learn_games:
-            results['test_scores'].append(games[0].state.getScore())
+            ghost.init_agent()
+
+        if args.parallel > 1 and test_games > 0:
+            results = play_games(layout, pacman, ghosts, learners, display,
+                learn_games, 0, policies=policies, pipeline=pipeline,
+                record=record)
+
+            # Test games never learn, so they can be spread across processes
+            # once the learned policies are frozen
+            frozen_policies = policies or request_policies(learners)
+            jobs = []
+            for first_game, num_games in split_games(test_games, args.parallel):
+                test_job = dict(job, seed=random.getrandbits(32),
+                                learn_games=0, test_games=num_games,
+                                first_game=learn_games + first_game,
+                                policies=frozen_policies)
+                jobs.append(test_job)
+
+            for test_results in run_in_pool(jobs, args.parallel):
+                append_results(results, test_results)
         else:
-            results['learn_scores'].append(games[0].state.getScore())
+            results = play_games(layout, pacman, ghosts, learners, display,
+                learn_games, test_games, policies=policies, pipeline=pipeline,
+                record=record)
 
-    # Save policies
-    if policy_filename:
-        if pacman_class == agents.BehaviorLearningPacmanAgent:
-            pacman.send_message(messages.RequestPolicyMessage(pacman.agent_id))
-            msg = pacman.receive_message()
-            policies[pacman.agent_id] = msg.policy
+        # Save policies
+        if policy_filename:
+            policies.update(request_policies(learners))
 
-        if ghost_class == agents.BehaviorLearningGhostAgent:
-            for ghost in ghosts:
-                ghost.send_message(messages.RequestPolicyMessage(ghost.agent_id))
-                msg = ghost.receive_message()
-                policies[ghost.agent_id] = msg.policy
+            with open(policy_filename, 'w') as f:
+                f.write(pickle.dumps(policies))
 
-        with open(policy_filename, 'w') as f:
-            f.write(pickle.dumps(policies))
+        if pipeline:
+            results['pipeline'] = merge_pipeline_stats(
+                results.get('pipeline'), pipeline.get_stats())
 
     # Save results
     print 'Learn scores:', results['learn_scores']
     print 'Test scores:', results['test_scores']
 
+    if 'pipeline' in results:
+        print 'Action staleness:', results['pipeline']['staleness']
+
     save_results(results_output_filename, results)
 
 if __name__ == '__main__':
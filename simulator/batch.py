@@ -0,0 +1,244 @@
+# batch.py
+# --------
+# Plays many games of classic Pacman on one layout in lockstep.  The games are
+# held as NumPy arrays, so every rule is applied to all of them at once.
+
+import numpy as np
+import pacman
+from game import Directions, Actions, Configuration, Grid
+from pacman import SCARED_TIME, COLLISION_TOLERANCE, TIME_PENALTY
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+STOP = ACTIONS.index(Directions.STOP)
+VECTORS = np.array([Actions.directionToVector(action) for action in ACTIONS])
+REVERSE = np.array([ACTIONS.index(Actions.reverseDirection(action)) for action in ACTIONS])
+
+class BatchGame:
+    """
+    A batch of games on the same layout, played in lockstep: every step moves
+    the same agent in all the games that are not over yet, following
+    PacmanRules and GhostRules.
+
+    The games are held as arrays whose first axis is the game: positions is
+    (games, agents, 2), directions and scaredTimers are (games, agents) with
+    directions given as indices into ACTIONS, food and capsules are
+    (games, width, height), and scores, win and lose are (games,).
+    """
+
+    def __init__( self, layout, numGames, numGhosts=None ):
+        if numGhosts == None: numGhosts = layout.getNumGhosts()
+        initialState = pacman.GameState()
+        initialState.initialize( layout, numGhosts )
+        agentStates = initialState.data.agentStates
+
+        self.layout = layout
+        self.numGames = numGames
+        self.numAgents = len( agentStates )
+        self.walls = np.array( layout.walls.data, dtype=bool )
+        self.startPositions = np.array( [s.start.getPosition() for s in agentStates], dtype=float )
+        self.startFood = np.array( initialState.data.food.data, dtype=bool )
+        self.startCapsules = np.zeros_like( self.startFood )
+        for x, y in initialState.data.capsules:
+            self.startCapsules[x, y] = True
+
+        shape = (numGames, self.numAgents)
+        self.positions = np.zeros( shape + (2,) )
+        self.directions = np.zeros( shape, dtype=int )
+        self.scaredTimers = np.zeros( shape, dtype=int )
+        self.food = np.zeros( (numGames,) + self.startFood.shape, dtype=bool )
+        self.capsules = np.zeros_like( self.food )
+        self.numFood = np.zeros( numGames, dtype=int )
+        self.scores = np.zeros( numGames )
+        self.win = np.zeros( numGames, dtype=bool )
+        self.lose = np.zeros( numGames, dtype=bool )
+        self.agentIndex = 0
+        self.reset()
+
+    def reset( self, games=None ):
+        """
+        Restarts the given games (a boolean mask or index array), or all of
+        them.  Since agents move in lockstep, a subset of the games can only
+        be restarted when Pacman is about to move.
+        """
+        if games is None:
+            games = np.arange( self.numGames )
+            self.agentIndex = 0
+        elif self.agentIndex != 0:
+            raise Exception('Games can only be restarted when Pacman is about to move')
+
+        self.positions[games] = self.startPositions
+        self.directions[games] = STOP
+        self.scaredTimers[games] = 0
+        self.food[games] = self.startFood
+        self.capsules[games] = self.startCapsules
+        self.numFood[games] = self.startFood.sum()
+        self.scores[games] = 0
+        self.win[games] = False
+        self.lose[games] = False
+
+    def isOver( self ):
+        return self.win | self.lose
+
+    def getLegalActions( self, agentIndex=None ):
+        """
+        Returns a (games, len(ACTIONS)) boolean mask of the legal actions of an
+        agent, by default the one about to move.  Games that are over have no
+        legal actions.
+        """
+        if agentIndex == None: agentIndex = self.agentIndex
+        x = self.positions[:, agentIndex, 0]
+        y = self.positions[:, agentIndex, 1]
+        xInt = np.floor( x + 0.5 ).astype( int )
+        yInt = np.floor( y + 0.5 ).astype( int )
+        nextX = xInt[:, None] + VECTORS[:, 0].astype( int )
+        nextY = yInt[:, None] + VECTORS[:, 1].astype( int )
+        legal = ~self.walls[nextX, nextY]
+
+        # In between grid points, all agents must continue straight
+        directions = self.directions[:, agentIndex]
+        offGrid = np.nonzero( np.abs( x - xInt ) + np.abs( y - yInt ) > Actions.TOLERANCE )[0]
+        legal[offGrid] = False
+        legal[offGrid, directions[offGrid]] = True
+
+        # Ghosts cannot stop, nor turn around unless they reach a dead end
+        if agentIndex > 0:
+            legal[:, STOP] = False
+            turning = np.nonzero( legal.sum( axis=1 ) > 1 )[0]
+            legal[turning, REVERSE[directions[turning]]] = False
+
+        legal[self.isOver()] = False
+        return legal
+
+    def sampleLegalActions( self, random=np.random ):
+        """
+        Picks a legal action uniformly at random in every game for the agent
+        about to move.
+        """
+        legal = self.getLegalActions()
+        return (random.random_sample( legal.shape ) * legal).argmax( axis=1 )
+
+    def step( self, actions ):
+        """
+        Moves the agent whose turn it is in every game that is not over, with
+        actions given as indices into ACTIONS, and passes the turn on.
+
+        Returns the observation of the new states, the reward of the move in
+        each game (its change in score) and which games are over.
+        """
+        scoreChange = self.advance( actions )
+        return self.observe(), scoreChange, self.isOver()
+
+    def advance( self, actions ):
+        """
+        Same as step, but only returns the rewards, sparing the copies of the
+        arrays that make up observations.
+        """
+        actions = np.asarray( actions, dtype=int )
+        agentIndex = self.agentIndex
+        games = np.nonzero( ~self.isOver() )[0]
+        actions = actions[games]
+        if not self.getLegalActions( agentIndex )[games, actions].all():
+            raise Exception("Illegal action in batch for agent " + str(agentIndex))
+
+        scoreChange = np.zeros( self.numGames )
+        if agentIndex == 0:
+            self._movePacman( games, actions, scoreChange )
+        else:
+            self._moveGhost( games, agentIndex, actions, scoreChange )
+        self.scores += scoreChange
+
+        self.agentIndex = (agentIndex + 1) % self.numAgents
+        return scoreChange
+
+    def _movePacman( self, games, actions, scoreChange ):
+        self.positions[games, 0] += VECTORS[actions]
+        moving = actions != STOP
+        self.directions[games[moving], 0] = actions[moving]
+
+        # Eat food
+        x, y = self.positions[games, 0].astype( int ).T
+        eating = self.food[games, x, y]
+        eaters = games[eating]
+        self.food[eaters, x[eating], y[eating]] = False
+        self.numFood[eaters] -= 1
+        scoreChange[eaters] += 10
+        winners = eaters[self.numFood[eaters] == 0]
+        scoreChange[winners] += 500
+        self.win[winners] = True
+
+        # Eat capsule, scaring every ghost
+        eating = self.capsules[games, x, y]
+        eaters = games[eating]
+        self.capsules[eaters, x[eating], y[eating]] = False
+        self.scaredTimers[eaters, 1:] = SCARED_TIME
+
+        scoreChange[games] -= TIME_PENALTY
+        for ghost in range( 1, self.numAgents ):
+            self._checkDeath( games, ghost, scoreChange )
+
+    def _moveGhost( self, games, ghost, actions, scoreChange ):
+        speed = np.where( self.scaredTimers[games, ghost] > 0, 0.5, 1.0 )
+        self.positions[games, ghost] += VECTORS[actions] * speed[:, None]
+        self.directions[games, ghost] = actions
+
+        # Time passes; ghosts snap back to the grid when they stop being scared
+        timers = self.scaredTimers[games, ghost]
+        snapping = games[timers == 1]
+        self.positions[snapping, ghost] = np.floor( self.positions[snapping, ghost] + 0.5 )
+        self.scaredTimers[games, ghost] = np.maximum( 0, timers - 1 )
+
+        self._checkDeath( games, ghost, scoreChange )
+
+    def _checkDeath( self, games, ghost, scoreChange ):
+        distances = np.abs( self.positions[games, ghost] - self.positions[games, 0] ).sum( axis=1 )
+        caught = games[distances <= COLLISION_TOLERANCE]
+        scared = self.scaredTimers[caught, ghost] > 0
+
+        eaten = caught[scared]
+        scoreChange[eaten] += 200
+        self.positions[eaten, ghost] = self.startPositions[ghost]
+        self.directions[eaten, ghost] = STOP
+        self.scaredTimers[eaten, ghost] = 0
+
+        killers = caught[~scared]
+        killers = killers[~self.win[killers]]
+        scoreChange[killers] -= 500
+        self.lose[killers] = True
+
+    def observe( self ):
+        """
+        Returns copies of the arrays describing the games, keyed by name.
+        """
+        return {
+            'agentIndex': self.agentIndex,
+            'positions': self.positions.copy(),
+            'directions': self.directions.copy(),
+            'scaredTimers': self.scaredTimers.copy(),
+            'food': self.food.copy(),
+            'capsules': self.capsules.copy(),
+            'scores': self.scores.copy(),
+            'win': self.win.copy(),
+            'lose': self.lose.copy(),
+        }
+
+    def getGameState( self, game ):
+        """
+        Builds the pacman.GameState of one game of the batch.
+        """
+        state = pacman.GameState()
+        state.initialize( self.layout, self.numAgents - 1 )
+        data = state.data
+        for index, agentState in enumerate( data.agentStates ):
+            x, y = self.positions[game, index]
+            if agentState.isPacman: x, y = int(x), int(y)
+            else: x, y = float(x), float(y)
+            agentState.configuration = Configuration( (x, y), ACTIONS[self.directions[game, index]] )
+            agentState.scaredTimer = int( self.scaredTimers[game, index] )
+        data.food = Grid( self.layout.width, self.layout.height )
+        for x, y in zip( *np.nonzero( self.food[game] ) ):
+            data.food[int(x)][int(y)] = True
+        data.capsules = [(x, y) for x, y in data.capsules if self.capsules[game, x, y]]
+        data.score = int( self.scores[game] )
+        data._win = bool( self.win[game] )
+        data._lose = bool( self.lose[game] )
+        return state
@@ -0,0 +1,211 @@
+# benchmark.py
+# ------------
+# Measures how fast game states generate their successors, the operation
+# search agents such as those in multiAgents.py spend most of their time in,
+# how much the timing modes of Game.run add to every move, and how deep the
+# search agents reach within a time budget per move: at a fixed depth, with
+# and without their transposition table, deepening their search, and
+# searching the root actions in parallel.
+#
+#   python benchmark.py
+#   python benchmark.py --moves 5000 --layouts classic1Ghost,medium2Ghosts
+#   python benchmark.py --games 0 --budget 0.5
+#   python benchmark.py --games 0 --budget 1 --workers 4 --layouts classic4Ghosts
+
+import random, time
+import layout, pacman, textDisplay, multiAgents
+from pacmanAgents import RandomAgent
+from ghostAgents import RandomGhost
+
+STOCK_LAYOUTS = ['classic1Ghost', 'classic2Ghosts', 'classic3Ghosts',
+                 'classic4Ghosts', 'medium1Ghosts', 'medium2Ghosts']
+
+def walk( state, numMoves, rand ):
+    """
+    Plays numMoves random moves from the state, generating every successor of
+    each visited state as a search would, and returns how many successors
+    were generated.  Finished games restart from the given state.
+    """
+    initialState = state
+    agentIndex = 0
+    count = 0
+    for i in range( numMoves ):
+        if state.isWin() or state.isLose():
+            state, agentIndex = initialState, 0
+        successors = [state.generateSuccessor( agentIndex, action )
+                      for action in state.getLegalActions( agentIndex )]
+        count += len( successors )
+        state = rand.choice( successors )
+        agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return count
+
+def benchmarkLayout( layoutName, numMoves, repeat ):
+    """
+    Returns the number of successors generated by a seeded random walk on a
+    layout, and the best time taken over repeat walks.
+    """
+    lay = layout.getLayout( layoutName )
+    if lay == None: raise Exception("The layout " + layoutName + " cannot be found")
+    state = pacman.GameState()
+    state.initialize( lay, lay.getNumGhosts() )
+
+    bestTime = None
+    for i in range( repeat ):
+        rand = random.Random( layoutName )
+        start = time.time()
+        count = walk( state, numMoves, rand )
+        elapsed = time.time() - start
+        if bestTime == None or elapsed < bestTime: bestTime = elapsed
+    return count, bestTime
+
+# (label, catchExceptions, timing) of the game loop modes
+GAME_MODES = [('untimed', False, 'signal'), ('signal', True, 'signal'), ('deadline', True, 'deadline')]
+
+def benchmarkGames( layoutName, numGames, catchExceptions, timing ):
+    """
+    Plays numGames seeded games between random agents and returns the number
+    of moves played and the time taken.
+    """
+    lay = layout.getLayout( layoutName )
+    rules = pacman.ClassicGameRules()
+    display = textDisplay.NullGraphics()
+    ghosts = [RandomGhost( i + 1 ) for i in range( lay.getNumGhosts() )]
+
+    random.seed( layoutName )
+    count = 0
+    start = time.time()
+    for i in range( numGames ):
+        game = rules.newGame( lay, RandomAgent(), ghosts, display, True, catchExceptions, True, timing )
+        game.run()
+        count += len( game.moveHistory )
+    return count, time.time() - start
+
+SEARCH_AGENTS = ['MinimaxAgent', 'AlphaBetaAgent', 'ExpectimaxAgent']
+
+def pacmanStates( state, numStates, rand ):
+    """
+    Returns the first numStates states of a random game where Pacman is
+    about to move.
+    """
+    states = []
+    agentIndex = 0
+    while len( states ) < numStates and not (state.isWin() or state.isLose()):
+        if agentIndex == 0: states.append( state )
+        state = state.generateSuccessor( agentIndex, rand.choice( state.getLegalActions( agentIndex ) ) )
+        agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return states
+
+def benchmarkSearch( layoutName, agentName, tableSize, budget, numStates, workers=0, maxDepth=12 ):
+    """
+    Returns the deepest depth at which an agent of multiAgents.py picks its
+    actions in the states of a seeded random game within budget seconds per
+    move on average, and the time it took per move at that depth.
+    """
+    lay = layout.getLayout( layoutName )
+    state = pacman.GameState()
+    state.initialize( lay, lay.getNumGhosts() )
+    states = pacmanStates( state, numStates, random.Random( layoutName ) )
+
+    reached, reachedTime = 0, 0.0
+    for depth in range( 1, maxDepth + 1 ):
+        agent = getattr( multiAgents, agentName )( depth=str( depth ), tableSize=str( tableSize ), workers=str( workers ) )
+        agent.registerInitialState( state )
+        start = time.time()
+        for s in states:
+            agent.getAction( s )
+        elapsed = (time.time() - start) / len( states )
+        agent.final( state )
+        if elapsed > budget: break
+        reached, reachedTime = depth, elapsed
+    return reached, reachedTime
+
+def benchmarkDeepening( layoutName, agentName, budget, numStates ):
+    """
+    Returns the average depth an agent of multiAgents.py completes within its
+    time budget in the states of a seeded random game, and the longest time
+    it took to pick an action.
+    """
+    lay = layout.getLayout( layoutName )
+    state = pacman.GameState()
+    state.initialize( lay, lay.getNumGhosts() )
+    states = pacmanStates( state, numStates, random.Random( layoutName ) )
+
+    agent = getattr( multiAgents, agentName )( timeBudget=str( budget ) )
+    agent.registerInitialState( state )
+    totalDepth, longest = 0, 0.0
+    for s in states:
+        start = time.time()
+        agent.getAction( s )
+        longest = max( longest, time.time() - start )
+        totalDepth += agent.completed_depth
+    return float( totalDepth ) / len( states ), longest
+
+def readCommand( argv ):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE:      python benchmark.py <options>')
+    parser.add_option('-l', '--layouts', dest='layouts',
+                      help=pacman.default('comma separated LAYOUTS to benchmark'),
+                      metavar='LAYOUTS', default=','.join(STOCK_LAYOUTS))
+    parser.add_option('-m', '--moves', dest='moves', type='int',
+                      help=pacman.default('random moves to play on each layout'), default=2000)
+    parser.add_option('-r', '--repeat', dest='repeat', type='int',
+                      help=pacman.default('times to walk each layout, keeping the best'), default=3)
+    parser.add_option('-g', '--games', dest='games', type='int',
+                      help=pacman.default('games to play on each layout in every timing mode'), default=20)
+    parser.add_option('-b', '--budget', dest='budget', type='float',
+                      help=pacman.default('seconds per move the search agents may take (0 to skip)'), default=0.2)
+    parser.add_option('-s', '--states', dest='states', type='int',
+                      help=pacman.default('states the search agents pick actions in on each layout'), default=10)
+    parser.add_option('-t', '--tableSize', dest='tableSize', type='int',
+                      help=pacman.default('slots in the transposition tables of the search agents'), default=65536)
+    parser.add_option('-w', '--workers', dest='workers', type='int',
+                      help=pacman.default('processes searching the root actions in parallel (compared if above 1)'), default=0)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    import sys
+    options = readCommand( sys.argv[1:] )
+
+    print '%-16s %12s %10s %14s' % ('Layout', 'Successors', 'Seconds', 'Successors/s')
+    totalCount, totalTime = 0, 0.0
+    for layoutName in options.layouts.split(','):
+        count, elapsed = benchmarkLayout( layoutName, options.moves, options.repeat )
+        totalCount += count
+        totalTime += elapsed
+        print '%-16s %12d %10.3f %14.0f' % (layoutName, count, elapsed, count / elapsed)
+    print '%-16s %12d %10.3f %14.0f' % ('Total', totalCount, totalTime, totalCount / totalTime)
+
+    if options.games > 0:
+        print
+        print '%-16s %12s %10s %14s' % ('Timing', 'Moves', 'Seconds', 'Moves/s')
+        for label, catchExceptions, timing in GAME_MODES:
+            totalCount, totalTime = 0, 0.0
+            for layoutName in options.layouts.split(','):
+                count, elapsed = benchmarkGames( layoutName, options.games, catchExceptions, timing )
+                totalCount += count
+                totalTime += elapsed
+            print '%-16s %12d %10.3f %14.0f' % (label, totalCount, totalTime, totalCount / totalTime)
+
+    if options.budget > 0:
+        print
+        print '%-16s %-16s %6s %10s %6s %10s %10s %10s' % ('Layout', 'Agent', 'Depth', 'Seconds', 'Table', 'Seconds', 'Deepening', 'Longest')
+        for layoutName in options.layouts.split(','):
+            for agentName in SEARCH_AGENTS:
+                row = [layoutName, agentName]
+                for tableSize in [0, options.tableSize]:
+                    row.extend( benchmarkSearch( layoutName, agentName, tableSize, options.budget, options.states ) )
+                row.extend( benchmarkDeepening( layoutName, agentName, options.budget, options.states ) )
+                print '%-16s %-16s %6d %10.3f %6d %10.3f %10.1f %10.3f' % tuple( row )
+
+    if options.budget > 0 and options.workers > 1:
+        print
+        print '%-16s %-16s %6s %10s %8s %10s' % ('Layout', 'Agent', 'Depth', 'Seconds', 'Parallel', 'Seconds')
+        for layoutName in options.layouts.split(','):
+            for agentName in SEARCH_AGENTS:
+                row = [layoutName, agentName]
+                for workers in [0, options.workers]:
+                    row.extend( benchmarkSearch( layoutName, agentName, options.tableSize, options.budget, options.states, workers ) )
+                print '%-16s %-16s %6d %10.3f %8d %10.3f' % tuple( row )
@@ -0,0 +1,100 @@
+# distances.py
+# ------------
+# Maze distances between the open cells of a layout, computed once per layout
+# and shared by every agent that evaluates states on it.
+#
+# Cells are numbered like the bits of a game.Grid, cell (x,y) being bit
+# x * height + y, so a food grid is already a bitboard of the cells holding
+# food.  Besides the distance from every open cell to every other, each cell
+# keeps the cells at distance d from it as the bitmask ring d, and the nearest
+# cell of any set is the first ring the set's mask meets.
+
+DISTANCES_CACHE = {}
+
+def getDistances( layout ):
+    """
+    Returns the MazeDistances of a layout, computing them the first time a
+    layout with its text is seen.
+    """
+    try:
+        return DISTANCES_CACHE[layout.visibilityKey]
+    except KeyError:
+        distances = DISTANCES_CACHE[layout.visibilityKey] = MazeDistances( layout )
+        return distances
+
+class MazeDistances:
+    """
+    All-pairs maze distances of a layout, found by a breadth first search
+    from every open cell.  Positions in between cells are rounded to the
+    nearest cell, and cells that cannot be reached have no distance (None).
+    """
+    def __init__( self, layout ):
+        self.width = layout.width
+        self.height = layout.height
+        height = self.height
+        neighbors = {}
+        for (x, y), moves in layout.legalNeighbors.items():
+            neighbors[x * height + y] = [nx * height + ny for direction, (nx, ny) in moves]
+
+        self.distances = {}
+        self.rings = {}
+        for source in neighbors:
+            distance = [None] * (self.width * height)
+            distance[source] = 0
+            rings = [1 << source]
+            frontier = [source]
+            while frontier:
+                mask = 0
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in neighbors[cell]:
+                        if distance[neighbor] is None:
+                            distance[neighbor] = len( rings )
+                            mask |= 1 << neighbor
+                            nextFrontier.append( neighbor )
+                if mask: rings.append( mask )
+                frontier = nextFrontier
+            self.distances[source] = distance
+            self.rings[source] = rings
+
+    def cell( self, position ):
+        x, y = position
+        return int( x + 0.5 ) * self.height + int( y + 0.5 )
+
+    def mask( self, positions ):
+        """
+        The bitmask of a list of positions, in the bit numbering of Grid.
+        """
+        mask = 0
+        for position in positions:
+            mask |= 1 << self.cell( position )
+        return mask
+
+    def distance( self, position1, position2 ):
+        return self.distances[self.cell( position1 )][self.cell( position2 )]
+
+    def nearestDistance( self, position, positions ):
+        """
+        The distance from position to the nearest of positions, or None if
+        none can be reached.
+        """
+        distance = self.distances[self.cell( position )]
+        reachable = [d for d in [distance[self.cell( p )] for p in positions] if d is not None]
+        return min( reachable ) if reachable else None
+
+    def nearestInMask( self, position, mask ):
+        """
+        The distance from position to the nearest cell of a bitmask, or None
+        if none can be reached.
+        """
+        if mask:
+            for d, ring in enumerate( self.rings[self.cell( position )] ):
+                if ring & mask: return d
+        return None
+
+    def nearestInGrid( self, position, grid ):
+        """
+        The distance from position to the nearest cell set in a Grid, such as
+        the food of a state, or None if none can be reached.
+        """
+        return self.nearestInMask( position, grid.bits )
@@ -67,14 +67,17 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+class Configuration(object):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are never modified once created, so their hash is cached.
     """
+    __slots__ = ('pos', 'direction', '_hash')
 
     def __init__(self, pos, direction):
         self.pos = pos
@@ -95,9 +98,13 @@ class Configuration:
         return (self.pos == other.pos and self.direction == other.direction)
 
     def __hash__(self):
-        x = hash(self.pos)
-        y = hash(self.direction)
-        return hash(x + 13 * y)
+        try:
+            return self._hash
+        except AttributeError:
+            x = hash(self.pos)
+            y = hash(self.direction)
+            self._hash = hash(x + 13 * y)
+            return self._hash
 
     def __str__(self):
         return "(x,y)="+str(self.pos)+", "+str(self.direction)
@@ -117,10 +124,11 @@ class Configuration:
             direction = self.direction # There is no stop direction
         return Configuration((x + dx, y+dy), direction)
 
-class AgentState:
+class AgentState(object):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -145,7 +153,9 @@ class AgentState:
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
     def copy( self ):
-        state = AgentState( self.start, self.isPacman )
+        state = AgentState.__new__( AgentState )
+        state.start = self.start
+        state.isPacman = self.isPacman
         state.configuration = self.configuration
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
@@ -159,71 +169,138 @@ class AgentState:
     def getDirection(self):
         return self.configuration.getDirection()
 
-class Grid:
+class Grid(object):
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans packed into the bits of an integer.  Data
+    is accessed via grid[x][y] where (x,y) are positions on a Pacman map with x
+    horizontal, y vertical and the origin (0,0) in the bottom left corner.
+
+    Cell (x,y) is bit x * height + y, so copying, comparing and hashing a grid
+    are single integer operations, and the number of set cells is cached.
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
-    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+    def __init__(self, width=0, height=0, initialValue=False, bitRepresentation=None):
         if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
         self.CELLS_PER_INT = 30
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        if initialValue:
+            self.bits = (1 << (width * height)) - 1
+            self._count = width * height
+        else:
+            self.bits = 0
+            self._count = 0
+        self._columns = [None] * width
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
     def __getitem__(self, i):
-        return self.data[i]
+        column = self._columns[i]
+        if column is None:
+            if i < 0: i += self.width
+            column = self._columns[i] = GridColumn(self, i)
+        return column
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        column = self[key]
+        for y, value in enumerate(item):
+            column[y] = value
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield self[x]
+
+    def get(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def set(self, x, y, value):
+        bit = 1 << (x * self.height + y)
+        if value:
+            if not self.bits & bit:
+                self.bits |= bit
+                self._count += 1
+        elif self.bits & bit:
+            self.bits ^= bit
+            self._count -= 1
+
+    def _getData(self):
+        return [[self.get(x, y) for y in range(self.height)] for x in range(self.width)]
+
+    def _setData(self, data):
+        self.bits = 0
+        self._count = 0
+        for x, column in enumerate(data):
+            for y, value in enumerate(column):
+                if value: self.set(x, y, True)
+
+    # List of lists view, kept for code written against the old representation
+    data = property(_getData, _setData)
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self.get(x, y))[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        return self.bits == other.bits and self.width == other.width and self.height == other.height
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        # Bits are numbered as the cells were summed in the list representation
+        return hash(self.bits)
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.bits = self.bits
+        g._count = self._count
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        # Integers are immutable, so a copy shares as much as a shallow copy did
+        return self.copy()
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __getstate__(self):
+        return {'width': self.width, 'height': self.height, 'bits': self.bits}
+
+    def __setstate__(self, state):
+        self.CELLS_PER_INT = 30
+        self.width = state['width']
+        self.height = state['height']
+        self._columns = [None] * self.width
+        if 'data' in state:
+            # Pickled before grids were packed into integers, as in old recordings
+            self.data = state['data']
+        else:
+            self.bits = state['bits']
+            self._count = bin(self.bits).count('1')
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        if item: return self._count
+        return self.width * self.height - self._count
 
     def asList(self, key = True):
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
         list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+        while bits:
+            lowest = bits & -bits
+            list.append( divmod(lowest.bit_length() - 1, self.height) )
+            bits ^= lowest
         return list
 
     def packBits(self):
@@ -274,6 +351,34 @@ class Grid:
                 bools.append(False)
         return bools
 
+class GridColumn(object):
+    """
+    Column x of a Grid, so that grid[x][y] reads and writes cell (x,y).
+    """
+    __slots__ = ('grid', 'x', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+        self.offset = x * grid.height
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        if y < 0: y += self.grid.height
+        if not 0 <= y < self.grid.height: raise IndexError('grid index out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0: y += self.grid.height
+        if not 0 <= y < self.grid.height: raise IndexError('grid index out of range')
+        self.grid.set(self.x, y, value)
+
+    def __iter__(self):
+        for y in range(self.grid.height):
+            yield self[y]
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -368,18 +473,29 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
-class GameStateData:
+class GameStateData(object):
     """
 
     """
+    __slots__ = ('food', 'capsules', 'agentStates', 'layout', 'score', 'scoreChange',
+                 '_eaten', '_foodEaten', '_foodAdded', '_capsuleEaten', '_agentMoved',
+                 '_lose', '_win', '_copiedAgentStates')
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        Food, capsules and agent states are shared with the predecessor until
+        they are modified: rules must copy the food grid and capsule list
+        before changing them, and get agent states to change through
+        getAgentStateForUpdate.
         """
+        # Bit i is set once agent state i belongs to this packet alone
+        self._copiedAgentStates = -1
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
+            self._copiedAgentStates = 0
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
@@ -395,13 +511,27 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state._copiedAgentStates = -1
+        # Layouts never change during a game, so copies can share them
+        state.layout = self.layout
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
         return state
 
+    def getAgentStateForUpdate( self, index ):
+        """
+        Returns the state of an agent so that it can be modified, copying it
+        first if it is still shared with the predecessor.
+        """
+        if not (self._copiedAgentStates >> index) & 1:
+            self.agentStates[index] = self.agentStates[index].copy()
+            self._copiedAgentStates |= 1 << index
+        return self.agentStates[index]
+
     def copyAgentStates( self, agentStates ):
         copiedStates = []
         for agentState in agentStates:
@@ -434,7 +564,8 @@ class GameStateData:
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
+        # Grids only hold booleans, so the characters go in a list of columns
+        map = [[None for y in range(height)] for x in range(width)]
         if type(self.food) == type((1,2)):
             self.food = reconstituteGrid(self.food)
         for x in range(width):
@@ -455,7 +586,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        out = [[map[x][y] for x in range(width)] for y in range(height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out]) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr( self, hasFood, hasWall ):
         if hasFood:
@@ -515,7 +648,7 @@ class Game:
     The Game manages the control flow, soliciting actions from agents.
     """
 
-    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False ):
+    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False, trustAgents=False, timing='signal' ):
         self.agentCrashed = False
         self.agents = agents
         self.display = display
@@ -524,12 +657,17 @@ class Game:
         self.gameOver = False
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
+        self.trustAgents = trustAgents
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
-        import cStringIO
-        self.agentOutput = [cStringIO.StringIO() for agent in agents]
+        if timing not in ['signal', 'deadline']: raise Exception('Unknown timing mode ' + str(timing))
+        self.timing = timing
+        self.timedAgent = None
+        if muteAgents:
+            import cStringIO
+            self.agentOutput = [cStringIO.StringIO() for agent in agents]
 
     def getProgress(self):
         if self.gameOver:
@@ -537,6 +675,26 @@ class Game:
         else:
             return self.rules.getProgress(self)
 
+    def _observe( self ):
+        """
+        Returns the state handed to agents.  Trusted agents promise not to
+        modify it, so they get the game's own state instead of a deep copy.
+        """
+        if self.trustAgents: return self.state
+        return self.state.deepCopy()
+
+    def _timed( self, agentIndex, function, timeout, elapsed=0 ):
+        """
+        Wraps an agent method so it raises TimeoutFunctionException when it
+        runs past timeout seconds, less the elapsed seconds of the move.  The
+        deadline mode relies on the watchdog thread of util instead of setting
+        up SIGALRM for every call.
+        """
+        self.timedAgent = agentIndex
+        if self.timing == 'deadline':
+            return DeadlineFunction(function, timeout - elapsed)
+        return TimeoutFunction(function, int(timeout) - int(elapsed))
+
     def _agentCrash( self, agentIndex, quiet=False):
         "Helper method for handling agent crashes"
         if not quiet: traceback.print_exc()
@@ -568,6 +726,23 @@ class Game:
         """
         Main control loop for game play.
         """
+        if not (self.catchExceptions and self.timing == 'deadline'):
+            return self._run()
+
+        WATCHDOG.start()
+        try:
+            self._run()
+        except KeyboardInterrupt:
+            if not WATCHDOG.expired: raise
+            # The watchdog fired just as a timed call returned
+            self.unmute()
+            print >>sys.stderr, "Agent %d timed out on a single move!" % self.timedAgent
+            self.agentTimeout = True
+            self._agentCrash(self.timedAgent, quiet=True)
+        finally:
+            WATCHDOG.stop()
+
+    def _run( self ):
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
@@ -587,10 +762,10 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = self._timed(i, agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
-                            timed_func(self.state.deepCopy())
+                            timed_func(self._observe())
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
@@ -604,12 +779,13 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    agent.registerInitialState(self._observe())
                 ## TODO: could this exceed the total time
                 self.unmute()
 
         agentIndex = self.startingIndex
         numAgents = len( self.agents )
+        observes = ['observationFunction' in dir( agent ) for agent in self.agents]
 
         while not self.gameOver:
             # Fetch the next agent
@@ -617,14 +793,14 @@ class Game:
             move_time = 0
             skip_action = False
             # Generate an observation of the state
-            if 'observationFunction' in dir( agent ):
+            if observes[agentIndex]:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = self._timed(agentIndex, agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = timed_func(self._observe())
                         except TimeoutFunctionException:
                             skip_action = True
                         move_time += time.time() - start_time
@@ -634,17 +810,17 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = agent.observationFunction(self._observe())
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self._observe()
 
             # Solicit an action
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = self._timed(agentIndex, agent.getAction, self.rules.getMoveTimeout(agentIndex), move_time)
                     try:
                         start_time = time.time()
                         if skip_action:
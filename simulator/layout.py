@@ -13,15 +13,22 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, Actions, Directions
+import hashlib
 import os
 import random
 
 VISIBILITY_MATRIX_CACHE = {}
+LAYOUT_CACHE = {}
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are never modified once built, so game states share them instead
+    of copying them, and getLayout hands out the same Layout for a file until
+    its contents change.  The legal neighbors and legal actions of every open
+    cell are computed up front.
     """
 
     def __init__(self, layoutText):
@@ -34,19 +41,116 @@ class Layout:
         self.numGhosts = 0
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.totalFood = self.food.count()
+        self.visibilityKey = ''.join(layoutText)
+        self.legalNeighbors = self.computeLegalNeighbors()
+        self.computeLegalActions()
         # self.initializeVisibilityMatrix()
 
+    def __setstate__(self, state):
+        """
+        Restores a pickled layout.  Layouts pickled in older recordings lack
+        the tables derived from the walls, so those are rebuilt.
+        """
+        self.__dict__.update(state)
+        if 'possibleActions' not in state:
+            self.visibilityKey = ''.join(self.layoutText)
+            self.legalNeighbors = self.computeLegalNeighbors()
+            self.computeLegalActions()
+
     def getNumGhosts(self):
         return self.numGhosts
 
+    def computeLegalNeighbors(self):
+        """
+        Maps every open cell to its (direction, position) moves, in the order
+        of Actions.getPossibleActions, leaving out walls and moves off the board.
+        """
+        neighbors = {}
+        for x in range(self.width):
+            for y in range(self.height):
+                if self.walls[x][y]: continue
+                moves = []
+                for direction, (dx, dy) in Actions._directionsAsList:
+                    nextx, nexty = x + dx, y + dy
+                    if not (0 <= nextx < self.width and 0 <= nexty < self.height): continue
+                    if not self.walls[nextx][nexty]: moves.append((direction, (nextx, nexty)))
+                neighbors[(x, y)] = moves
+        return neighbors
+
+    def computeLegalActions(self):
+        """
+        Builds the legal action tables: actionMasks maps every open cell to a
+        bitmask of its legal directions, bit i standing for the i-th direction
+        of Actions._directionsAsList, and possibleActions decodes it.
+        ghostActions maps a cell and the direction a ghost arrived in to the
+        actions GhostRules allows there.
+        """
+        directions = [direction for direction, vector in Actions._directionsAsList]
+        bits = dict([(direction, 1 << i) for i, direction in enumerate(directions)])
+        decode = lambda mask: tuple([d for d in directions if mask & bits[d]])
+
+        self.actionMasks = {}
+        self.possibleActions = {}
+        self.ghostActions = {}
+        for cell, moves in self.legalNeighbors.items():
+            mask = 0
+            for direction, pos in moves: mask |= bits[direction]
+            self.actionMasks[cell] = mask
+            self.possibleActions[cell] = decode(mask)
+
+            # Ghosts cannot stop, nor turn around unless they reach a dead end
+            ghostMask = mask & ~bits[Directions.STOP]
+            for direction in directions:
+                reverseBit = bits[Actions.reverseDirection(direction)]
+                if ghostMask & ~reverseBit:
+                    self.ghostActions[cell, direction] = decode(ghostMask & ~reverseBit)
+                else:
+                    self.ghostActions[cell, direction] = decode(ghostMask)
+
+    def getPossibleActions(self, config):
+        """
+        Same as Actions.getPossibleActions on the walls of the layout, read from
+        the precomputed tables.
+        """
+        x, y = config.pos
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+
+        # In between grid points, all agents must continue straight
+        if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
+            return [config.getDirection()]
+
+        return list(self.possibleActions[(x_int, y_int)])
+
+    def getGhostActions(self, config):
+        """
+        The legal actions of a ghost with the given configuration.
+        """
+        x, y = config.pos
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+
+        if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
+            return [d for d in [config.getDirection()] if d != Directions.STOP]
+
+        return list(self.ghostActions[(x_int, y_int), config.direction])
+
+    def getLegalNeighbors(self, position):
+        """
+        Same as Actions.getLegalNeighbors on the walls of the layout, read from
+        the precomputed table.
+        """
+        x, y = position
+        return [pos for direction, pos in self.legalNeighbors[(int(x + 0.5), int(y + 0.5))]]
+
     def initializeVisibilityMatrix(self):
         global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
+        if self.visibilityKey not in VISIBILITY_MATRIX_CACHE:
             from game import Directions
             vecs = [(-0.5,0), (0.5,0),(0,-0.5),(0,0.5)]
             dirs = [Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()})
+            # Grids only hold booleans, so the sets are kept in lists of columns
+            vis = [[dict([(direction, set()) for direction in dirs + [Directions.STOP]])
+                    for y in range(self.height)] for x in range(self.width)]
             for x in range(self.width):
                 for y in range(self.height):
                     if self.walls[x][y] == False:
@@ -55,11 +159,11 @@ class Layout:
                             nextx, nexty = x + dx, y + dy
                             while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)] :
                                 vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
+                                nextx, nexty = nextx + dx, nexty + dy
             self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
+            VISIBILITY_MATRIX_CACHE[self.visibilityKey] = vis
         else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
+            self.visibility = VISIBILITY_MATRIX_CACHE[self.visibilityKey]
 
     def isWall(self, pos):
         x, col = pos
@@ -90,7 +194,8 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts are never modified, so there is nothing to copy
+        return self
 
     def processLayoutText(self, layoutText):
         """
@@ -130,20 +235,24 @@ class Layout:
             self.numGhosts += 1
 def getLayout(name, back = 2):
     if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None: layout = tryToLoad(name)
+        names = ['layouts/' + name, name]
     else:
-        layout = tryToLoad('layouts/' + name + '.lay')
-        if layout == None: layout = tryToLoad(name + '.lay')
-    if layout == None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back -1)
-        os.chdir(curdir)
-    return layout
+        names = ['layouts/' + name + '.lay', name + '.lay']
+    # Look in the current directory, then up to back + 1 parent directories
+    directory = os.path.abspath('.')
+    for i in range(back + 2):
+        for fullname in names:
+            layout = tryToLoad(os.path.join(directory, fullname))
+            if layout != None: return layout
+        directory = os.path.dirname(directory)
+    return None
 
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: text = f.read()
     finally: f.close()
+    key = (os.path.abspath(fullname), hashlib.md5(text).hexdigest())
+    if key not in LAYOUT_CACHE:
+        LAYOUT_CACHE[key] = Layout([line.strip() for line in text.splitlines()])
+    return LAYOUT_CACHE[key]
@@ -15,8 +15,14 @@ from game import Actions
 from game import Agent
 import time
 from mypy import NPacmanMovesProblem, AStartMazeSearchProblem, GhostMovesProblem, NearestFoodProblem, search, round_tuple
-from mypy import grid_to_graph, invert_grid, make_edges, NearestCapsuleProblem
-from mypy import NearestWhiteGhostProblem, NearestColoredGhostProblem, nearest_distances
+from mypy import grid_to_graph, invert_grid, make_edges, maze_graph, NearestCapsuleProblem
+from mypy import NearestWhiteGhostProblem, NearestColoredGhostProblem, nearest_distances, GhostHorizons
+from transposition import ZobristHasher, TranspositionTable, EXACT, LOWER, UPPER
+import multiprocessing
+import numpy as np
+import recording
+import ghostAgents
+from distances import getDistances
 
 class ReflexAgent(Agent):
     """
@@ -78,13 +84,11 @@ class ReflexAgent(Agent):
         #print "newPos", newPos
         #print "newGhostStates", newGhostStates
         #print "newFood", newFood
-        ghost_distances = [manhattanDistance(ghostState.getPosition(), newPos) for ghostState in newGhostStates]
-        nearest_ghost_distance = min(ghost_distances)
+        distances = getDistances(successorGameState.data.layout)
+        nearest_ghost_distance = distances.nearestDistance(newPos, [ghostState.getPosition() for ghostState in newGhostStates]) or 0
         delta_score = successorGameState.getScore() - currentGameState.getScore() 
 
-        foods = newFood.asList()
-        food_distances = [manhattanDistance(food, newPos) for food in foods]
-        nearest_food_distance = min(food_distances) if food_distances else 0
+        nearest_food_distance = distances.nearestInGrid(newPos, newFood) or 0
 
 
         
@@ -101,6 +105,12 @@ def scoreEvaluationFunction(currentGameState):
     """
     return currentGameState.getScore()
 
+class SearchTimeout(Exception):
+    """
+        Raised when a search runs past the deadline of its agent.
+    """
+    pass
+
 class MultiAgentSearchAgent(Agent):
     """
         This class provides some common elements to all of your
@@ -114,12 +124,303 @@ class MultiAgentSearchAgent(Agent):
         Note: this is an abstract class: one that should not be instantiated.  It's
         only partially specified, and designed to be extended.  Agent (game.py)
         is another abstract class.
+
+        Subclasses define pacman_value and ghost_value, which expand a state
+        where Pacman or a ghost is about to move and return its value along
+        with the best action, if they know it.  States are searched through
+        value, which looks the results of those with table_depth plies or more
+        left up in a transposition table of tableSize slots shared by the
+        whole game (none if tableSize is 0).
+
+        Given a timeBudget in seconds, agents ignore depth and deepen their
+        search one move at a time until the budget is spent, playing the
+        action of the deepest search they completed.
+
+        Given more than one worker, the subtrees of Pacman's actions at the
+        root are searched in parallel by a pool of that many processes, each
+        with its own copy of the agent and table, kept until the next game.
     """
 
-    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2'):
+    # Whether the search narrows the alpha-beta window at the root
+    pruning = False
+
+    # The fewest plies left for a state to be hashed and looked up in the
+    # table: shallower subtrees take less time to search again than to hash,
+    # and their entries mostly give way to deeper ones before being found
+    table_depth = 2
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tableSize = '65536', timeBudget = '0', workers = '0'):
         self.index = 0 # Pacman is always agent index 0
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
+        self.hasher = ZobristHasher()
+        self.table = TranspositionTable(int(tableSize)) if int(tableSize) else None
+        self.timeBudget = float(timeBudget)
+        self.deadline = None
+        self.deepened = False
+        self.completed_depth = None
+        self.workers = int(workers)
+        self.pool = None
+        self.pool_layout = None
+        self.shared_alpha = None
+        self.root_alpha = None
+        self.alpha_read = float('-inf')
+
+    def registerInitialState(self, gameState):
+        # The walls are not hashed, so entries cannot outlive the game
+        if self.table is not None:
+            self.table.clear()
+        self.stop_workers()
+
+    def final(self, gameState):
+        self.stop_workers()
+
+    def stop_workers(self):
+        # Workers only outlive a move, not the game their tables hold
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+            self.pool_layout = None
+
+    def pacman_actions(self, state):
+        actions = state.getLegalActions(0)
+        if Directions.STOP in actions:
+            actions.remove(Directions.STOP)
+        return actions
+
+    def successors(self, state, agentIndex, key, actions=None):
+        """
+            Generates the (action, successor, successor key) triples of a
+            state, one at a time so that searches can stop early.
+        """
+        if actions is None:
+            actions = self.pacman_actions(state) if agentIndex == 0 else state.getLegalActions(agentIndex)
+        for action in actions:
+            successor = state.generateSuccessor(agentIndex, action)
+            if key is None:
+                yield action, successor, None
+            else:
+                yield action, successor, self.hasher.successorHash(state, key, agentIndex, successor)
+
+    def best_action(self, gameState):
+        """
+            Returns the action to play, searching to self.depth or for as long
+            as the time budget allows.
+        """
+        if self.timeBudget > 0:
+            return self.deepening_search(gameState)
+        return self.search(gameState, self.depth)
+
+    def deepening_search(self, gameState):
+        """
+            Searches gameState one move deeper at a time, each search trying
+            the actions in the order of the values the previous one found, and
+            returns the action of the deepest search completed within the time
+            budget.  Stops deepening once a search no longer reaches its depth
+            limit.
+        """
+        actions = self.pacman_actions(gameState)
+        action = actions[0] if actions else Directions.STOP
+        order = None
+        self.completed_depth = 0
+        self.deadline = util.monotonicTime() + self.timeBudget
+        self.deepened = True
+        try:
+            while self.deepened:
+                self.deepened = False
+                action = self.search(gameState, self.completed_depth + 1, order)
+                self.completed_depth += 1
+                order = [a for a, v in sorted(self.root_values, key=lambda (a, v): -v)]
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        return action
+
+    def search(self, gameState, depth, order=None):
+        """
+            Returns the best Pacman action from gameState, looking depth moves
+            of every agent ahead, and trying the actions in order (if given)
+            before the others.  The values found for the actions are left in
+            root_values.
+        """
+        key = None
+        if self.table is not None:
+            self.table.newSearch()
+            key = self.hasher.hashState(gameState, 0)
+        self.root_values = []
+        if gameState.isWin() or gameState.isLose() or not depth:
+            return Directions.STOP
+
+        actions = self.pacman_actions(gameState)
+        if order:
+            actions = [a for a in order if a in actions] + [a for a in actions if a not in order]
+        if not actions:
+            return Directions.STOP
+        if self.workers > 1 and len(actions) > 1:
+            best, bestAction = self.parallel_search(gameState, depth, actions)
+        else:
+            alpha = float('-inf')
+            best, bestAction = float('-inf'), None
+            for action, successor, successorKey in self.successors(gameState, 0, key, actions):
+                v = self.value(successor, 1, depth, successorKey, alpha, float('inf'))
+                self.root_values.append((action, v))
+                if bestAction is None or v > best:
+                    best, bestAction = v, action
+                if self.pruning:
+                    alpha = max(alpha, best)
+        if key is not None:
+            self.table.store(key, gameState.data.score, depth, best, EXACT, bestAction)
+        return bestAction
+
+    def parallel_search(self, gameState, depth, actions):
+        """
+            Searches the subtree of every action in the worker pool and
+            returns the best value and the first action, in the order given,
+            that reaches it, as a sequential search would.
+
+            The workers are given the layout when the pool starts, so a job
+            only holds the packed state.  Agents that prune share the best
+            value found so far with the workers, which raise alpha to it at
+            every state they search.  An action whose value is no better
+            than the highest bound its search read only got an upper bound,
+            so ties with the best value are searched again, here, before
+            being chosen.
+        """
+        layout = gameState.data.layout
+        if self.pool is not None and self.pool_layout is not layout:
+            self.stop_workers()
+        if self.pool is None:
+            # Only this process writes the value, so it needs no lock
+            self.shared_alpha = multiprocessing.Value('d', float('-inf'), lock=False)
+            self.pool_layout = layout
+            self.pool = multiprocessing.Pool(self.workers, init_search_worker,
+                                             (self, self.shared_alpha, layout, gameState.getNumAgents()))
+        self.shared_alpha.value = float('-inf')
+        job = (recording.packState(gameState), depth, self.deadline)
+        results = [None] * len(actions)
+        timedOut = False
+        for i, result in self.pool.imap_unordered(search_root_action, [(i, action) + job for i, action in enumerate(actions)]):
+            if result is None:
+                timedOut = True
+                continue
+            results[i] = result
+            v, bound, deepened = result
+            self.deepened = self.deepened or deepened
+            if v > bound and v > self.shared_alpha.value:
+                self.shared_alpha.value = v
+        if timedOut:
+            raise SearchTimeout()
+
+        best = max(v for v, bound, deepened in results if v > bound or bound == float('-inf'))
+        bestAction = None
+        for action, (v, bound, deepened) in zip(actions, results):
+            if bestAction is None and v == best:
+                if v <= bound and bound > float('-inf'):
+                    deepened = self.deepened
+                    v, bound, self.deepened = self.root_action_value(gameState, action, depth)
+                    self.deepened = self.deepened or deepened
+                if v == best:
+                    bestAction = action
+            self.root_values.append((action, v))
+        return best, bestAction
+
+    def root_action_value(self, gameState, action, depth, shared_alpha=None):
+        """
+            Searches the subtree of a root action on its own and returns its
+            value, the alpha bound it was searched with and whether the
+            search reached its depth limit.
+        """
+        key = None
+        if self.table is not None:
+            self.table.newSearch()
+            key = self.hasher.hashState(gameState, 0)
+        action, successor, key = self.successors(gameState, 0, key, [action]).next()
+        self.deepened = False
+        v = self.value(successor, 1, depth, key, float('-inf'), float('inf'))
+        return v, float('-inf'), self.deepened
+
+    def value(self, state, agentIndex, depths_remaining, key, alpha, beta):
+        """
+            Returns the value of a state with agentIndex about to move, or a
+            bound on it outside of the (alpha, beta) window.
+        """
+        if state.isWin() or state.isLose():
+            return self.evaluationFunction(state)
+        if agentIndex == 0 and not depths_remaining:
+            self.deepened = True
+            return self.evaluationFunction(state)
+
+        if self.root_alpha is not None:
+            # A better root action found by another worker raises the bound
+            # of every state in this subtree
+            shared = self.root_alpha.value
+            if shared > alpha:
+                alpha = shared
+            if shared > self.alpha_read:
+                self.alpha_read = shared
+
+        table = self.table
+        hint = None
+        if depths_remaining < self.table_depth:
+            table = key = None
+        if table is not None:
+            entry = table.lookup(key, state.data.score)
+            if entry is not None:
+                depth, v, bound, hint = entry
+                if depth >= depths_remaining and (bound == EXACT or (bound == LOWER and v >= beta) or
+                                                  (bound == UPPER and v <= alpha)):
+                    # The entry may come from a search that hit its limit
+                    self.deepened = True
+                    return v
+
+        if self.deadline is not None and util.monotonicTime() > self.deadline:
+            raise SearchTimeout()
+        if agentIndex == 0:
+            v, action = self.pacman_value(state, depths_remaining, key, alpha, beta, hint)
+        else:
+            v, action = self.ghost_value(state, agentIndex, depths_remaining, key, alpha, beta, hint)
+
+        if table is not None:
+            bound = LOWER if v >= beta else UPPER if v <= alpha else EXACT
+            table.store(key, state.data.score, depths_remaining, v, bound, action)
+        return v
+
+    def next_agent(self, state, agentIndex, depths_remaining):
+        """
+            Returns the agent moving after agentIndex and the depth left then.
+        """
+        if agentIndex == state.getNumAgents() - 1:
+            return 0, depths_remaining - 1
+        return agentIndex + 1, depths_remaining
+
+# Root-parallel search: the processes of an agent's pool each hold a copy of
+# the agent, made when the pool started, the value it shares with them and the
+# layout and number of agents of the game
+WORKER = {}
+
+def init_search_worker(agent, shared_alpha, layout, numAgents):
+    WORKER['agent'] = agent
+    WORKER['alpha'] = shared_alpha
+    WORKER['layout'] = layout
+    WORKER['numAgents'] = numAgents
+
+def search_root_action(job):
+    """
+        Searches the subtree of one root action in a worker process, and
+        returns its index along with the result, or None if the search ran
+        past its deadline.
+    """
+    i, action, packedState, depth, deadline = job
+    agent = WORKER['agent']
+    state = recording.unpackState(WORKER['layout'], WORKER['numAgents'], packedState)
+    agent.deadline = deadline
+    try:
+        return i, agent.root_action_value(state, action, depth, WORKER['alpha'])
+    except SearchTimeout:
+        return i, None
+    finally:
+        agent.deadline = None
 
 class MinimaxAgent(MultiAgentSearchAgent):
     """
@@ -146,135 +447,131 @@ class MinimaxAgent(MultiAgentSearchAgent):
             gameState.getNumAgents():
                 Returns the total number of agents in the game
         """
-        "*** YOUR CODE HERE ***"
-        
-        PACMAN = 0
-        FIRST_GHOST = 1
-        LAST_GHOST = gameState.getNumAgents() - 1
-
-        def max_terminal_test(state, depths_remaining, actions):
-            return state.isLose() or not depths_remaining
-
-        def min_terminal_test(state, depths_remaining):
-            return state.isWin() or state.isLose()
-
-        def initial_max_value(state, depths_remaining):
-            actions = state.getLegalActions(PACMAN)
-            if Directions.STOP in actions:
-                actions.remove(Directions.STOP)
-            if max_terminal_test(state, depths_remaining, actions):
-                return self.evaluationFunction(state)
-            successors = [(a, state.generateSuccessor(PACMAN, a)) for a in actions]
-            return max(successors, key= lambda successor: min_value(successor[1], FIRST_GHOST, depths_remaining))[0]
-
-        def max_value(state, depths_remaining):
-            actions = state.getLegalActions(PACMAN)
-            if Directions.STOP in actions:
-                actions.remove(Directions.STOP)
-            if max_terminal_test(state, depths_remaining, actions):
-                return self.evaluationFunction(state)
-            successors = [(a, state.generateSuccessor(PACMAN, a)) for a in actions]
-            return max(min_value(s, FIRST_GHOST, depths_remaining) for a, s in successors)
-        
-
-        def min_value(state, current_ghost, depths_remaining):
-            if min_terminal_test(state, depths_remaining):
-                return self.evaluationFunction(state)
-            actions = state.getLegalActions(current_ghost)
-            successors = [(a, state.generateSuccessor(current_ghost, a)) for a in actions]
+        return self.best_action(gameState)
 
-            if current_ghost == LAST_GHOST:
-                return min(max_value(s, depths_remaining - 1) for a, s in successors)
-            return min(min_value(s, current_ghost + 1, depths_remaining) for a, s in successors)
-        
+    def pacman_value(self, state, depths_remaining, key, alpha, beta, hint=None):
+        return max(self.value(s, 1, depths_remaining, k, alpha, beta)
+                   for a, s, k in self.successors(state, 0, key)), None
 
-        return initial_max_value(gameState, self.depth)
+    def ghost_value(self, state, current_ghost, depths_remaining, key, alpha, beta, hint=None):
+        next_agent, next_depth = self.next_agent(state, current_ghost, depths_remaining)
+        return min(self.value(s, next_agent, next_depth, k, alpha, beta)
+                   for a, s, k in self.successors(state, current_ghost, key)), None
 
 class AlphaBetaAgent(MultiAgentSearchAgent):
     """
         Your minimax agent with alpha-beta pruning (question 3)
+
+        Successors are only generated as they are searched, so that cutoffs
+        spare the rest, and the actions most likely to cause a cutoff are
+        searched first: the best action found by an earlier search of the
+        state, then the killer actions that last caused cutoffs at the same
+        depth, then the others by their history of cutoffs from the same
+        position.
     """
 
+    pruning = True
+
+    def __init__(self, *args, **kwargs):
+        MultiAgentSearchAgent.__init__(self, *args, **kwargs)
+        self.killers = {}
+        self.history = {}
+
     def getAction(self, gameState):
         """
             Returns the minimax action using self.depth and self.evaluationFunction
         """
-        "*** YOUR CODE HERE ***"
-        PACMAN = 0
-        FIRST_GHOST = 1
-        LAST_GHOST = gameState.getNumAgents() - 1
-
-        def max_terminal_test(state, depths_remaining, actions):
-            return state.isLose() or not depths_remaining
-
-        def min_terminal_test(state, depths_remaining):
-            return state.isWin() or state.isLose()
-
-
-        def initial_max_value(state, depths_remaining):
-            alfa = float('-inf')
-            beta = float('inf')
-            actions = state.getLegalActions(PACMAN)
-            if Directions.STOP in actions:
-                actions.remove(Directions.STOP)
-            if max_terminal_test(state, depths_remaining, actions):
-                return self.evaluationFunction(state)
-            successors = [(a, state.generateSuccessor(PACMAN, a)) for a in actions]
-            v = float('-inf')
-            current_a = None
-            for a, s in successors:
-                new_v = min_value(s, FIRST_GHOST, depths_remaining, alfa, beta)
-                if v < new_v:
-                    v = new_v
-                    current_a = a
-                if v >= beta:
-                    return current_a
-                alfa = max(alfa, v)
-            return current_a
-        
-            return max(successors, key= lambda successor: min_value(successor[1], FIRST_GHOST, depths_remaining, alfa, beta))[0]
-
-        def max_value(state, depths_remaining, alfa, beta):
-            actions = state.getLegalActions(PACMAN)
-            if Directions.STOP in actions:
-                actions.remove(Directions.STOP)
-            if max_terminal_test(state, depths_remaining, actions):
-                return self.evaluationFunction(state)
-            successors = [(a, state.generateSuccessor(PACMAN, a)) for a in actions]
-            v = float('-inf')
-            for a, s in successors:
-                v = max(v, min_value(s, FIRST_GHOST, depths_remaining, alfa, beta))
-                if v >= beta:
-                    return v
-                alfa = max(alfa, v)
-            return v
-        
+        self.age_heuristics()
+        return self.best_action(gameState)
 
-        def min_value(state, current_ghost, depths_remaining, alfa, beta):
-            if min_terminal_test(state, depths_remaining):
-                return self.evaluationFunction(state)
-            actions = state.getLegalActions(current_ghost)
-            successors = [(a, state.generateSuccessor(current_ghost, a)) for a in actions]
-
-            v = float('inf')
-            for a, s in successors:
-                if current_ghost == LAST_GHOST:
-                    v = min(v, max_value(s, depths_remaining - 1, alfa, beta))
-                else: 
-                    v = min(v, min_value(s, current_ghost + 1, depths_remaining, alfa, beta))
-                if v <= alfa:
-                    return v
-                beta = min(beta, v)  
-            return v     
-        #print max_value(gameState, self.depth, float('-inf'), float('inf'))
-        return initial_max_value(gameState, self.depth)
-        util.raiseNotDefined()
+    def age_heuristics(self):
+        """
+            Forgets the killer actions and halves the history of cutoffs, so
+            that the order follows the positions searched lately.
+        """
+        self.killers = {}
+        for move in self.history:
+            self.history[move] /= 2
+
+    def order_actions(self, state, agentIndex, depths_remaining, actions, hint=None):
+        if len(actions) < 2:
+            return actions
+        killers = self.killers.get((agentIndex, depths_remaining), ())
+        position = state.data.agentStates[agentIndex].configuration.pos
+        history = self.history
+        return sorted(actions, key=lambda a: (a != hint, a not in killers,
+                                              -history.get((agentIndex, position, a), 0)))
+
+    def record_cutoff(self, state, agentIndex, depths_remaining, action):
+        killers = self.killers.setdefault((agentIndex, depths_remaining), [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[2:]
+        move = (agentIndex, state.data.agentStates[agentIndex].configuration.pos, action)
+        self.history[move] = self.history.get(move, 0) + depths_remaining * depths_remaining
+
+    def root_action_value(self, gameState, action, depth, shared_alpha=None):
+        """
+            Searches the subtree of a root action, reading the best value of
+            the other root actions from shared_alpha, if given, in every
+            state searched.  Returns the value, the highest bound read and
+            whether the search reached its depth limit.
+        """
+        self.root_alpha = shared_alpha
+        self.alpha_read = float('-inf')
+        try:
+            v, bound, deepened = MultiAgentSearchAgent.root_action_value(self, gameState, action, depth)
+        finally:
+            self.root_alpha = None
+        return v, self.alpha_read, deepened
+
+    def pacman_value(self, state, depths_remaining, key, alfa, beta, hint=None):
+        actions = self.order_actions(state, 0, depths_remaining, self.pacman_actions(state), hint)
+        v, best = float('-inf'), None
+        for a, s, k in self.successors(state, 0, key, actions):
+            new_v = self.value(s, 1, depths_remaining, k, alfa, beta)
+            if best is None or new_v > v:
+                v, best = new_v, a
+            if v >= beta:
+                self.record_cutoff(state, 0, depths_remaining, a)
+                return v, a
+            alfa = max(alfa, v)
+        return v, best
+
+    def ghost_value(self, state, current_ghost, depths_remaining, key, alfa, beta, hint=None):
+        next_agent, next_depth = self.next_agent(state, current_ghost, depths_remaining)
+        actions = self.order_actions(state, current_ghost, depths_remaining,
+                                     state.getLegalActions(current_ghost), hint)
+        v, best = float('inf'), None
+        for a, s, k in self.successors(state, current_ghost, key, actions):
+            new_v = self.value(s, next_agent, next_depth, k, alfa, beta)
+            if best is None or new_v < v:
+                v, best = new_v, a
+            if v <= alfa:
+                self.record_cutoff(state, current_ghost, depths_remaining, a)
+                return v, a
+            beta = min(beta, v)
+        return v, best
 
 class ExpectimaxAgent(MultiAgentSearchAgent):
     """
         Your expectimax agent (question 4)
+
+        Ghosts are expected to move as the ghost class of ghostAgents named
+        by ghost would, RandomGhost by default.  With betterEvaluationFunction,
+        the leaves below the last ply of ghost moves are evaluated together
+        with NumPy, weighted by the chance of the ghosts making their moves.
     """
 
+    # The fewest combinations of ghost moves worth evaluating at once
+    batch_leaves = 8
+
+    def __init__(self, *args, **kwargs):
+        ghost = kwargs.pop('ghost', 'RandomGhost')
+        MultiAgentSearchAgent.__init__(self, *args, **kwargs)
+        self.ghost = getattr(ghostAgents, ghost)
+        self.ghost_models = {}
+
     def getAction(self, gameState):
         """
             Returns the expectimax action using self.depth and self.evaluationFunction
@@ -282,54 +579,80 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
             All ghosts should be modeled as choosing uniformly at random from their
             legal moves.
         """
-        "*** YOUR CODE HERE ***"
-        PACMAN = 0
-        FIRST_GHOST = 1
-        LAST_GHOST = gameState.getNumAgents() - 1
-
-        def max_terminal_test(state, depths_remaining, actions):
-            return state.isLose() or not depths_remaining
-
-        def min_terminal_test(state, depths_remaining):
-            return state.isWin() or state.isLose()
-
-        def initial_max_value(state, depths_remaining):
-            actions = state.getLegalActions(PACMAN)
-            if Directions.STOP in actions:
-                actions.remove(Directions.STOP)
-            if max_terminal_test(state, depths_remaining, actions):
-                return Directions.STOP
-                #self.evaluationFunction(state)
-            successors = [(a, state.generateSuccessor(PACMAN, a)) for a in actions]
-            return max(successors, key= lambda successor: min_value(successor[1], FIRST_GHOST, depths_remaining))[0]
-
-        def max_value(state, depths_remaining):
-            actions = state.getLegalActions(PACMAN)
-            if Directions.STOP in actions:
-                actions.remove(Directions.STOP)
-            if max_terminal_test(state, depths_remaining, actions):
-                return self.evaluationFunction(state)
-            successors = [(a, state.generateSuccessor(PACMAN, a)) for a in actions]
-            return max(min_value(s, FIRST_GHOST, depths_remaining) for a, s in successors)
-        
-
-        def min_value(state, current_ghost, depths_remaining):
-            if min_terminal_test(state, depths_remaining):
-                return self.evaluationFunction(state)
-            actions = state.getLegalActions(current_ghost)
-            successors = [(a, state.generateSuccessor(current_ghost, a)) for a in actions]
-
-            if current_ghost == LAST_GHOST:
-                expect_values = [max_value(s, depths_remaining - 1) for a, s in successors]
-            else:
-                expect_values = [min_value(s, current_ghost + 1, depths_remaining) for a, s in successors]
-            
-            return sum(expect_values)/len(expect_values)
-
-        
-
-        return initial_max_value(gameState, self.depth)
-        util.raiseNotDefined()
+        return self.best_action(gameState)
+
+    def pacman_value(self, state, depths_remaining, key, alpha, beta, hint=None):
+        return max(self.value(s, 1, depths_remaining, k, alpha, beta)
+                   for a, s, k in self.successors(state, 0, key)), None
+
+    def ghost_value(self, state, current_ghost, depths_remaining, key, alpha, beta, hint=None):
+        if (current_ghost == 1 and depths_remaining == 1 and self.evaluationFunction is betterEvaluationFunction and
+                self.combinations(state) >= self.batch_leaves):
+            return self.frontier_value(state), None
+        next_agent, next_depth = self.next_agent(state, current_ghost, depths_remaining)
+        if self.ghost is ghostAgents.RandomGhost:
+            expect_values = [self.value(s, next_agent, next_depth, k, alpha, beta)
+                             for a, s, k in self.successors(state, current_ghost, key)]
+            return sum(expect_values)/len(expect_values), None
+        distribution = self.ghost_distribution(state, current_ghost)
+        return sum(distribution[a] * self.value(s, next_agent, next_depth, k, alpha, beta)
+                   for a, s, k in self.successors(state, current_ghost, key)), None
+
+    def combinations(self, state):
+        combinations = 1
+        for ghost in range(1, state.getNumAgents()):
+            combinations *= len(state.getLegalActions(ghost))
+        return combinations
+
+    def ghost_distribution(self, state, ghost):
+        if ghost not in self.ghost_models:
+            self.ghost_models[ghost] = self.ghost(ghost)
+        return self.ghost_models[ghost].getDistribution(state)
+
+    def frontier_value(self, state):
+        """
+            Returns the expected value of a state where the first ghost moves
+            in the last ply, evaluating the leaves of every combination of
+            the ghosts' moves together.
+
+            Pacman stands still while the ghosts move, so the leaves share his
+            food and capsules, and a ghost's move only changes that ghost and
+            the score.  The outcomes of each ghost's moves are found once from
+            state and combined in arrays with an axis per ghost.  Once a ghost
+            has caught Pacman the ones after it keep their place, whatever
+            their move, which leaves the expected value as it is.
+        """
+        distances = getDistances(state.data.layout)
+        pos = state.getPacmanPosition()
+        pacman_distances = distances.distances[distances.cell(pos)]
+
+        def ghost_distance(s, ghost):
+            ghostState = s.getGhostState(ghost)
+            distance = pacman_distances[distances.cell(ghostState.getPosition())]
+            return np.inf if ghostState.scaredTimer or distance is None else distance
+
+        probabilities = np.ones(())
+        scores = np.full((), float(state.getScore()))
+        nearest_ghost = np.full((), np.inf)
+        lost = np.zeros((), dtype=bool)
+        for ghost in range(1, state.getNumAgents()):
+            distribution = self.ghost_distribution(state, ghost)
+            actions = state.getLegalActions(ghost)
+            successors = [state.generateSuccessor(ghost, a) for a in actions]
+            stays = lost[..., np.newaxis]
+            probabilities = probabilities[..., np.newaxis] * [distribution[a] for a in actions]
+            scores = scores[..., np.newaxis] + np.where(stays, 0, [s.getScore() - state.getScore() for s in successors])
+            nearest_ghost = np.minimum(nearest_ghost[..., np.newaxis],
+                                       np.where(stays, ghost_distance(state, ghost),
+                                                [ghost_distance(s, ghost) for s in successors]))
+            lost = stays | [s.isLose() for s in successors]
+
+        if not lost.all():
+            self.deepened = True
+        nearest_food = distances.nearestInGrid(pos, state.getFood()) or 0
+        nearest_capsule = distances.nearestDistance(pos, state.getCapsules()) or 0
+        values = betterEvaluationArrays(scores, nearest_food, nearest_capsule, nearest_ghost)
+        return float((probabilities * values).sum())
 
 def betterEvaluationFunction(currentGameState):
     """
@@ -347,20 +670,16 @@ def betterEvaluationFunction(currentGameState):
     ghostStates = currentGameState.getGhostStates()
     scaredTimes = [ghostState.scaredTimer for ghostState in ghostStates]
     #import ipdb; ipdb.set_trace()
+    distances = getDistances(currentGameState.data.layout)
     capsules = currentGameState.getCapsules()
-    capsule_distances = [manhattanDistance(capsule, pos) for capsule in capsules]
-    nearest_capsule_distance = min(capsule_distances) if capsule_distances else 0
+    nearest_capsule_distance = distances.nearestDistance(pos, capsules) or 0
 
-    ghost_distances = [manhattanDistance(ghostState.getPosition(), pos) for i, ghostState in enumerate(ghostStates) if not scaredTimes[i]]
-    nearest_ghost_distance = min(ghost_distances) if ghost_distances else 0
+    ghost_positions = [ghostState.getPosition() for i, ghostState in enumerate(ghostStates) if not scaredTimes[i]]
+    nearest_ghost_distance = distances.nearestDistance(pos, ghost_positions) or 0
     
-    white_ghost_distances = [manhattanDistance(ghostState.getPosition(), pos) for i, ghostState in enumerate(ghostStates) if scaredTimes[i]]
-    nearest_white_ghost_distance = min(ghost_distances) if ghost_distances else 0
     #delta_score = successorGameState.getScore() - currentGameState.getScore() 
 
-    foods = food.asList()
-    food_distances = [manhattanDistance(food, pos) for food in foods]
-    nearest_food_distance = min(food_distances) if food_distances else 0
+    nearest_food_distance = distances.nearestInGrid(pos, food) or 0
 
     #if currentGameState.getScore() < -300:
     #    import ipdb; ipdb.set_trace()
@@ -369,16 +688,37 @@ def betterEvaluationFunction(currentGameState):
     #import ipdb; ipdb.set_trace()
     #if 8 > nearest_ghost_distance:# and nearest_capsule_distance < 6:
     #   return currentGameState.getScore() - nearest_food_distance - 2*nearest_white_ghost_distance - 2*nearest_capsule_distance + nearest_ghost_distance + 20
-    nearest_food_distance = min(nearest_food_distance, nearest_capsule_distance)
     #for i, t in enumerate(scaredTimes):
     #    if t > ghost_distances[i]:
     #return currentGameState.getScore()  - nearest_food_distance + nearest_ghost_distance + 100#BONUS
     #print "aaaaaaaa"
-    return currentGameState.getScore() - nearest_food_distance - nearest_capsule_distance - 3*nearest_white_ghost_distance + nearest_ghost_distance
+    return betterEvaluationSum(currentGameState.getScore(), nearest_food_distance, nearest_capsule_distance, nearest_ghost_distance)
     
     util.raiseNotDefined()
 
 
+def betterEvaluationArrays(scores, nearest_food, nearest_capsule, nearest_ghost):
+    """
+        betterEvaluationFunction over NumPy arrays of states, given their
+        scores and the distances to the nearest food, capsule (0 if there are
+        none) and unscared ghost (infinite if there are none).
+    """
+    nearest_ghost_distance = np.where(np.isinf(nearest_ghost), 0, nearest_ghost)
+    return betterEvaluationSum(scores, nearest_food, nearest_capsule, nearest_ghost_distance, np.minimum)
+
+
+def betterEvaluationSum(score, nearest_food, nearest_capsule, nearest_ghost, minimum=min):
+    """
+        The weighted sum behind betterEvaluationFunction and
+        betterEvaluationArrays, with min or np.minimum as minimum.  The capsule
+        counts as the nearest food if it is nearer.  The term meant for the
+        nearest scared ghost has always measured the nearest unscared one, so
+        that ghost weighs -3 + 1.
+    """
+    nearest_food_distance = minimum(nearest_food, nearest_capsule)
+    return score - nearest_food_distance - nearest_capsule - 2*nearest_ghost
+
+
 # Abbreviation
 better = betterEvaluationFunction
 
@@ -389,10 +729,11 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
     """
 
     def __init__(self, *args, **kworgs):
-        MultiAgentSearchAgent.__init__(self, *args, **kworgs)
+        AlphaBetaAgent.__init__(self, *args, **kworgs)
         self.x = 0
         self.start = -1
         self.vertices = None
+        self.ghost_horizons = None
         self.last = []
         self.lastg = {}
         self.lastg[1] = []
@@ -431,10 +772,9 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
         capsules_count = len(state.getCapsules())
         capsules_count_previous = len(previous.getCapsules())
         
-        nearest_ghost_distance = search(
-            NearestColoredGhostProblem(pos, [], state)
-        )[0]
-        if nearest_ghost_distance != -1:
+        distances = getDistances(state.data.layout)
+        nearest_ghost_distance = distances.nearestDistance(pos, ghost_positions)
+        if nearest_ghost_distance is not None:
             score += nearest_ghost_distance
 
         if white_ghosts_previous > white_ghosts:
@@ -445,25 +785,19 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
 
         if white_ghosts:
             score += 150
-            nearest_white_ghost = search(
-                NearestWhiteGhostProblem(pos, ghost_positions+state.getCapsules(), state)
-            )[0]
-            if nearest_white_ghost != -1:
+            nearest_white_ghost = distances.nearestDistance(pos, [ghost.getPosition() for ghost in ghosts if ghost.scaredTimer])
+            if nearest_white_ghost is not None:
                 score -= 5*nearest_white_ghost
                 return score
 
         if capsules_count:
-            nearest_capsule_distance = search(
-                NearestCapsuleProblem(pos, ghost_positions, state)
-            )[0]
-            if nearest_capsule_distance != -1:
+            nearest_capsule_distance = distances.nearestDistance(pos, state.getCapsules())
+            if nearest_capsule_distance is not None:
                 score -= 5*nearest_capsule_distance
                 return score
 
-        nearest_food = search(
-            NearestFoodProblem(pos, ghost_positions, state)
-        )[0]
-        if nearest_food != -1:
+        nearest_food = distances.nearestInGrid(pos, state.getFood())
+        if nearest_food is not None:
             score -= 5*nearest_food
             return score
         else:
@@ -471,17 +805,22 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
             return score
 
 
+    def horizons(self, n):
+        """
+            The GhostHorizons the agent keeps from move to move for its trap
+            checks n moves deep.
+        """
+        if self.ghost_horizons is None or self.ghost_horizons.n != n:
+            self.ghost_horizons = GhostHorizons(n)
+        return self.ghost_horizons
+
     def is_trapped(self, state, depths_remaining, pacman_actions, n):
         if depths_remaining <= 0:
             return False
         if not pacman_actions:
             return False
 
-        colored_ghost_positions = [round_tuple(ghost.getPosition()) for ghost in state.getGhostStates() if not ghost.scaredTimer]
-        blocks = {}
-        for i in range(n):
-            blocks[i] = colored_ghost_positions
-        trapped = search(NPacmanMovesProblem(state, n, blocks))
+        trapped = self.horizons(n).trapped(state)
         if trapped or state.isLose():
             return True
 
@@ -491,11 +830,7 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
         return self.min_is_trapped(successor, 1, depths_remaining, pacman_actions[1:], n)
     
     def min_is_trapped(self, state, current_ghost, depths_remaining, pacman_actions, n):
-        colored_ghost_positions = [round_tuple(ghost.getPosition())  for ghost in state.getGhostStates() if not ghost.scaredTimer]
-        blocks = {}
-        for i in range(n):
-            blocks[i] = colored_ghost_positions
-        trapped = search(NPacmanMovesProblem(state, n, blocks))
+        trapped = self.horizons(n).trapped(state)
 
         if state.isWin():
             return False
@@ -588,15 +923,16 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
             return self.evaluationFunction(state, previous)
         
         actions = self.update_actions_pacman_near_capsule(state, actions)
-        successors = [(a, state.generateSuccessor(self.PACMAN, a)) for a in actions]
         if (all(manhattanDistance(state.getPacmanPosition(), ghost.getPosition()) > depths_remaining for ghost in state.getGhostStates() if not ghost.scaredTimer)):
             return 7000
 
         
         v = float('-inf')
-        for a, s in successors:
+        for a in self.order_actions(state, self.PACMAN, depths_remaining, actions):
+            s = state.generateSuccessor(self.PACMAN, a)
             v = max(v, self.min_value(s, self.FIRST_GHOST, depths_remaining, alfa, beta, state))
             if v >= beta:
+                self.record_cutoff(state, self.PACMAN, depths_remaining, a)
                 return v
             alfa = max(alfa, v)
         return v
@@ -621,15 +957,15 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
         #if len(actions) >= 3:
         #    depths_remaining = max(0, min(6, depths_remaining - 4))
 
-        successors = [(a, state.generateSuccessor(current_ghost, a)) for a in actions]
-
         v = float('inf')
-        for a, s in successors:
+        for a in self.order_actions(state, current_ghost, depths_remaining, actions):
+            s = state.generateSuccessor(current_ghost, a)
             if current_ghost == self.LAST_GHOST:
                 v = min(v, self.max_value(s, depths_remaining - 1, alfa, beta, previous))
             else: 
                 v = min(v, self.min_value(s, current_ghost + 1, depths_remaining, alfa, beta, previous))
             if v <= alfa:
+                self.record_cutoff(state, current_ghost, depths_remaining, a)
                 return v
             beta = min(beta, v)  
         return v     
@@ -645,9 +981,7 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
         """
 
         if not self.vertices:
-            walls = gameState.getWalls()
-            self.paths_list, self.vertices, fat_paths = grid_to_graph(gameState, invert_grid(walls))
-            self.groups, self.paths, self.vertex_paths, self.edges = make_edges(gameState, self.paths_list, self.vertices)
+            self.paths_list, self.vertices, self.groups, self.paths, self.vertex_paths, self.edges = maze_graph(gameState)
             self.PACMAN = 0
             self.FIRST_GHOST = 1
             self.LAST_GHOST = gameState.getNumAgents() - 1
@@ -700,6 +1034,7 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
         #print time_per_action, self.actions, self.TIMEOUT
 
         #if time_per_action < self.TIMEOUT:
+        self.age_heuristics()
         alis = self.initial_max_value(gameState, self.depth)
         actions = [x[0] for x in alis]
         #if gameState.generateSuccessor(0, action).isLose():
@@ -712,7 +1047,7 @@ class ContestAgent(AlphaBetaAgent):#MultiAgentSearchAgent):
         n = 1
         check_actions = 3
         ghost_moves = 1
-        ghosts = [search(GhostMovesProblem(round_tuple(ghost.getPosition()),ghost.scaredTimer, gameState, n)) for ghost in gameState.getGhostStates()]
+        self.horizons(n).update(gameState)
         # remove blocks later
         #blocks = {}
         #for i in range(n):
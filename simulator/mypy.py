@@ -1,6 +1,8 @@
-from util import Stack, Queue, PriorityQueue
+import heapq
+from collections import deque
 from game import Actions
 from game import Directions
+from game import Grid
 from copy import copy, deepcopy
 from game import reconstituteGrid
 from operator import sub
@@ -59,351 +61,303 @@ class Problem(object):
     def fail_value(self):
         pass
 
+    def solve(self):
+        return search_nodes(self)
+
+
+GRAPH_CACHE = {}
+
+class GridGraph(object):
+    """
+    The open cells of a layout, numbered like the bits of a game.Grid (cell
+    (x, y) is x * height + y), and the (action, cell) moves out of each of
+    them, so the searches below work on integers and keep sets of cells,
+    visited, blocked or goals, as bitsets.  The open cells themselves are
+    the bitset open, and bitsets grow by a move at a time by dilation.
+    """
+
+    def __init__(self, layout):
+        self.height = layout.height
+        self.positions = [None] * (layout.width * layout.height)
+        self.moves = [()] * (layout.width * layout.height)
+        self.open = 0
+        for (x, y), moves in layout.legalNeighbors.items():
+            cell = x * self.height + y
+            self.positions[cell] = (x, y)
+            self.moves[cell] = tuple((action, nx * self.height + ny) for action, (nx, ny) in moves)
+            self.open |= 1 << cell
+
+        bottom = sum(1 << (x * self.height) for x in range(layout.width))
+        cells = (1 << (layout.width * layout.height)) - 1
+        self.below_top = cells & ~(bottom << (self.height - 1))
+        self.above_bottom = cells & ~bottom
+        self.horizons = {}
+
+    def step(self, mask):
+        """
+        The open cells next to the cells of a bitset.  Cells of the top and
+        bottom rows are not shifted into the next column.
+        """
+        height = self.height
+        return ((mask & self.below_top) << 1 | (mask & self.above_bottom) >> 1 |
+                mask << height | mask >> height) & self.open
+
+    def dilate(self, mask):
+        """
+        The cells of a bitset and the open cells next to them.
+        """
+        return mask & self.open | self.step(mask)
+
+    def horizon(self, cell, n):
+        """
+        The bitsets of the cells within 0, 1, ..., n - 1 moves of a cell,
+        kept for the next time they are asked for.
+        """
+        masks = self.horizons.setdefault(cell, [1 << cell])
+        while len(masks) < n:
+            masks.append(self.dilate(masks[-1]))
+        return masks[:n]
+
+    def cell(self, position):
+        x, y = round_tuple(position)
+        return x * self.height + y
+
+    def mask(self, positions):
+        mask = 0
+        for position in positions:
+            mask |= 1 << self.cell(position)
+        return mask
+
+def grid_graph(game_state):
+    layout = game_state.data.layout
+    try:
+        return GRAPH_CACHE[layout.visibilityKey]
+    except KeyError:
+        graph = GRAPH_CACHE[layout.visibilityKey] = GridGraph(layout)
+        return graph
+
+def bitset_reach(graph, start, n, blocked, goals):
+    """
+    Whether Pacman, moving from the cells of the bitset start, reaches a cell
+    of the goals bitset or a cell n moves away, where blocked[i] is the
+    bitset of the cells that cannot be entered on move i + 1.  The cells he
+    can be in after each move are kept as one bitset, so a move is a step of
+    it and a bitwise AND with the cells not blocked.  Only moves to another
+    cell count, so Pacman cannot wait out the n moves in place.
+    """
+    reach = start
+    for i in range(n):
+        if reach & goals:
+            return True
+        reach = graph.step(reach) & ~blocked[i]
+        if not reach:
+            return False
+    return True
+
+def breadth_first_reach(graph, start, n, scared_timer):
+    """
+    Maps every i < n to the positions a ghost starting at start can reach in
+    at most i moves while not scared.  A ghost scared for one more move
+    cannot catch anything before its first move, and one scared for longer
+    cannot catch anything at all.
+    """
+    positions = graph.positions
+    moves = graph.moves
+    reached = dict((i, []) for i in range(n))
+    visited = {True: 0, False: 0}
+    harmful = max(0, scared_timer - 1) == 0
+    queue = deque([(start, 0, scared_timer == 0)])
+    while queue:
+        cell, depth, hunting = queue.popleft()
+        bit = 1 << cell
+        if visited[hunting] & bit:
+            continue
+        visited[hunting] |= bit
+        if hunting:
+            for i in range(depth, n):
+                reached[i].append(positions[cell])
+        if depth + 1 < n:
+            for action, neighbor in moves[cell]:
+                queue.append((neighbor, depth + 1, harmful))
+    return reached
+
+def a_star(graph, start, goals, blocked, heuristic):
+    """
+    A* search from start to the nearest cell of the goals bitset, going
+    around the cells of the blocked bitset.  The heuristic is given the
+    position of a cell.  Returns the length and actions of the path found,
+    or (-1, [Directions.STOP]) if there is none.
+    """
+    positions = graph.positions
+    moves = graph.moves
+    heap = [(heuristic(positions[start]), 0, start, 0, None, None)]
+    count = 1
+    visited = 0
+    parents = {}
+    while heap:
+        priority, _, cell, cost, parent, action = heapq.heappop(heap)
+        bit = 1 << cell
+        if visited & bit:
+            continue
+        visited |= bit
+        parents[cell] = (parent, action)
+        if goals & bit:
+            path = []
+            while cell != start:
+                cell, action = parents[cell]
+                path.append(action)
+            path.reverse()
+            return (len(path), path)
+        closed = visited | blocked
+        for action, neighbor in moves[cell]:
+            if not (closed >> neighbor) & 1:
+                heapq.heappush(heap, (cost + 1 + heuristic(positions[neighbor]), count, neighbor, cost + 1, cell, action))
+                count += 1
+    return (-1, [Directions.STOP])
+
+
+class GhostHorizons(object):
+    """
+    For every ghost, the bitsets of the cells it can reach while not scared
+    within i moves, for every i < n, as GhostMovesProblem finds them, and
+    their union over the ghosts.  update follows the ghosts from tick to
+    tick, so only the sets of the ghosts that moved or whose scared timer
+    ran out are looked up again.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.graph = None
+        self.ghosts = {}
+        self.reach = {}
+        self.blocked = [0] * n
+
+    def update(self, game_state):
+        """
+        Follows the ghosts to game_state and returns blocked, the union of
+        their bitsets for every number of moves.
+        """
+        graph = grid_graph(game_state)
+        if graph is not self.graph:
+            self.graph = graph
+            self.ghosts = {}
+            self.reach = {}
+        changed = False
+        for index, ghost in enumerate(game_state.getGhostStates()):
+            ghost_key = (graph.cell(ghost.getPosition()), min(ghost.scaredTimer, 2))
+            if self.ghosts.get(index) != ghost_key:
+                self.ghosts[index] = ghost_key
+                self.reach[index] = self.ghost_reach(*ghost_key)
+                changed = True
+
+        if changed:
+            self.blocked = [0] * self.n
+            for masks in self.reach.values():
+                self.blocked = [blocked | mask for blocked, mask in zip(self.blocked, masks)]
+        return self.blocked
+
+    def ghost_reach(self, cell, scared_timer):
+        # Scared ghosts are harmless until their timer runs out, which takes
+        # them a move if it is 1
+        harmless = scared_timer if scared_timer < 2 else self.n
+        masks = self.graph.horizon(cell, self.n)
+        return [0] * min(harmless, self.n) + masks[harmless:]
+
+    def threatened(self, position, i):
+        """
+        Whether a ghost can be at a position within i moves.
+        """
+        return self.graph is not None and bool(self.blocked[i] >> self.graph.cell(position) & 1)
+
+    def trapped(self, game_state, position=None):
+        """
+        Follows the ghosts to game_state and tells whether Pacman, at his
+        position there or the one given, can neither reach a capsule nor
+        keep out of the ghosts' reach for n moves.
+        """
+        blocked = self.update(game_state)
+        graph = self.graph
+        position = position if position else game_state.getPacmanPosition()
+        capsules = graph.mask(game_state.getCapsules())
+        return not bitset_reach(graph, 1 << graph.cell(position), self.n, blocked, capsules)
 
-class NPacmanMovesProblem(Problem):
 
-    def __init__(self, game_state, n, blocks=None, position=None):
-        self.ds = Stack()
+class NPacmanMovesProblem(Problem):
+    """
+    Whether Pacman is trapped: he cannot reach a capsule, nor survive n moves,
+    when the cells of blocks[i] cannot be entered on move i + 1.  By default
+    those are the cells the ghosts can reach in i moves, which are taken
+    from horizons if given.
+    """
+
+    def __init__(self, game_state, n, blocks=None, position=None, horizons=None):
         self.game_state = game_state
         self.position = position if position else self.game_state.getPacmanPosition()
         self.n = n
-        ghosts = [search(GhostMovesProblem(round_tuple(ghost.getPosition()),ghost.scaredTimer, game_state, n)) for ghost in self.game_state.getGhostStates()]
+        self.blocks = blocks
         if blocks:
-            self.blocks = blocks
+            graph = grid_graph(game_state)
+            self.blocked = [graph.mask(blocks[i]) for i in range(n)]
         else:
-            self.blocks = {}
-            for i in range(n):
-                self.blocks[i] = []
-                for gn in ghosts:
-                    self.blocks[i].extend([round_tuple(t) for t in gn[i]])
-        #import ipdb; ipdb.set_trace()
-
-    def data_structure(self):
-        return self.ds
-
-    def push(self, value):
-        self.ds.push(value)
-
-    def pop(self):
-        return self.ds.pop()
-
-    def get_start_state(self):
-        foods = self.game_state.getFood()
-        return (self.position, 0, foods)
-
-    def start_value(self):
-        return (self.get_start_state(), None, 0, None)
-
-    def successor_value(self, current, successor):
-        return (successor[0], successor[1], current[2] + 1, self.explore(current))
-
-    def state(self, value):
-        return value[0]
-
-    def explore(self, value):
-        return value[0][0]
-
-    def parent(self, value):
-        return value[3]
-
-    def action(self, value):
-        return value[1]
-
-    def is_goal(self, value):
-        state = self.state(value)
-        return (state[1] == self.n) or (state[0] in self.game_state.getCapsules()) or (not state[2])
-
-    def goal_value(self, value, explored_nodes):
-        return False
-
-    def get_successors(self, value):
-        state = self.state(value)
-        config = Config(self.explore(value), Directions.STOP)
-        ghosts = self.blocks[state[1]]#[round_tuple(ghost.getPosition()) for ghost in self.game_state.getGhostStates() if ghost.scaredTimer <= 0]
-        walls_grid = deepcopy(self.game_state.getWalls())
-        walls = ghosts
-        for w in walls:
-            walls_grid[w[0]][w[1]] = True
-        #import ipdb; ipdb.set_trace()
-        #walls_grid = reconstituteGrid(walls)
-        #list_to_array(walls, walls_grid.width, walls_grid.height)
-        foods = self.game_state.getFood()
-
-        actions = Actions.getPossibleActions(config, walls_grid)
-        result = []
-        for action in actions:
-            new_state = []
-            position = Actions.getSuccessor(state[0], action)
-            fs = copy(foods)
-            if position in fs:
-                fs.remove(position)
-            result.append(((position, state[1] + 1, fs), action))
-        return result
+            self.blocked = (horizons or GhostHorizons(n)).update(game_state)
 
-    def fail_value(self):
-        return True
+    def solve(self):
+        graph = grid_graph(self.game_state)
+        capsules = graph.mask(self.game_state.getCapsules())
+        return not bitset_reach(graph, 1 << graph.cell(self.position), self.n, self.blocked, capsules)
 
 
 class GhostMovesProblem(Problem):
 
     def __init__(self, position, scaredTimer, game_state, n):
-        self.ds = Queue()
         self.position = position
         self.scaredTimer = scaredTimer
         self.game_state = game_state
         self.n = n
-        self.visited = {}
-        for i in range(n):
-            self.visited[i] = []
-    #
-    def data_structure(self):
-        return self.ds
-
-    #
-    def push(self, value):
-        self.ds.push(value)
-
-    #
-    def pop(self):
-        return self.ds.pop()
-
-    def get_start_state(self):
-        return (self.position, 0)
 
-    #
-    def start_value(self):
-        return (self.get_start_state(), None, 0, None, self.scaredTimer)
-
-    #
-    def successor_value(self, current, successor):
-        return (successor[0], successor[1], current[2] + 1, self.explore(current), max(0, self.scaredTimer - 1))
-
-    #
-    def explore(self, value):
-        return (value[0][0], value[4] == 0)
-
-    #
-    def visit(self, value):
-        e = self.explore(value)
-        if e[1]:
-            for i in range(value[2], self.n):
-                self.visited[i].append(e[0])
-
-    def state(self, value):
-        return value[0]
-        
-    #
-    def action(self, value):
-        return value[2] 
-
-    #
-    def is_goal(self, value):
-        state = self.state(value)
-        return (state[1] == self.n)
-
-    #
-    def goal_value(self, value, explored_nodes):
-        return self.visited
-
-    #
-    def get_successors(self, value):
-        state = self.state(value)
-        config = Config(state[0], Directions.STOP)
-        walls_grid = self.game_state.getWalls()
-        
-        actions = Actions.getPossibleActions(config, walls_grid)
-        result = []
-        for action in actions:
-            position = Actions.getSuccessor(state[0], action)
-            result.append(((position, state[1] - 1), action))
-        return result
-
-    #
-    def fail_value(self):
-        return self.visited
+    def solve(self):
+        graph = grid_graph(self.game_state)
+        return breadth_first_reach(graph, graph.cell(self.position), self.n, self.scaredTimer)
 
 class AStartMazeSearchProblem(Problem):
 
     def __init__(self, position, position2, blocks, game_state):
-        self.ds = PriorityQueue()
         self.position = round_tuple(position)
         self.position2 = round_tuple(position2)
         self.blocks = [round_tuple(t) for t in blocks]
         self.game_state = game_state
-        self.antecessor = {}
-
-    #
-    def data_structure(self):
-        return self.ds
-
-    #
-    def push(self, value):
-        self.ds.push(value, value[2] + self.heuristic(value))
 
-    def heuristic(self, value):
-        return abs(value[0][0] - self.position2[0]) + abs(value[0][1] - self.position2[1])
+    def heuristic(self, position):
+        return abs(position[0] - self.position2[0]) + abs(position[1] - self.position2[1])
 
-    #
-    def pop(self):
-        return self.ds.pop()
-
-    def get_start_state(self):
-        return self.position
-
-    #
-    def start_value(self):
-        return (self.get_start_state(), None, 0, None)
-
-    #
-    def successor_value(self, current, successor):
-        return (successor[0], successor[1], current[2] + 1, self.explore(current))
-
-    #
-    def explore(self, value):
-        return value[0]
-
-    #
-    def visit(self, value):
-        self.antecessor[value[0]] = value[3]
-
-    def state(self, value):
-        return value[0]
-        
-    #
-    def action(self, value):
-        return value[1] 
-
-    #
-    def is_goal(self, value):
-        state = self.state(value)
-        return (state == self.position2)
-
-    #
-    def goal_value(self, value, explored_nodes):
-        result = []
-        current = value[0]
-        while current != self.position:
-            direction = explored_nodes[current]
-            result.append(direction)
-            current = self.antecessor[current]
-        result.reverse()
-        return (len(result), result)
-
-    #
-    def get_successors(self, value):
-        state = self.state(value)
-        config = Config(self.explore(value), Directions.STOP)
-        walls_grid = deepcopy(self.game_state.getWalls())
-        walls = self.blocks
-        for w in walls:
-            walls_grid[w[0]][w[1]] = True
-
-        actions = Actions.getPossibleActions(config, walls_grid)
-        result = []
-        for action in actions:
-            position = Actions.getSuccessor(state, action)
-            result.append((position, action))
-        return result
-
-    #
-    def fail_value(self):
-        return (-1, [Directions.STOP])
+    def solve(self):
+        graph = grid_graph(self.game_state)
+        goal = 1 << graph.cell(self.position2)
+        return a_star(graph, graph.cell(self.position), goal, graph.mask(self.blocks), self.heuristic)
 
 class NearestProblem(Problem):
 
     def __init__(self, position, blocks, game_state, elements):
         self.elements = elements
-        self.ds = PriorityQueue()
         self.position = round_tuple(position)
         self.blocks = [round_tuple(t) for t in blocks]
         self.game_state = game_state
-        self.antecessor = {}
-
-    #
-    def data_structure(self):
-        return self.ds
-
-    #
-    def push(self, value):
-        self.ds.push(value, value[2] + self.heuristic(value))
 
-    def heuristic(self, value):
+    def heuristic(self, position):
         if not self.elements:
             return 0
-        return min(manhattan(value[0], element) for element in self.elements)
+        return min(manhattan(position, element) for element in self.elements)
 
-    #
-    def pop(self):
-        return self.ds.pop()
-
-    def get_start_state(self):
-        return self.position
-
-    #
-    def start_value(self):
-        return (self.get_start_state(), None, 0, None)
-
-    #
-    def successor_value(self, current, successor):
-        return (successor[0], successor[1], current[2] + 1, self.explore(current))
-
-    #
-    def explore(self, value):
-        return value[0]
-
-    #
-    def visit(self, value):
-        self.antecessor[value[0]] = value[3]
-
-    def state(self, value):
-        return value[0]
-        
-    #
-    def action(self, value):
-        return value[1] 
-
-    #
-    def is_goal(self, value):
-        state = self.state(value)
-        return (state in self.elements) or not self.elements
-
-    #
-    def goal_value(self, value, explored_nodes):
+    def solve(self):
         if not self.elements:
-            return self.fail_value()
-        result = []
-        current = value[0]
-        while current != self.position:
-            direction = explored_nodes[current]
-            result.append(direction)
-            current = self.antecessor[current]
-        result.reverse()
-        return (len(result), result)
-
-    #
-    def get_successors(self, value):
-        state = self.state(value)
-        config = Config(self.explore(value), Directions.STOP)
-        walls_grid = deepcopy(self.game_state.getWalls())
-        walls = self.blocks
-        for w in walls:
-            walls_grid[w[0]][w[1]] = True
-
-        actions = Actions.getPossibleActions(config, walls_grid)
-        result = []
-        for action in actions:
-            position = Actions.getSuccessor(state, action)
-            result.append((position, action))
-        return result
-
-    #
-    def fail_value(self):
-        return (-1, [Directions.STOP])
+            return (-1, [Directions.STOP])
+        graph = grid_graph(self.game_state)
+        return a_star(graph, graph.cell(self.position), graph.mask(self.elements), graph.mask(self.blocks), self.heuristic)
 
 class NearestFoodProblem(NearestProblem):
 
     def __init__(self, position, blocks, game_state):
-        NearestProblem.__init__(self, position, blocks, game_state, game_state.getFood())
+        NearestProblem.__init__(self, position, blocks, game_state, game_state.getFood().asList())
 
 
 class NearestCapsuleProblem(NearestProblem):
@@ -423,6 +377,9 @@ class NearestColoredGhostProblem(NearestProblem):
 
 
 def search(problem):
+    return problem.solve()
+
+def search_nodes(problem):
     problem.push(problem.start_value())
     explored_nodes = {}
     current = None
@@ -443,30 +400,68 @@ def near(x, y):
     nx, ny = map(sub, x, y)
     return (abs(nx) == 1 and ny == 0) or (abs(ny) == 1 and nx == 0)
 
+def neighbours(tile):
+    x, y = tile
+    return [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+
+def grid_array(grid):
+    import numpy as np
+    if isinstance(grid, Grid):
+        grid = grid.data
+    return np.array(grid, dtype=int)
+
 def apply_filter(filt, current, height, width, multiply=None):
-    if not multiply:
-        multiply = current
-    tiles = [[0 for y in xrange(height)] for x in xrange(width)]
-    for x in xrange(1, width - 1):
-        for y in xrange(1, height -1):
-            summ = 0
-            for j, dx in enumerate(xrange(-1, 2)):
-                for i, dy in enumerate(xrange(-1, 2)):
-                    cx = x + dx
-                    cy = y + dy
-                    summ += filt[j][i]*int(current[cx][cy])
-            tiles[x][y] = summ*int(multiply[x][y])
-    return tiles
+    """
+    Correlates the 3x3 filter with the width x height cells of current (a
+    Grid or a list of columns), times the cells of multiply.  Border cells
+    are left at 0.  Each filter weight adds a shifted slice of the cells.
+    """
+    current = grid_array(current)
+    multiply = current if multiply is None else grid_array(multiply)
+    tiles = grid_array([[0] * height] * width)
+    for j in xrange(3):
+        for i in xrange(3):
+            if filt[j][i]:
+                tiles[1:-1, 1:-1] += filt[j][i] * current[j:width - 2 + j, i:height - 2 + i]
+    tiles *= multiply
+    return tiles.tolist()
 
 def make_groups(tiles):
+    """
+    Groups adjacent tiles.  Each tile, in turn, is merged with the groups
+    next to it into a new group holding the tile and then those groups, in
+    the order they were made, so groups come out ordered by when they were
+    last merged.  The merges are kept in a union-find forest whose nodes are
+    the tiles, each the root of the group made when it was added.
+    """
+    node = {}
+    parent = []
+    merged = []
+    for k, tile in enumerate(tiles):
+        roots = set()
+        for neighbour in neighbours(tile):
+            if neighbour in node:
+                root = node[neighbour]
+                while parent[root] != root:
+                    parent[root] = parent[parent[root]]
+                    root = parent[root]
+                roots.add(root)
+        node[tile] = k
+        parent.append(k)
+        merged.append(sorted(roots))
+        for root in roots:
+            parent[root] = k
+
     groups = []
-    for tile in tiles:
-        group_append = [tile]
-        for group in copy(groups):
-            if any(near(f, tile) for f in group):
-                group_append += group
-                groups.remove(group)
-        groups.append(tuple(group_append))
+    for k in xrange(len(tiles)):
+        if parent[k] == k:
+            group = []
+            stack = [k]
+            while stack:
+                n = stack.pop()
+                group.append(tiles[n])
+                stack.extend(reversed(merged[n]))
+            groups.append(tuple(group))
     return groups
 
 def invert_grid(grid):
@@ -532,25 +527,26 @@ def make_edges(gameState, paths_list, vertices_list):
     #vertex -> [path index]
     vertex_paths = dict((vertex, []) for vertex in vertices_list)
 
-    for i, group in enumerate(groups):
-        for vertex in vertices_list:
-            if any(near(group_tile, vertex) for group_tile in group):
-                paths[i].append(vertex)
-                vertex_paths[vertex].append(i)
+    tile_paths = dict((tile, i) for i, group in enumerate(groups) for tile in group)
+    vertex_order = dict((vertex, k) for k, vertex in enumerate(vertices_list))
 
     for vertex in vertices_list:
-        for vert2 in vertices_list:
-            if near(vert2, vertex):
-                s1 = set(vertex_paths[vertex])
-                s2 = set(vertex_paths[vert2])
-                if not len(s1.intersection(s2)):
-                    groups.append(tuple())
-                    pos = len(groups) - 1
-                    paths[pos] = []
-                    paths[pos].append(vertex)
-                    paths[pos].append(vert2)
-                    vertex_paths[vertex].append(pos)
-                    vertex_paths[vert2].append(pos)
+        for i in sorted(set(tile_paths[tile] for tile in neighbours(vertex) if tile in tile_paths)):
+            paths[i].append(vertex)
+            vertex_paths[vertex].append(i)
+
+    for vertex in vertices_list:
+        for vert2 in sorted([tile for tile in neighbours(vertex) if tile in vertex_order], key=vertex_order.get):
+            s1 = set(vertex_paths[vertex])
+            s2 = set(vertex_paths[vert2])
+            if not len(s1.intersection(s2)):
+                groups.append(tuple())
+                pos = len(groups) - 1
+                paths[pos] = []
+                paths[pos].append(vertex)
+                paths[pos].append(vert2)
+                vertex_paths[vertex].append(pos)
+                vertex_paths[vert2].append(pos)
 
     height = gameState.getWalls().height
     width = gameState.getWalls().width
@@ -576,6 +572,24 @@ def make_edges(gameState, paths_list, vertices_list):
         
     return (groups, paths, vertex_paths, edges)
 
+MAZE_CACHE = {}
+
+def maze_graph(game_state):
+    """
+    The corridors and junctions of the layout of a state, as found by
+    grid_to_graph and make_edges on its open cells: (paths_list, vertices,
+    groups, paths, vertex_paths, edges).  They are computed once per layout
+    and shared, so they must not be modified.
+    """
+    layout = game_state.data.layout
+    try:
+        return MAZE_CACHE[layout.visibilityKey]
+    except KeyError:
+        paths_list, vertices, fat_paths = grid_to_graph(game_state, invert_grid(layout.walls))
+        groups, paths, vertex_paths, edges = make_edges(game_state, paths_list, vertices)
+        graph = MAZE_CACHE[layout.visibilityKey] = (paths_list, vertices, groups, paths, vertex_paths, edges)
+        return graph
+
 def nearest_distances(state):
     ghosts = state.getGhostStates()
     ghost_positions = [round_tuple(ghost.getPosition()) for ghost in ghosts if not ghost.scaredTimer]
@@ -0,0 +1,275 @@
+# recording.py
+# ------------
+# A compact binary trace format for recorded games, with seeking and fast
+# headless replay.
+#
+# A trace file is the magic string TRACE_MAGIC followed by records, each a
+# type character and a payload length (struct '<cI') before the payload.
+# Games are only ever appended:
+#
+#   'G'  a game starts: MD5 of the layout text, number of agents and the
+#        snapshot interval
+#   'A'  the next actions of the game, one byte per move holding the index of
+#        the action in ACTIONS; agents move in turn, starting with Pacman
+#   'S'  a snapshot of the state after a given number of moves
+#   'E'  the game ended: number of moves, final score and result flags
+#
+# Snapshots let getState seek to any move without replaying the game from
+# its start, and validateGames replays whole traces of games on one layout in
+# lockstep with the batch simulator.
+
+import hashlib, struct
+import pacman
+from game import Directions, Configuration, Grid
+
+TRACE_MAGIC = 'PACTRACE\x01'
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict([(action, chr(i)) for i, action in enumerate(ACTIONS)])
+
+RECORD_HEADER = struct.Struct('<cI')
+GAME_HEADER = struct.Struct('<16sBH')
+GAME_END = struct.Struct('<IiB')
+WIN, LOSE, CRASHED = 1, 2, 4
+
+def layoutHash( layout ):
+    return hashlib.md5( '\n'.join( layout.layoutText ) ).digest()
+
+def packState( state ):
+    """
+    Serializes what changes in a game state: scores, agents, food and capsules.
+    """
+    data = state.data
+    flags = (data._win and WIN) | (data._lose and LOSE)
+    parts = [struct.pack( '<iB', data.score, flags )]
+    for agentState in data.agentStates:
+        x, y = agentState.configuration.getPosition()
+        direction = ACTIONS.index( agentState.configuration.getDirection() )
+        parts.append( struct.pack( '<ddBH', x, y, direction, agentState.scaredTimer ) )
+    for positions in [data.food.asList(), data.capsules]:
+        parts.append( struct.pack( '<H', len( positions ) ) )
+        parts.extend( [struct.pack( '<BB', x, y ) for x, y in positions] )
+    return ''.join( parts )
+
+def unpackState( layout, numAgents, payload ):
+    state = pacman.GameState()
+    state.initialize( layout, numAgents - 1 )
+    data = state.data
+    data.score, flags = struct.unpack_from( '<iB', payload, 0 )
+    data._win, data._lose = bool( flags & WIN ), bool( flags & LOSE )
+    offset = 5
+    for agentState in data.agentStates:
+        x, y, direction, scaredTimer = struct.unpack_from( '<ddBH', payload, offset )
+        offset += 19
+        if agentState.isPacman: x, y = int( x ), int( y )
+        agentState.configuration = Configuration( (x, y), ACTIONS[direction] )
+        agentState.scaredTimer = scaredTimer
+    lists = []
+    for i in range( 2 ):
+        count, = struct.unpack_from( '<H', payload, offset )
+        offset += 2
+        lists.append( [struct.unpack_from( '<BB', payload, offset + 2 * j ) for j in range( count )] )
+        offset += 2 * count
+    food, capsules = lists
+    data.food = Grid( layout.width, layout.height )
+    for x, y in food: data.food[x][y] = True
+    data.capsules = capsules
+    return state
+
+class TraceWriter:
+    """
+    Appends recorded games to a trace file, snapshotting the state every
+    snapshotInterval moves (never if 0).
+    """
+    def __init__( self, filename, snapshotInterval=100 ):
+        self.file = open( filename, 'ab' )
+        self.snapshotInterval = snapshotInterval
+        if self.file.tell() == 0:
+            self.file.write( TRACE_MAGIC )
+
+    def _writeRecord( self, recordType, payload ):
+        self.file.write( RECORD_HEADER.pack( recordType, len( payload ) ) )
+        self.file.write( payload )
+
+    def writeGame( self, layout, game ):
+        """
+        Appends a finished game.Game played on layout.
+        """
+        numAgents = len( game.agents )
+        actions = []
+        for move, (agentIndex, action) in enumerate( game.moveHistory ):
+            if agentIndex != move % numAgents:
+                raise Exception('Agents must move in turn, starting with Pacman')
+            actions.append( ACTION_CODES[action] )
+        actions = ''.join( actions )
+
+        self._writeRecord( 'G', GAME_HEADER.pack( layoutHash( layout ), numAgents, self.snapshotInterval ) )
+        if self.snapshotInterval > 0:
+            # The game only keeps its final state, so snapshots are rebuilt
+            state = pacman.GameState()
+            state.initialize( layout, numAgents - 1 )
+            for start in range( 0, len( actions ), self.snapshotInterval ):
+                chunk = actions[start:start + self.snapshotInterval]
+                self._writeRecord( 'A', chunk )
+                for move in range( start, start + len( chunk ) ):
+                    state = state.generateSuccessor( move % numAgents, ACTIONS[ord( actions[move] )] )
+                if start + len( chunk ) < len( actions ):
+                    self._writeRecord( 'S', struct.pack( '<I', start + len( chunk ) ) + packState( state ) )
+        elif actions:
+            self._writeRecord( 'A', actions )
+
+        final = game.state.data
+        flags = (final._win and WIN) | (final._lose and LOSE) | (getattr( game, 'agentCrashed', False ) and CRASHED)
+        self._writeRecord( 'E', GAME_END.pack( len( actions ), final.score, flags ) )
+        self.file.flush()
+
+    def close( self ):
+        self.file.close()
+
+class RecordedGame:
+    """
+    A game read back from a trace file.  Moves are numbered from 0, and the
+    state after move m is the state after m + 1 actions.
+    """
+    def __init__( self, layoutHash, numAgents ):
+        self.layoutHash = layoutHash
+        self.numAgents = numAgents
+        self.chunks = []
+        self.snapshots = {}
+        self.actions = ''
+        self.score = None
+        self.win = self.lose = self.crashed = False
+
+    def isComplete( self ):
+        return self.score != None
+
+    def getNumMoves( self ):
+        return len( self.actions )
+
+    def getMove( self, move ):
+        """
+        Returns the (agentIndex, action) pair of a move.
+        """
+        return move % self.numAgents, ACTIONS[ord( self.actions[move] )]
+
+    def getMoves( self ):
+        return [self.getMove( move ) for move in range( len( self.actions ) )]
+
+    def checkLayout( self, layout ):
+        if layoutHash( layout ) != self.layoutHash:
+            raise Exception('The layout does not match the recorded game')
+
+    def getState( self, layout, numActions, useSnapshots=True ):
+        """
+        Returns the game state after the first numActions actions, starting
+        from the closest snapshot unless useSnapshots is False.
+        """
+        self.checkLayout( layout )
+        if not 0 <= numActions <= len( self.actions ):
+            raise IndexError('The game has no move ' + str( numActions ))
+        taken = [count for count in self.snapshots if count <= numActions and useSnapshots]
+        if taken:
+            start = max( taken )
+            state = unpackState( layout, self.numAgents, self.snapshots[start] )
+        else:
+            start = 0
+            state = pacman.GameState()
+            state.initialize( layout, self.numAgents - 1 )
+        for move in range( start, numActions ):
+            state = state.generateSuccessor( *self.getMove( move ) )
+        return state
+
+    def validate( self, layout ):
+        """
+        Replays the game from its start and checks it passes through its
+        snapshots and ends as recorded.
+        """
+        state = self.getState( layout, 0 )
+        for move in range( len( self.actions ) ):
+            if move in self.snapshots and packState( state ) != self.snapshots[move]:
+                return False
+            if state.isWin() or state.isLose(): return False
+            state = state.generateSuccessor( *self.getMove( move ) )
+        return (self.isComplete() and state.getScore() == self.score and
+                state.isWin() == self.win and state.isLose() == self.lose)
+
+def readTrace( filename ):
+    """
+    Reads all the games of a trace file, the last one possibly incomplete if
+    it is still being written.
+    """
+    f = open( filename, 'rb' )
+    try: contents = f.read()
+    finally: f.close()
+    if not contents.startswith( TRACE_MAGIC ):
+        raise Exception(filename + ' is not a trace file')
+
+    games = []
+    offset = len( TRACE_MAGIC )
+    while offset + RECORD_HEADER.size <= len( contents ):
+        recordType, length = RECORD_HEADER.unpack_from( contents, offset )
+        offset += RECORD_HEADER.size
+        payload = contents[offset:offset + length]
+        if len( payload ) < length: break
+        offset += length
+
+        if recordType == 'G':
+            digest, numAgents, interval = GAME_HEADER.unpack( payload )
+            games.append( RecordedGame( digest, numAgents ) )
+        elif recordType == 'A':
+            games[-1].chunks.append( payload )
+        elif recordType == 'S':
+            numActions, = struct.unpack_from( '<I', payload )
+            games[-1].snapshots[numActions] = payload[4:]
+        elif recordType == 'E':
+            game = games[-1]
+            numMoves, game.score, flags = GAME_END.unpack( payload )
+            game.win, game.lose, game.crashed = bool( flags & WIN ), bool( flags & LOSE ), bool( flags & CRASHED )
+        else:
+            raise Exception('Unknown record type ' + repr( recordType ))
+
+    for game in games:
+        game.actions = ''.join( game.chunks )
+        game.chunks = []
+    return games
+
+def validateGames( games, layout ):
+    """
+    Replays recorded games played on layout and returns whether each ended as
+    recorded.  Games that were won or lost are replayed together in lockstep
+    with batch.BatchGame; the others, and any batch with an illegal move, are
+    replayed one by one.
+    """
+    import numpy as np
+    import batch
+
+    valid = [None] * len( games )
+    groups = {}
+    for i, game in enumerate( games ):
+        game.checkLayout( layout )
+        if game.isComplete() and (game.win or game.lose) and not game.crashed:
+            groups.setdefault( game.numAgents, [] ).append( i )
+        else:
+            valid[i] = game.validate( layout )
+
+    for numAgents, indices in groups.items():
+        numMoves = np.array( [games[i].getNumMoves() for i in indices] )
+        actions = np.full( (len( indices ), numMoves.max()), ACTIONS.index( Directions.STOP ), dtype=int )
+        for row, i in enumerate( indices ):
+            actions[row, :numMoves[row]] = np.frombuffer( games[i].actions, dtype=np.uint8 )
+
+        replay = batch.BatchGame( layout, len( indices ), numAgents - 1 )
+        early = np.zeros( len( indices ), dtype=bool )
+        try:
+            for move in range( actions.shape[1] ):
+                early |= replay.isOver() & (move < numMoves)
+                replay.advance( actions[:, move] )
+        except Exception:
+            for i in indices: valid[i] = games[i].validate( layout )
+            continue
+
+        scores = np.array( [games[i].score for i in indices] )
+        wins = np.array( [games[i].win for i in indices] )
+        loses = np.array( [games[i].lose for i in indices] )
+        ok = ~early & replay.isOver() & (replay.scores == scores) & (replay.win == wins) & (replay.lose == loses)
+        for row, i in enumerate( indices ): valid[i] = bool( ok[row] )
+    return valid
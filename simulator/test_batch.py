@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import batch
+import layout
+
+
+class TestBatchGame(unittest.TestCase):
+    def play(self, layout_name, num_games=16, num_moves=400):
+        lay = layout.getLayout(layout_name)
+        games = batch.BatchGame(lay, num_games)
+        states = [games.getGameState(i) for i in range(num_games)]
+        random = np.random.RandomState(0)
+
+        for _ in range(num_moves):
+            agent_index = games.agentIndex
+            actions = games.sampleLegalActions(random)
+            legal = games.getLegalActions()
+
+            for i, state in enumerate(states):
+                self.assertEqual(
+                    sorted(state.getLegalActions(agent_index)),
+                    sorted(batch.ACTIONS[a] for a in np.nonzero(legal[i])[0]))
+
+                if not (state.isWin() or state.isLose()):
+                    states[i] = state.generateSuccessor(agent_index,
+                        batch.ACTIONS[actions[i]])
+
+            games.step(actions)
+
+            for i, state in enumerate(states):
+                self.assertEqual(games.getGameState(i), state)
+                self.assertEqual(games.win[i], state.isWin())
+                self.assertEqual(games.lose[i], state.isLose())
+
+    def test_matches_game_rules_with_one_ghost(self):
+        self.play('medium1Ghosts')
+
+    def test_matches_game_rules_with_four_ghosts(self):
+        self.play('classic4Ghosts')
+
+    def test_illegal_action_raises_exception(self):
+        games = batch.BatchGame(layout.getLayout('classic1Ghost'), 2)
+        illegal = (~games.getLegalActions()).argmax(axis=1)
+
+        with self.assertRaises(Exception):
+            games.step(illegal)
+
+    def test_reset_restarts_games(self):
+        games = batch.BatchGame(layout.getLayout('classic1Ghost'), 2)
+        games.step(games.sampleLegalActions())
+        games.reset()
+
+        self.assertEqual(games.agentIndex, 0)
+        self.assertTrue((games.scores == 0).all())
@@ -0,0 +1,41 @@
+import random
+import unittest
+import distances
+import game
+import layout
+import pacman
+
+
+class TestDistances(unittest.TestCase):
+    def setUp(self):
+        self.layout = layout.getLayout('medium1Ghosts')
+        self.distances = distances.getDistances(self.layout)
+
+    def bfs(self, start, goals):
+        frontier, seen, d = [start], set([start]), 0
+        while frontier:
+            if any(cell in goals for cell in frontier):
+                return d
+            frontier = [n for cell in frontier for n in self.layout.getLegalNeighbors(cell) if n not in seen]
+            seen.update(frontier)
+            d += 1
+        return None
+
+    def test_distances_are_cached_per_layout(self):
+        self.assertTrue(distances.getDistances(layout.Layout(self.layout.layoutText)) is self.distances)
+
+    def test_distances_match_breadth_first_search(self):
+        rand = random.Random(0)
+        cells = sorted(self.layout.legalNeighbors)
+        for i in range(30):
+            start, goal = rand.choice(cells), rand.choice(cells)
+            self.assertEqual(self.distances.distance(start, goal), self.bfs(start, [goal]))
+
+    def test_nearest_food_matches_breadth_first_search(self):
+        state = pacman.GameState()
+        state.initialize(self.layout, 1)
+        food = state.getFood()
+        foods = food.asList()
+        for cell in sorted(self.layout.legalNeighbors):
+            self.assertEqual(self.distances.nearestInGrid(cell, food), self.bfs(cell, foods))
+        self.assertEqual(self.distances.nearestInGrid((1, 1), game.Grid(food.width, food.height)), None)
@@ -0,0 +1,117 @@
+import pickle
+import unittest
+import game
+import layout
+import pacman
+import textDisplay
+import time
+import util
+
+
+class TestGrid(unittest.TestCase):
+    def test_cells_are_false_by_default(self):
+        g = game.Grid(3, 2)
+
+        self.assertEqual(g.asList(), [])
+        self.assertEqual(g.count(), 0)
+
+    def test_set_cell(self):
+        g = game.Grid(3, 2)
+        g[2][1] = True
+
+        self.assertTrue(g[2][1])
+        self.assertFalse(g[1][1])
+
+    def test_count_follows_writes(self):
+        g = game.Grid(3, 2)
+        g[0][0] = True
+        g[0][0] = True
+        g[1][1] = True
+        g[1][1] = False
+
+        self.assertEqual(g.count(), 1)
+        self.assertEqual(g.count(False), 5)
+
+    def test_as_list_is_ordered_by_column(self):
+        g = game.Grid(3, 2)
+        g[2][0] = True
+        g[0][1] = True
+
+        self.assertEqual(g.asList(), [(0, 1), (2, 0)])
+
+    def test_copy_is_independent(self):
+        g = game.Grid(3, 2)
+        c = g.copy()
+        c[1][0] = True
+
+        self.assertFalse(g[1][0])
+        self.assertNotEqual(g, c)
+
+    def test_equal_grids_have_equal_hashes(self):
+        g = game.Grid(3, 2, True)
+        c = game.Grid(3, 2)
+        for x in range(3):
+            for y in range(2):
+                c[x][y] = True
+
+        self.assertEqual(g, c)
+        self.assertEqual(hash(g), hash(c))
+
+    def test_columns_can_be_enumerated(self):
+        g = game.Grid(3, 2)
+        g[1][1] = True
+
+        self.assertEqual([list(column) for column in g],
+            [[False, False], [False, True], [False, False]])
+
+    def test_pack_bits_round_trip(self):
+        g = game.Grid(7, 5)
+        g[6][4] = True
+        g[3][2] = True
+
+        self.assertEqual(game.reconstituteGrid(g.packBits()), g)
+
+    def test_pickle_round_trip(self):
+        g = game.Grid(7, 5)
+        g[6][4] = True
+
+        self.assertEqual(pickle.loads(pickle.dumps(g)), g)
+        self.assertEqual(pickle.loads(pickle.dumps(g)).count(), 1)
+
+
+class SpinningAgent(game.Agent):
+    def getAction(self, state):
+        while True:
+            pass
+
+
+class TestGameTiming(unittest.TestCase):
+    def test_deadline_timing_interrupts_slow_agents(self):
+        lay = layout.getLayout('classic1Ghost')
+        rules = pacman.ClassicGameRules(timeout=1)
+        g = rules.newGame(lay, SpinningAgent(), [SpinningAgent(1)],
+                          textDisplay.NullGraphics(), quiet=True,
+                          catchExceptions=True, timing='deadline')
+        g.run()
+
+        self.assertTrue(g.agentTimeout)
+        self.assertEqual(g.moveHistory, [])
+
+    def test_interrupts_after_a_timeout_are_not_timeouts(self):
+        def sleep():
+            for i in range(200):
+                time.sleep(0.01)
+
+        def interrupt():
+            raise KeyboardInterrupt()
+
+        watchdog = util.Watchdog(resolution=0.01)
+        watchdog.start()
+        try:
+            self.assertRaises(util.TimeoutFunctionException,
+                              util.DeadlineFunction(sleep, 0.05, watchdog))
+            self.assertFalse(watchdog.expired)
+            self.assertRaises(KeyboardInterrupt,
+                              util.DeadlineFunction(interrupt, 10, watchdog))
+        finally:
+            watchdog.stop()
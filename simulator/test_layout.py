@@ -0,0 +1,51 @@
+import unittest
+import game
+import layout
+
+
+class TestLayout(unittest.TestCase):
+    def test_get_layout_is_cached(self):
+        lay = layout.getLayout('classic1Ghost')
+
+        self.assertIs(layout.getLayout('classic1Ghost'), lay)
+        self.assertIs(lay.deepCopy(), lay)
+
+    def test_legal_neighbors_match_walls(self):
+        lay = layout.getLayout('classic2Ghosts')
+
+        for x, y in lay.legalNeighbors:
+            self.assertEqual(lay.getLegalNeighbors((x, y)),
+                             game.Actions.getLegalNeighbors((x, y), lay.walls))
+
+    def test_ghosts_only_turn_around_at_dead_ends(self):
+        lay = layout.Layout(['%%%%%',
+                             '%. .%',
+                             '%%%%%'])
+
+        self.assertEqual(lay.getGhostActions(game.Configuration((2, 1), 'East')), ['East'])
+        self.assertEqual(lay.getGhostActions(game.Configuration((3, 1), 'East')), ['West'])
+        self.assertEqual(lay.getPossibleActions(game.Configuration((3, 1), 'East')),
+                         game.Actions.getPossibleActions(game.Configuration((3, 1), 'East'), lay.walls))
+
+    def test_visibility_runs_from_every_cell_to_the_walls(self):
+        lay = layout.Layout(['%%%%',
+                             '%  %',
+                             '%  %',
+                             '%%%%'])
+        lay.initializeVisibilityMatrix()
+        north, south, west, east, stop = [game.Directions.NORTH, game.Directions.SOUTH,
+                                          game.Directions.WEST, game.Directions.EAST,
+                                          game.Directions.STOP]
+
+        # Each cell has its own sets, which follow the half steps of a
+        # direction's vector up to the first wall
+        self.assertEqual(lay.visibility[1][1],
+                         {north: set([(0.5, 1)]),
+                          south: set([(1.5, 1), (2, 1), (2.5, 1)]),
+                          west: set([(1, 0.5)]),
+                          east: set([(1, 1.5), (1, 2), (1, 2.5)]),
+                          stop: set()})
+        self.assertEqual(lay.visibility[2][2][south], set([(2.5, 2)]))
+        self.assertEqual(lay.visibility[0][0][south], set())
+        self.assertTrue(lay.isVisibleFrom((2, 1), (1, 1), south))
+        self.assertFalse(lay.isVisibleFrom((2, 2), (1, 1), south))
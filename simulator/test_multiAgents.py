@@ -0,0 +1,233 @@
+import multiprocessing
+import random
+import unittest
+import numpy as np
+import layout
+import multiAgents
+import pacman
+import time
+from distances import getDistances
+
+
+class TestDeepening(unittest.TestCase):
+    def test_deepening_keeps_to_the_time_budget(self):
+        lay = layout.getLayout('classic2Ghosts')
+        state = pacman.GameState()
+        state.initialize(lay, lay.getNumGhosts())
+        agent = multiAgents.MinimaxAgent(timeBudget='0.05')
+        start = time.time()
+        action = agent.getAction(state)
+
+        self.assertLess(time.time() - start, 1)
+        self.assertIn(action, state.getLegalActions(0))
+        self.assertGreaterEqual(agent.completed_depth, 1)
+
+    def test_deepening_stops_once_every_game_is_over(self):
+        state = pacman.GameState()
+        state.initialize(layout.Layout(['%%%%%',
+                                        '%P.G%',
+                                        '%%%%%']), 1)
+        agent = multiAgents.AlphaBetaAgent(timeBudget='10')
+
+        self.assertEqual(agent.getAction(state), 'East')
+        self.assertEqual(agent.completed_depth, 1)
+
+
+class TestMoveOrdering(unittest.TestCase):
+    def test_alpha_beta_agrees_with_minimax(self):
+        lay = layout.getLayout('classic2Ghosts')
+        state = pacman.GameState()
+        state.initialize(lay, lay.getNumGhosts())
+        alphaBeta = multiAgents.AlphaBetaAgent(depth='3')
+        minimax = multiAgents.MinimaxAgent(depth='3', tableSize='0')
+        rand = random.Random(1)
+        agentIndex = 0
+        for i in range(60):
+            if state.isWin() or state.isLose():
+                break
+            if agentIndex == 0:
+                self.assertEqual(alphaBeta.getAction(state), minimax.getAction(state))
+            state = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+            agentIndex = (agentIndex + 1) % state.getNumAgents()
+
+    def test_actions_are_ordered_by_hint_killers_then_history(self):
+        state = pacman.GameState()
+        state.initialize(layout.getLayout('classic1Ghost'), 1)
+        agent = multiAgents.AlphaBetaAgent()
+        agent.record_cutoff(state, 0, 2, 'West')
+        agent.record_cutoff(state, 0, 3, 'North')
+        agent.record_cutoff(state, 0, 3, 'North')
+        actions = ['East', 'North', 'South', 'West']
+
+        self.assertEqual(agent.order_actions(state, 0, 2, actions),
+                         ['West', 'North', 'East', 'South'])
+        self.assertEqual(agent.order_actions(state, 0, 2, actions, 'South'),
+                         ['South', 'West', 'North', 'East'])
+
+
+class TestExpectimax(unittest.TestCase):
+    def test_batched_leaves_match_the_search_one_leaf_at_a_time(self):
+        lay = layout.getLayout('classic4Ghosts')
+        initialState = pacman.GameState()
+        initialState.initialize(lay, lay.getNumGhosts())
+        rand = random.Random(3)
+        for ghost in ['RandomGhost', 'DirectionalGhost']:
+            batched = multiAgents.ExpectimaxAgent('better', '1', '0', ghost=ghost)
+            batched.batch_leaves = 1
+            leafByLeaf = multiAgents.ExpectimaxAgent('better', '1', '0', ghost=ghost)
+            leafByLeaf.batch_leaves = float('inf')
+            state = initialState
+            for i in range(40):
+                if state.isWin() or state.isLose():
+                    break
+                scaredState = state.deepCopy()
+                for ghostState in scaredState.data.agentStates[1:]:
+                    if not ghostState.scaredTimer:
+                        ghostState.scaredTimer = rand.choice([0, 1, 5])
+                for action in state.getLegalActions(0):
+                    for successor in [state.generateSuccessor(0, action), scaredState.generateSuccessor(0, action)]:
+                        if successor.isWin() or successor.isLose():
+                            continue
+                        self.assertAlmostEqual(batched.value(successor, 1, 1, 0, float('-inf'), float('inf')),
+                                               leafByLeaf.value(successor, 1, 1, 0, float('-inf'), float('inf')))
+                state = state.generateSuccessor(0, rand.choice(state.getLegalActions(0)))
+                for agentIndex in range(1, state.getNumAgents()):
+                    if state.isWin() or state.isLose():
+                        break
+                    state = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+
+    def test_arrays_match_the_evaluation_function(self):
+        lay = layout.getLayout('classic4Ghosts')
+        state = pacman.GameState()
+        state.initialize(lay, lay.getNumGhosts())
+        distances = getDistances(lay)
+        rand = random.Random(0)
+        for i in range(30):
+            if state.isWin() or state.isLose():
+                break
+            scaredState = state.deepCopy()
+            for ghostState in scaredState.data.agentStates[1:]:
+                ghostState.scaredTimer = rand.choice([0, 5, 5])
+            for s in [state, scaredState]:
+                pos = s.getPacmanPosition()
+                ghosts = [g.getPosition() for g in s.getGhostStates() if not g.scaredTimer]
+                nearestGhost = distances.nearestDistance(pos, ghosts)
+                value = multiAgents.betterEvaluationArrays(np.array([s.getScore()]),
+                    distances.nearestInGrid(pos, s.getFood()) or 0,
+                    distances.nearestDistance(pos, s.getCapsules()) or 0,
+                    np.array([np.inf if nearestGhost is None else nearestGhost]))
+                self.assertEqual(value[0], multiAgents.betterEvaluationFunction(s))
+            for agentIndex in range(state.getNumAgents()):
+                if state.isWin() or state.isLose():
+                    break
+                state = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+
+
+class TestUnreachableTargets(unittest.TestCase):
+    def setUp(self):
+        # The ghost and some food are walled off from Pacman, and there are
+        # no capsules
+        self.state = pacman.GameState()
+        self.state.initialize(layout.Layout(['%%%%%%%',
+                                             '%P.%G.%',
+                                             '%%%%%%%']), 1)
+
+    def test_evaluation_functions_treat_unreachable_targets_as_zero(self):
+        self.assertEqual(multiAgents.betterEvaluationFunction(self.state),
+                         self.state.getScore())
+        for action in self.state.getLegalActions(0):
+            self.assertIsInstance(multiAgents.ReflexAgent().evaluationFunction(self.state, action),
+                                  (int, float))
+
+    def test_agents_still_choose_actions(self):
+        for agent in [multiAgents.ReflexAgent(),
+                      multiAgents.ExpectimaxAgent('better', '2'),
+                      multiAgents.AlphaBetaAgent('better', '2')]:
+            self.assertIn(agent.getAction(self.state), self.state.getLegalActions(0))
+
+
+class TestContestAgent(unittest.TestCase):
+    def test_trap_checks_use_the_horizons_kept_by_the_agent(self):
+        state = pacman.GameState()
+        state.initialize(layout.Layout(['%%%%%%',
+                                        '%.P.G%',
+                                        '%%%%%%']), 1)
+        agent = multiAgents.ContestAgent()
+        horizons = agent.horizons(4)
+
+        self.assertTrue(agent.is_trapped(state, 1, ['West'], 4))
+        self.assertTrue(agent.horizons(4) is horizons)
+        self.assertTrue(horizons.threatened((3, 1), 1))
+
+
+class TestParallelSearch(unittest.TestCase):
+    def test_parallel_search_picks_the_sequential_actions(self):
+        lay = layout.getLayout('classic2Ghosts')
+        initialState = pacman.GameState()
+        initialState.initialize(lay, lay.getNumGhosts())
+        rand = random.Random(2)
+        for name in ['MinimaxAgent', 'AlphaBetaAgent', 'ExpectimaxAgent']:
+            parallel = getattr(multiAgents, name)(depth='2', workers='2')
+            sequential = getattr(multiAgents, name)(depth='2')
+            state, agentIndex = initialState, 0
+            for i in range(30):
+                if state.isWin() or state.isLose():
+                    break
+                if agentIndex == 0:
+                    self.assertEqual(parallel.getAction(state), sequential.getAction(state))
+                state = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+                agentIndex = (agentIndex + 1) % state.getNumAgents()
+            parallel.final(state)
+            self.assertEqual(parallel.pool, None)
+
+    def test_shared_alpha_only_gives_bounds_below_it(self):
+        lay = layout.getLayout('medium2Ghosts')
+        state = pacman.GameState()
+        state.initialize(lay, lay.getNumGhosts())
+        rand = random.Random(5)
+        agent = multiAgents.AlphaBetaAgent('better', '3')
+        plain = multiAgents.AlphaBetaAgent('better', '3', tableSize='0')
+        for i in range(15):
+            for action in plain.pacman_actions(state):
+                exact = plain.root_action_value(state, action, 3)[0]
+                for alpha in [exact - 5, exact, exact + 5]:
+                    v, bound, deepened = agent.root_action_value(state, action, 3,
+                        multiprocessing.Value('d', alpha, lock=False))
+                    self.assertEqual(bound, alpha)
+                    if v > bound:
+                        self.assertEqual(v, exact)
+                    else:
+                        self.assertTrue(exact <= v)
+                # Entries stored under the shared bound stay correct
+                self.assertEqual(agent.root_action_value(state, action, 3)[0], exact)
+            for agentIndex in range(state.getNumAgents()):
+                if not (state.isWin() or state.isLose()):
+                    state = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+            if state.isWin() or state.isLose():
+                break
+
+    def test_shared_alpha_prunes_the_whole_subtree(self):
+        lay = layout.getLayout('medium2Ghosts')
+        state = pacman.GameState()
+        state.initialize(lay, lay.getNumGhosts())
+        agent = multiAgents.AlphaBetaAgent('better', '4', tableSize='0')
+        evaluations = []
+        agent.evaluationFunction = lambda s: evaluations.append(s) or multiAgents.betterEvaluationFunction(s)
+        counts = []
+        for alpha in [float('-inf'), float('inf')]:
+            del evaluations[:]
+            agent.root_action_value(state, 'East', 4, multiprocessing.Value('d', alpha, lock=False))
+            counts.append(len(evaluations))
+
+        self.assertTrue(counts[1] * 4 < counts[0])
+
+    def test_workers_restart_for_another_layout(self):
+        agent = multiAgents.AlphaBetaAgent(depth='1', workers='2')
+        for name in ['classic1Ghost', 'classic2Ghosts']:
+            lay = layout.getLayout(name)
+            state = pacman.GameState()
+            state.initialize(lay, lay.getNumGhosts())
+            self.assertIn(agent.getAction(state), state.getLegalActions(0))
+            self.assertTrue(agent.pool_layout is lay)
+        agent.final(state)
+        self.assertEqual(agent.pool, None)
@@ -0,0 +1,99 @@
+import random
+import unittest
+import distances
+import game
+import layout
+import mypy
+import pacman
+
+
+class TestGridSearch(unittest.TestCase):
+    def setUp(self):
+        self.layout = layout.getLayout('medium1Ghosts')
+        self.state = pacman.GameState()
+        self.state.initialize(self.layout, 1)
+
+    def test_paths_are_shortest_and_legal(self):
+        rand = random.Random(0)
+        cells = sorted(self.layout.legalNeighbors)
+        oracle = distances.getDistances(self.layout)
+        for i in range(30):
+            start, goal = rand.choice(cells), rand.choice(cells)
+            length, path = mypy.search(mypy.AStartMazeSearchProblem(start, goal, [], self.state))
+            self.assertEqual(length, oracle.distance(start, goal))
+            position = start
+            for action in path:
+                position = mypy.round_tuple(game.Actions.getSuccessor(position, action))
+                self.assertFalse(self.layout.isWall(position))
+            self.assertEqual(position, goal)
+
+    def test_blocked_cells_are_avoided(self):
+        start = self.state.getPacmanPosition()
+        neighbors = self.layout.getLegalNeighbors(start)
+        self.assertEqual(mypy.search(mypy.NearestFoodProblem(start, neighbors, self.state)), (-1, ['Stop']))
+        self.assertTrue(mypy.search(mypy.NPacmanMovesProblem(self.state, 2, {0: neighbors, 1: []})))
+        self.assertFalse(mypy.search(mypy.NPacmanMovesProblem(self.state, 2, {0: [], 1: []})))
+
+    def test_ghost_horizons_follow_the_ghosts(self):
+        horizons = mypy.GhostHorizons(4)
+        rand = random.Random(0)
+        state, agentIndex = self.state, 0
+        for i in range(40):
+            if state.isWin() or state.isLose():
+                break
+            blocked = horizons.update(state)
+            graph = mypy.grid_graph(state)
+            reached = [mypy.search(mypy.GhostMovesProblem(mypy.round_tuple(ghost.getPosition()), ghost.scaredTimer, state, 4))
+                       for ghost in state.getGhostStates()]
+            for k in range(4):
+                positions = [position for ghost in reached for position in ghost[k]]
+                self.assertEqual(blocked[k], graph.mask(positions))
+                self.assertTrue(all(horizons.threatened(position, k) for position in positions))
+            state = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+            agentIndex = (agentIndex + 1) % state.getNumAgents()
+
+    def test_trap_checks_match_a_search_over_pacman_moves(self):
+        horizons = mypy.GhostHorizons(3)
+        rand = random.Random(1)
+        state, agentIndex = self.state, 0
+
+        def escapes(position, i, blocked, capsules):
+            if position in capsules or i == 3:
+                return True
+            return any(escapes(neighbor, i + 1, blocked, capsules)
+                       for neighbor in self.layout.getLegalNeighbors(position)
+                       if neighbor != position and neighbor not in blocked[i])
+
+        for i in range(60):
+            if state.isWin() or state.isLose():
+                break
+            reached = [mypy.search(mypy.GhostMovesProblem(mypy.round_tuple(ghost.getPosition()), ghost.scaredTimer, state, 3))
+                       for ghost in state.getGhostStates()]
+            blocked = [set(position for ghost in reached for position in ghost[k]) for k in range(3)]
+            for position in rand.sample(sorted(self.layout.legalNeighbors), 10) + [state.getPacmanPosition()]:
+                self.assertEqual(horizons.trapped(state, position),
+                                 not escapes(position, 0, blocked, state.getCapsules()))
+            state = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+            agentIndex = (agentIndex + 1) % state.getNumAgents()
+
+    def test_a_capsule_frees_a_trapped_pacman(self):
+        for text, trapped in [('%.P.G%', True), ('%oP.G%', False)]:
+            state = pacman.GameState()
+            state.initialize(layout.Layout(['%%%%%%', text, '%%%%%%']), 1)
+            self.assertEqual(mypy.GhostHorizons(4).trapped(state), trapped)
+            self.assertFalse(mypy.GhostHorizons(3).trapped(state))
+
+    def test_groups_are_ordered_by_last_merge(self):
+        self.assertEqual(mypy.make_groups([(1, 1), (3, 1), (2, 1), (5, 5)]),
+                         [((2, 1), (1, 1), (3, 1)), ((5, 5),)])
+
+    def test_maze_graph_splits_open_cells_into_corridors_and_junctions(self):
+        graph = mypy.maze_graph(self.state)
+        self.assertTrue(mypy.maze_graph(self.state) is graph)
+        paths_list, vertices, groups, paths, vertex_paths, edges = graph
+        self.assertEqual(set(paths_list) | vertices, set(self.layout.legalNeighbors))
+        self.assertEqual(sorted(tile for group in groups for tile in group), sorted(paths_list))
+        for vertex in vertices:
+            self.assertNotEqual(len(self.layout.getLegalNeighbors(vertex)), 3)
+        for tile in paths_list:
+            self.assertEqual(len(self.layout.getLegalNeighbors(tile)), 3)
@@ -0,0 +1,29 @@
+import unittest
+import layout
+import pacman
+
+
+class TestGameState(unittest.TestCase):
+    def setUp(self):
+        self.state = pacman.GameState()
+        self.state.initialize(layout.Layout(['%%%%%%%%',
+                                             '%P.o..G%',
+                                             '%%%%%%%%']), 1)
+
+    def test_successor_leaves_predecessor_unchanged(self):
+        successor = self.state.generateSuccessor(0, 'East')
+        successor = successor.generateSuccessor(0, 'East')
+
+        self.assertEqual(self.state.getPacmanPosition(), (1, 1))
+        self.assertEqual(self.state.getNumFood(), 3)
+        self.assertEqual(self.state.getCapsules(), [(3, 1)])
+        self.assertEqual(self.state.getGhostState(1).scaredTimer, 0)
+
+    def test_successor_applies_move(self):
+        successor = self.state.generateSuccessor(0, 'East')
+        successor = successor.generateSuccessor(0, 'East')
+
+        self.assertEqual(successor.getPacmanPosition(), (3, 1))
+        self.assertEqual(successor.getNumFood(), 2)
+        self.assertEqual(successor.getCapsules(), [])
+        self.assertEqual(successor.getGhostState(1).scaredTimer, pacman.SCARED_TIME)
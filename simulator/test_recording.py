@@ -0,0 +1,111 @@
+import cPickle
+import os
+import random
+import tempfile
+import unittest
+import game
+import layout
+import pacman
+import recording
+import textDisplay
+from ghostAgents import RandomGhost
+from pacmanAgents import RandomAgent
+
+
+class TestRecording(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.layout = layout.getLayout('classic2Ghosts')
+        handle, self.filename = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(self.filename)
+
+        writer = recording.TraceWriter(self.filename, snapshotInterval=10)
+        rules = pacman.ClassicGameRules()
+        self.games = []
+        for i in range(3):
+            g = rules.newGame(self.layout, RandomAgent(),
+                              [RandomGhost(1), RandomGhost(2)],
+                              textDisplay.NullGraphics(), quiet=True)
+            g.run()
+            writer.writeGame(self.layout, g)
+            self.games.append(g)
+        writer.close()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_trace_holds_the_games(self):
+        recorded = recording.readTrace(self.filename)
+
+        self.assertEqual([r.getMoves() for r in recorded],
+                         [g.moveHistory for g in self.games])
+        self.assertEqual([r.score for r in recorded],
+                         [g.state.getScore() for g in self.games])
+
+    def test_replays_validate(self):
+        recorded = recording.readTrace(self.filename)
+
+        self.assertTrue(all(r.validate(self.layout) for r in recorded))
+        self.assertEqual(recording.validateGames(recorded, self.layout),
+                         [True] * 3)
+
+    def test_tampered_game_does_not_validate(self):
+        recorded = recording.readTrace(self.filename)
+        recorded[1].score += 1
+
+        self.assertEqual(recording.validateGames(recorded, self.layout),
+                         [True, False, True])
+
+    def test_seeking_matches_replay_from_start(self):
+        r = recording.readTrace(self.filename)[0]
+
+        for numActions in [0, 9, 10, 11, 25, r.getNumMoves()]:
+            seeked = r.getState(self.layout, numActions)
+            replayed = r.getState(self.layout, numActions, useSnapshots=False)
+            self.assertEqual(seeked, replayed)
+            self.assertEqual(seeked.getScore(), replayed.getScore())
+
+
+def baselineGridState(grid):
+    """Grid state as pickled before grids were packed into integers."""
+    return {'CELLS_PER_INT': 30, 'width': grid.width, 'height': grid.height,
+            'data': [[grid[x][y] for y in range(grid.height)]
+                     for x in range(grid.width)]}
+
+
+class TestBaselineRecording(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.layout = layout.getLayout('classic1Ghost')
+        rules = pacman.ClassicGameRules()
+        self.game = rules.newGame(self.layout, RandomAgent(), [RandomGhost(1)],
+                                  textDisplay.NullGraphics(), quiet=True)
+        self.game.run()
+
+        # Layouts and grids as the baseline recorder pickled them
+        oldLayout = layout.Layout(self.layout.layoutText)
+        for name in ['visibilityKey', 'legalNeighbors', 'actionMasks',
+                     'possibleActions', 'ghostActions']:
+            delattr(oldLayout, name)
+        getstate = game.Grid.__getstate__
+        game.Grid.__getstate__ = baselineGridState
+        try:
+            self.data = cPickle.dumps({'layout': oldLayout,
+                                       'actions': self.game.moveHistory})
+        finally:
+            game.Grid.__getstate__ = getstate
+
+    def test_unpickled_layout_has_its_tables(self):
+        restored = cPickle.loads(self.data)['layout']
+
+        self.assertEqual(restored.walls, self.layout.walls)
+        self.assertEqual(restored.legalNeighbors, self.layout.legalNeighbors)
+        self.assertEqual(restored.possibleActions, self.layout.possibleActions)
+        self.assertEqual(restored.ghostActions, self.layout.ghostActions)
+
+    def test_baseline_pickle_replays(self):
+        recorded = cPickle.loads(self.data)
+        recorded['display'] = textDisplay.NullGraphics()
+
+        pacman.replayGame(**recorded)
@@ -0,0 +1,64 @@
+import random
+import unittest
+import layout
+import multiAgents
+import pacman
+import transposition
+
+
+class TestTransposition(unittest.TestCase):
+    def setUp(self):
+        lay = layout.getLayout('classic2Ghosts')
+        self.state = pacman.GameState()
+        self.state.initialize(lay, lay.getNumGhosts())
+
+    def test_successor_hashes_match_full_hashes(self):
+        hasher = transposition.ZobristHasher()
+        rand = random.Random(0)
+        state, agentIndex = self.state, 0
+        key = hasher.hashState(state, agentIndex)
+        for i in range(200):
+            if state.isWin() or state.isLose():
+                break
+            successor = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+            key = hasher.successorHash(state, key, agentIndex, successor)
+            state, agentIndex = successor, (agentIndex + 1) % state.getNumAgents()
+            self.assertEqual(key, hasher.hashState(state, agentIndex))
+
+    def test_deeper_entries_are_kept(self):
+        table = transposition.TranspositionTable(1)
+        table.store(1, 0, 3, 10, transposition.EXACT)
+        table.store(2, 0, 2, 20, transposition.EXACT)
+
+        self.assertEqual(table.lookup(1, 0), (3, 10, transposition.EXACT, None))
+        self.assertEqual(table.lookup(2, 0), None)
+        table.newSearch()
+        table.store(2, 0, 2, 20, transposition.EXACT)
+        self.assertEqual(table.lookup(2, 0), (2, 20, transposition.EXACT, None))
+        self.assertEqual(table.lookup(2, 10), None)
+
+    def test_table_does_not_change_actions(self):
+        rand = random.Random(0)
+        for name in ['MinimaxAgent', 'AlphaBetaAgent', 'ExpectimaxAgent']:
+            agent = getattr(multiAgents, name)(depth='2')
+            plain = getattr(multiAgents, name)(depth='2', tableSize='0')
+            state, agentIndex = self.state, 0
+            for i in range(60):
+                if state.isWin() or state.isLose():
+                    break
+                if agentIndex == 0:
+                    self.assertEqual(agent.getAction(state), plain.getAction(state))
+                state = state.generateSuccessor(agentIndex, rand.choice(state.getLegalActions(agentIndex)))
+                agentIndex = (agentIndex + 1) % state.getNumAgents()
+
+    def test_shallow_subtrees_are_not_stored(self):
+        agent = multiAgents.MinimaxAgent(depth='1')
+        agent.getAction(self.state)
+        self.assertEqual([entry[2] for entry in agent.table.slots if entry is not None], [1])
+
+        for depth in ['2', '3']:
+            agent = multiAgents.MinimaxAgent(depth=depth)
+            agent.getAction(self.state)
+            depths = [entry[2] for entry in agent.table.slots if entry is not None]
+            self.assertTrue(len(depths) > 1)
+            self.assertTrue(min(depths) >= agent.table_depth)
@@ -0,0 +1,114 @@
+# transposition.py
+# ----------------
+# A bounded transposition table for the adversarial search agents of
+# multiAgents.py, keyed by Zobrist hashes of game states.
+#
+# The Zobrist hash of a state, with a given agent about to move, is the
+# exclusive or of a random 64 bit key for each of its features: the agent to
+# move, the configuration and scared timer of every agent, and every food and
+# capsule left.  A successor only changes a few of these features, so its hash
+# is derived from its predecessor's by xoring out the features that changed
+# and xoring in the new ones.
+
+import random
+
+# Bound types: the stored value is the value of the state, a lower bound on it
+# (the search failed high) or an upper bound on it (the search failed low)
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class ZobristHasher:
+    """
+    Hashes game states from random keys drawn, with a private generator, the
+    first time each feature is seen.
+    """
+    def __init__( self, seed=0 ):
+        self.random = random.Random( seed )
+        self.keys = {}
+
+    def featureKey( self, feature ):
+        try:
+            return self.keys[feature]
+        except KeyError:
+            key = self.keys[feature] = self.random.getrandbits( 64 )
+            return key
+
+    def agentKey( self, index, agentState ):
+        configuration = agentState.configuration
+        return self.featureKey( (index, configuration.pos, configuration.direction, agentState.scaredTimer) )
+
+    def hashState( self, state, agentIndex ):
+        """
+        Returns the hash of a state with agentIndex about to move.
+        """
+        data = state.data
+        key = self.featureKey( ('turn', agentIndex) )
+        for index, agentState in enumerate( data.agentStates ):
+            key ^= self.agentKey( index, agentState )
+        for x, y in data.food.asList():
+            key ^= self.featureKey( ('food', x, y) )
+        for x, y in data.capsules:
+            key ^= self.featureKey( ('capsule', x, y) )
+        return key
+
+    def successorHash( self, state, key, agentIndex, successor ):
+        """
+        Returns the hash of the successor generated by agentIndex moving in a
+        state whose hash is key.  Successors share the agent states, food and
+        capsules that did not change with their predecessor, so only those
+        that are new are rehashed.
+        """
+        data, nextData = state.data, successor.data
+        numAgents = len( data.agentStates )
+        key ^= self.featureKey( ('turn', agentIndex) ) ^ self.featureKey( ('turn', (agentIndex + 1) % numAgents) )
+        agentStates = data.agentStates
+        for index, agentState in enumerate( nextData.agentStates ):
+            if agentState is not agentStates[index]:
+                key ^= self.agentKey( index, agentStates[index] ) ^ self.agentKey( index, agentState )
+        if nextData.food is not data.food:
+            x, y = nextData._foodEaten
+            key ^= self.featureKey( ('food', x, y) )
+        if nextData.capsules is not data.capsules:
+            x, y = nextData._capsuleEaten
+            key ^= self.featureKey( ('capsule', x, y) )
+        return key
+
+class TranspositionTable:
+    """
+    A fixed number of slots, each holding the result of searching one state:
+    its hash and score, the depth searched, the value found, its bound type
+    and the best action, if known.
+
+    A slot already in use is only given to another state searched at least
+    as deep, unless its entry was stored during an earlier search.
+    """
+    def __init__( self, size=1 << 16 ):
+        self.size = size
+        self.clear()
+
+    def clear( self ):
+        self.slots = [None] * self.size
+        self.generation = 0
+
+    def newSearch( self ):
+        """
+        Marks the entries stored so far as old, so that they give way to the
+        entries of the next search.
+        """
+        self.generation += 1
+
+    def lookup( self, key, score ):
+        """
+        Returns the (depth, value, bound, action) entry of a state, or None.
+        The score is checked along with the hash, since the values of states
+        that only differ in score need not be the same.
+        """
+        entry = self.slots[key % self.size]
+        if entry is None or entry[0] != key or entry[1] != score:
+            return None
+        return entry[2:6]
+
+    def store( self, key, score, depth, value, bound, action=None ):
+        slot = key % self.size
+        entry = self.slots[slot]
+        if entry is None or entry[0] == key or entry[6] != self.generation or depth >= entry[2]:
+            self.slots[slot] = (key, score, depth, value, bound, action, self.generation)
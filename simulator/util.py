@@ -622,6 +622,94 @@ class TimeoutFunction:
         return result
 
 
+# Deadline timing: Python 2 has no monotonic clock in its standard library,
+# so time.time stands in for it there.
+import thread, threading
+try:
+    monotonicTime = time.monotonic
+except AttributeError:
+    monotonicTime = time.time
+
+class Watchdog:
+    """
+    Interrupts the main thread with KeyboardInterrupt once the deadline set by
+    arm passes, and records that it did so in expired until the next arm or
+    handled timeout.
+
+    Arming and disarming only write an attribute: while the watchdog is
+    started, a background thread polls the deadline every resolution seconds,
+    so timing a call takes no signal handlers or alarm syscalls.  Like any
+    KeyboardInterrupt, the interruption only lands once a blocking call such
+    as time.sleep returns.
+    """
+    def __init__(self, resolution=0.05):
+        self.resolution = resolution
+        self.deadline = None
+        self.expired = False
+        self.running = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.deadline = None
+        self.expired = False
+        if self.thread == None:
+            self.thread = threading.Thread(target=self._watch)
+            self.thread.daemon = True
+            self.thread.start()
+        self.running.set()
+
+    def stop(self):
+        self.deadline = None
+        self.running.clear()
+
+    def arm(self, timeout):
+        self.expired = False
+        self.deadline = monotonicTime() + timeout
+
+    def disarm(self):
+        self.deadline = None
+
+    def _watch(self):
+        while True:
+            self.running.wait()
+            time.sleep(self.resolution)
+            deadline = self.deadline
+            if deadline != None and monotonicTime() >= deadline and self.deadline is deadline:
+                self.deadline = None
+                self.expired = True
+                thread.interrupt_main()
+
+WATCHDOG = Watchdog()
+
+class DeadlineFunction:
+    """
+    Like TimeoutFunction, but timed with a Watchdog rather than SIGALRM.  Calls
+    that return in time are also checked against the clock, so a call that
+    overran is reported even if the watchdog had not polled yet.
+    """
+    def __init__(self, function, timeout, watchdog=WATCHDOG):
+        self.timeout = timeout
+        self.function = function
+        self.watchdog = watchdog
+
+    def __call__(self, *args, **keyArgs):
+        startTime = monotonicTime()
+        self.watchdog.arm(self.timeout)
+        try:
+            result = self.function(*args, **keyArgs)
+        except KeyboardInterrupt:
+            if self.watchdog.expired:
+                # Later interrupts come from the user
+                self.watchdog.expired = False
+                raise TimeoutFunctionException()
+            raise
+        finally:
+            self.watchdog.disarm()
+        if monotonicTime() - startTime >= self.timeout:
+            raise TimeoutFunctionException()
+        return result
+
+
 
 _ORIGINAL_STDOUT = None
 _ORIGINAL_STDERR = None
@@ -1,3 +1,4 @@
+import corridors
 import math
 
 
@@ -5,9 +6,10 @@ class Map(object):
     """Probabilistic map.
 
     Every cell contains a value in the interval [0, 1] indicating a probability.
-    The entire map sums up to 1.
+    The entire map sums up to 1. Distances are answered by a corridor graph of
+    the walls, shared by all maps.
     """
-    paths = None
+    graph = None
 
     def __init__(self, width, height, walls=[]):
         self.width = width
@@ -31,8 +33,8 @@ class Map(object):
     def walls(self, walls):
         self._walls = walls
 
-        if Map.paths == None:
-            self._calculate_all_paths()
+        if Map.graph == None:
+            self._calculate_graph()
 
     def __getitem__(self, i):
         return self.cells[i]
@@ -142,64 +144,27 @@ class Map(object):
         self.cells = cells
         self.normalize()
 
-    def _generate_next_pos(self, pos):
-        next_pos = {}
+    def _calculate_graph(self):
+        Map.graph = corridors.CorridorGraph(self.width, self.height, self._walls)
 
-        for action, delta in self.action_to_pos.items():
-            candidate_pos = (pos[0] + delta[0], pos[1] + delta[1])
-
-            if self._is_valid_position(candidate_pos):
-                next_pos[candidate_pos] = action
-
-        return next_pos
-
-    def _calculate_paths(self, pos, max_distance=None):
-        pos_to_path = {}
-        current_pos = [pos]
-        analyzed_pos = []
-
-        while current_pos:
-            p = current_pos.pop(0)
-            analyzed_pos.append(p)
-
-            if p in pos_to_path:
-                path = pos_to_path[p]
-            else:
-                path = []
-
-            next_pos = []
-            for next_p, action in self._generate_next_pos(p).items():
-                if next_p not in analyzed_pos:
-                    next_pos.append(next_p)
-
-                    if not max_distance or len(path) + 1 <= max_distance:
-                        pos_to_path[next_p] = path + [action]
-            current_pos.extend(next_pos)
-
-        return pos_to_path
-
-    def _calculate_all_paths(self, max_distance=None):
-        paths = {}
+    def calculate_distance(self, pos1, pos2):
+        if Map.graph == None:
+            self._calculate_graph()
 
-        for y in range(self.height):
-            for x in range(self.width):
-                pos = (y, x)
-                if self._is_valid_position(pos):
-                    paths[pos] = self._calculate_paths(pos, max_distance=max_distance)
+        if self._is_valid_position(pos1) and self._is_valid_position(pos2):
+            distance = Map.graph.calculate_distance(pos1, pos2)
+            if distance is not None:
+                return distance
 
-        Map.paths = paths
+        return float('inf')
 
-    def calculate_distance(self, pos1, pos2):
-        if Map.paths == None:
-            self._calculate_all_paths()
+    def calculate_next_position(self, pos1, pos2):
+        """First position of a shortest path from pos1 to pos2, or None."""
+        if Map.graph == None:
+            self._calculate_graph()
 
         if self._is_valid_position(pos1) and self._is_valid_position(pos2):
-            if pos1 == pos2:
-                return 0
-            else:
-                return len(Map.paths[pos1][pos2])
-        else:
-            return float('inf')
+            return Map.graph.calculate_next_position(pos1, pos2)
 
 
 def deterministic_distribution(action1, action2):
@@ -0,0 +1,188 @@
+import glob
+import multiprocessing
+import os
+import pickle
+import select
+import tempfile
+import unittest
+import agents
+import communication as comm
+import controller
+import messages
+
+
+def create_state_message(agent_id=0):
+    return messages.StateMessage(agent_id=agent_id,
+        agent_positions={0: (1, 1)}, food_positions=[(1, 2)],
+        fragile_agents={0: 0.0},
+        wall_positions=[(0, x) for x in range(5)] + [(2, x) for x in range(5)],
+        legal_actions=['East', 'Stop'], reward=-1.0, executed_action='Stop',
+        test_mode=False)
+
+
+class TestInProcessClient(unittest.TestCase):
+    def test_router_replies_to_the_messages_it_is_handed(self):
+        router = controller.MessageRouter()
+        client = comm.InProcessClient(router)
+
+        for message in [
+            messages.RegisterMessage(agent_id=0, agent_team='pacman',
+                agent_class=agents.RandomPacmanAgent),
+            messages.InitMessage(agent_id=0),
+            messages.StartMessage(agent_id=0, map_width=5, map_height=3)]:
+            client.send_message(message)
+            self.assertEqual(client.recv_message().msg_type, messages.ACK)
+
+        client.send_message(create_state_message())
+        reply = client.recv_message()
+
+        self.assertEqual(reply.msg_type, messages.ACTION)
+        self.assertEqual(reply.agent_id, 0)
+        self.assertIn(reply.action, ['East', 'Stop'])
+
+    def test_replies_are_received_in_order(self):
+        router = controller.MessageRouter()
+        client = comm.InProcessClient(router)
+        client.send_message(messages.RegisterMessage(agent_id=0,
+            agent_team='pacman', agent_class=agents.RandomPacmanAgent))
+        client.send_message(messages.RequestStatsMessage())
+
+        self.assertEqual(client.recv_message().msg_type, messages.ACK)
+        self.assertEqual(client.recv_message().msg_type, messages.STATS)
+
+
+class TestPipeTransport(unittest.TestCase):
+    def test_messages_cross_the_pipe(self):
+        connection1, connection2 = multiprocessing.Pipe()
+        end1 = comm.PipeTransport(connection1)
+        end2 = comm.PipeTransport(connection2)
+        message = create_state_message(3)
+
+        end1.send_message(message)
+        received = end2.recv_message()
+        end2.send_message(messages.ActionMessage(agent_id=3, action='East'))
+        reply = end1.recv_message()
+
+        self.assertEqual(received.__dict__, message.__dict__)
+        self.assertEqual((reply.agent_id, reply.action), (3, 'East'))
+
+
+class TestTcpTransport(unittest.TestCase):
+    def test_messages_cross_the_socket(self):
+        server = comm.Server(port=55171)
+        client = comm.Client(port=55171)
+        message = create_state_message(2)
+
+        client.send_message(message)
+        received = server.recv_message()
+        server.send_message(messages.ActionMessage(agent_id=2, action='Stop'))
+        reply = client.recv_message()
+
+        self.assertEqual(received.__dict__, message.__dict__)
+        self.assertEqual((reply.agent_id, reply.action), (2, 'Stop'))
+        client.socket.close()
+        server.socket.close()
+
+
+class TestSharedMemoryTransport(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mktemp(prefix='multiagent-rl-test-')
+        self.server = comm.SharedMemoryServer(path=self.path, num_slots=4,
+            slot_size=256)
+        self.client = comm.SharedMemoryClient(path=self.path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def round_trip(self, message, reply):
+        self.client.send_message(message)
+        received = self.server.recv_message()
+        self.server.send_message(reply)
+        return received, self.client.recv_message()
+
+    def test_state_is_read_in_place(self):
+        message = create_state_message(1)
+        received, reply = self.round_trip(message,
+            messages.ActionMessage(agent_id=1, action='East'))
+
+        self.assertIsInstance(received, comm.SharedStateMessage)
+        self.assertEqual(received.copy().__dict__, message.__dict__)
+        self.assertEqual((reply.agent_id, reply.action), (1, 'East'))
+
+    def test_state_pickles_as_a_plain_message(self):
+        message = create_state_message(1)
+        self.client.send_message(message)
+        received = pickle.loads(pickle.dumps(self.server.recv_message(),
+            pickle.HIGHEST_PROTOCOL))
+
+        self.assertIs(type(received), messages.StateMessage)
+        self.assertEqual(received.__dict__, message.__dict__)
+
+    def test_small_messages_are_packed(self):
+        for message in [messages.InitMessage(agent_id=2),
+            messages.RequestStatsMessage(),
+            messages.StartMessage(agent_id=2, map_width=5, map_height=3)]:
+            self.client.send_message(message)
+            slot = self.server.recv()
+
+            self.assertNotEqual(self.server._slot_status(slot)[1],
+                comm.SharedMemoryTransport.PICKLED)
+            self.assertEqual(self.server.deserialize(slot).__dict__,
+                message.__dict__)
+            self.server.send_message(messages.AckMessage())
+            self.assertEqual(self.client.recv_message().msg_type,
+                messages.ACK)
+
+    def test_messages_larger_than_a_slot_overflow_to_a_file(self):
+        policy = range(1000)
+        received, reply = self.round_trip(messages.RequestPolicyMessage(
+            agent_id=0), messages.PolicyMessage(agent_id=0, policy=policy))
+
+        self.assertEqual(reply.policy, policy)
+        self.assertEqual(glob.glob(self.path + '.*.overflow'), [])
+
+    def test_replies_ready_before_reading_leave_no_wake_ups(self):
+        other_client = comm.SharedMemoryClient(path=self.path)
+
+        for _ in range(10):
+            self.client.send_message(messages.InitMessage(agent_id=0))
+            other_client.send_message(messages.InitMessage(agent_id=1))
+            for _ in range(2):
+                self.server.recv_message()
+                self.server.send_message(messages.AckMessage())
+            other_client.recv_message()
+            self.client.recv_message()
+
+        other_client.close()
+        self.assertEqual(select.select([self.server.reply_fd], [], [], 0)[0],
+            [])
+
+    def test_close_removes_the_files(self):
+        self.client.close()
+        self.server.close()
+        self.assertEqual(glob.glob(self.path + '*'), [])
+
+        self.server = comm.SharedMemoryServer(path=self.path)
+        self.client = comm.SharedMemoryClient(path=self.path)
+
+    def test_stale_ring_is_detected(self):
+        header = comm.SharedMemoryTransport.HEADER
+        dead_process = multiprocessing.Process(target=int)
+        dead_process.start()
+        dead_process.join()
+        header.pack_into(self.server.buffer, 0, comm.SharedMemoryTransport.MAGIC,
+            self.server.num_slots, self.server.slot_size, dead_process.pid)
+
+        self.assertRaises(IOError, comm.SharedMemoryClient, path=self.path)
+
+        self.server.close()
+        self.server = comm.SharedMemoryServer(path=self.path)
+        self.assertEqual(self.server.server_pid, os.getpid())
+
+    def test_ring_of_a_live_controller_is_not_replaced(self):
+        header = comm.SharedMemoryTransport.HEADER
+        header.pack_into(self.server.buffer, 0, comm.SharedMemoryTransport.MAGIC,
+            self.server.num_slots, self.server.slot_size, os.getppid())
+
+        self.assertRaises(IOError, comm.SharedMemoryServer, path=self.path)
@@ -0,0 +1,178 @@
+import time
+import unittest
+import agents
+import communication as comm
+import controller
+import messages
+
+
+class BeliefRecordingPacmanAgent(agents.PacmanAgent):
+    """Stops every step, keeping what it believed when choosing."""
+    def __init__(self, agent_id, ally_ids, enemy_ids):
+        super(BeliefRecordingPacmanAgent, self).__init__(agent_id, ally_ids,
+            enemy_ids)
+        self.beliefs = []
+
+    def choose_action(self, state, action, reward, legal_actions, explore):
+        self.beliefs.append(str(state))
+        return 'Stop'
+
+    def get_policy(self):
+        return self.beliefs
+
+
+class BeliefRecordingGhostAgent(BeliefRecordingPacmanAgent):
+    pass
+
+
+class SlowPacmanAgent(agents.PacmanAgent):
+    def choose_action(self, state, action, reward, legal_actions, explore):
+        time.sleep(0.5)
+        return 'Stop'
+
+
+def create_state_message(agent_id, pacman_position, ghost_position):
+    return messages.StateMessage(agent_id=agent_id,
+        agent_positions={0: pacman_position, 1: ghost_position},
+        food_positions=[(1, 4)], fragile_agents={0: 0.0, 1: 0.0},
+        wall_positions=[(0, x) for x in range(5)] + [(2, x) for x in range(5)],
+        legal_actions=['East', 'West', 'Stop'], reward=-1.0,
+        executed_action='Stop', test_mode=False)
+
+
+def start_agents(router, agent_classes):
+    """Set up agent i with the i-th class, agent 0 being the Pacman."""
+    setup_messages = []
+
+    for id_, agent_class in enumerate(agent_classes):
+        if id_ == 0:
+            team = 'pacman'
+        else:
+            team = 'ghost'
+        setup_messages.append(messages.RegisterMessage(agent_id=id_,
+            agent_team=team, agent_class=agent_class))
+
+    for id_ in range(len(agent_classes)):
+        setup_messages.append(messages.InitMessage(agent_id=id_))
+
+    for id_ in range(len(agent_classes)):
+        setup_messages.append(messages.StartMessage(agent_id=id_,
+            map_width=5, map_height=3))
+
+    for message in setup_messages:
+        router.process_message(message)
+
+
+def record_beliefs(router):
+    start_agents(router, [BeliefRecordingPacmanAgent,
+        BeliefRecordingGhostAgent])
+    client = comm.InProcessClient(router)
+
+    for pacman_x, ghost_x in [(1, 3), (2, 3), (2, 2), (3, 1)]:
+        for id_ in [0, 1]:
+            client.send_message(create_state_message(id_, (1, pacman_x),
+                (1, ghost_x)))
+            client.recv_message()
+
+    return [router.process_message(messages.RequestPolicyMessage(
+        agent_id=id_)).policy for id_ in [0, 1]]
+
+
+class TestShardedMessageRouter(unittest.TestCase):
+    def setUp(self):
+        self.routers = []
+
+    def tearDown(self):
+        for router in self.routers:
+            router.close()
+
+    def create_router(self, num_workers, server=None):
+        router = controller.ShardedMessageRouter(server,
+            num_workers=num_workers)
+        self.routers.append(router)
+        return router
+
+    def test_beliefs_do_not_depend_on_the_number_of_workers(self):
+        beliefs = record_beliefs(controller.MessageRouter())
+
+        for num_workers in [1, 2]:
+            self.assertEqual(record_beliefs(self.create_router(num_workers)),
+                beliefs)
+
+    def test_agents_are_sharded_by_id(self):
+        router = self.create_router(2)
+        start_agents(router, [agents.RandomPacmanAgent,
+            agents.RandomGhostAgent, agents.RandomGhostAgent])
+        worker_counts = []
+
+        for worker in router.workers:
+            worker.send_message(messages.RequestStatsMessage())
+            worker_counts.append(worker.recv_message().metrics.message_counts)
+
+        self.assertEqual([counts[messages.INIT] for counts in worker_counts],
+            [2, 1])
+        self.assertEqual([counts[messages.START] for counts in worker_counts],
+            [2, 1])
+
+    def test_registrations_are_broadcast_and_stats_merged(self):
+        router = self.create_router(2)
+        start_agents(router, [agents.RandomPacmanAgent,
+            agents.RandomGhostAgent])
+        counts = router.get_metrics().message_counts
+
+        self.assertEqual(counts[messages.REGISTER], 4)
+        self.assertEqual(counts[messages.INIT], 2)
+        self.assertEqual(counts[messages.START], 2)
+
+
+class TestShardedMessageRouterServer(unittest.TestCase):
+    def setUp(self):
+        self.server = comm.Server(port=55172)
+        self.router = controller.ShardedMessageRouter(self.server,
+            num_workers=2)
+        self.clients = [comm.Client(port=55172) for _ in range(2)]
+
+    def tearDown(self):
+        self.router.close()
+        for client in self.clients:
+            client.close()
+        self.server.close()
+
+    def serve(self, client_messages):
+        """Send client i the i-th message and poll until all are answered."""
+        for client, message in zip(self.clients, client_messages):
+            client.send_message(message)
+
+        replies = {}
+        while len(replies) < len(client_messages):
+            self.router.poll(100)
+
+            for index, client in enumerate(self.clients[:len(client_messages)]):
+                if index not in replies and client.socket.poll(0):
+                    replies[index] = client.recv_message()
+
+        return [replies[index] for index in range(len(client_messages))]
+
+    def test_requests_for_different_workers_are_served_together(self):
+        start_agents(self.router, [SlowPacmanAgent, SlowPacmanAgent])
+        start = time.time()
+        self.serve([create_state_message(id_, (1, 1), (1, 3))
+            for id_ in [0, 1]])
+
+        # Each request takes half a second, so one at a time takes a second
+        self.assertLess(time.time() - start, 0.9)
+
+    def test_replies_reach_their_clients(self):
+        start_agents(self.router, [agents.RandomPacmanAgent,
+            agents.RandomGhostAgent])
+        replies = self.serve([create_state_message(id_, (1, 1), (1, 3))
+            for id_ in [0, 1]])
+
+        self.assertEqual([reply.agent_id for reply in replies], [0, 1])
+
+    def test_stats_requests_are_merged(self):
+        start_agents(self.router, [agents.RandomPacmanAgent,
+            agents.RandomGhostAgent])
+        reply, = self.serve([messages.RequestStatsMessage()])
+
+        self.assertEqual(reply.metrics.message_counts[messages.REGISTER], 4)
@@ -0,0 +1,176 @@
+import collections
+import random
+import unittest
+import corridors
+import state
+
+
+def parse_maze(rows):
+    """Width, height and (y, x) walls of a maze drawn with % for walls."""
+    walls = [(y, x) for y, row in enumerate(rows)
+        for x, cell in enumerate(row) if cell == '%']
+    return len(rows[0]), len(rows), walls
+
+
+def random_maze(rng, width, height, wall_probability):
+    return [''.join('%' if rng.random() < wall_probability else ' '
+        for _ in range(width)) for _ in range(height)]
+
+
+def breadth_first_distances(width, height, walls, source):
+    walls = set(walls)
+    distances = {source: 0}
+    queue = collections.deque([source])
+
+    while queue:
+        y, x = queue.popleft()
+        for pos in [(y + 1, x), (y - 1, x), (y, x + 1), (y, x - 1)]:
+            if (0 <= pos[0] < height and 0 <= pos[1] < width and
+                pos not in walls and pos not in distances):
+                distances[pos] = distances[(y, x)] + 1
+                queue.append(pos)
+
+    return distances
+
+
+def open_cells(width, height, walls):
+    return [(y, x) for y in range(height) for x in range(width)
+        if (y, x) not in walls]
+
+
+class TestCorridorGraph(unittest.TestCase):
+    def assertMatchesBreadthFirstSearch(self, rows):
+        width, height, walls = parse_maze(rows)
+        graph = corridors.CorridorGraph(width, height, walls)
+        cells = open_cells(width, height, walls)
+        expected = dict((cell, breadth_first_distances(width, height, walls, cell))
+            for cell in cells)
+
+        for source in cells:
+            for target in cells:
+                self.assertEqual(graph.calculate_distance(source, target),
+                    expected[source].get(target), (rows, source, target))
+                self.assertNextPositionsReach(graph, expected, source, target)
+
+        return graph
+
+    def assertNextPositionsReach(self, graph, expected, source, target):
+        """Following next positions walks a shortest path to the target."""
+        distance = expected[source].get(target)
+        position = source
+
+        if distance is None:
+            self.assertIsNone(graph.calculate_next_position(source, target))
+            return
+
+        while position != target:
+            following = graph.calculate_next_position(position, target)
+            self.assertEqual(abs(following[0] - position[0]) +
+                abs(following[1] - position[1]), 1, (source, target, position))
+            self.assertEqual(expected[following][target],
+                expected[position][target] - 1, (source, target, position))
+            position = following
+
+        self.assertEqual(graph.calculate_next_position(target, target), target)
+
+    def test_loop_without_junctions(self):
+        graph = self.assertMatchesBreadthFirstSearch(['%%%%%',
+                                                      '%   %',
+                                                      '% % %',
+                                                      '%   %',
+                                                      '%%%%%'])
+
+        self.assertEqual(len(graph.junctions), 1)
+        self.assertEqual(graph.calculate_distance((1, 1), (3, 3)), 4)
+        self.assertIn(graph.calculate_next_position((1, 1), (3, 3)),
+            [(1, 2), (2, 1)])
+
+    def test_adjacent_junctions(self):
+        graph = self.assertMatchesBreadthFirstSearch(['%%%%%%',
+                                                      '%    %',
+                                                      '%    %',
+                                                      '%%  %%',
+                                                      '%%%%%%'])
+
+        self.assertTrue(all(graph.locate(pos) is None
+            for pos in [(1, 2), (2, 2), (2, 3)]))
+
+    def test_unreachable_cells(self):
+        graph = self.assertMatchesBreadthFirstSearch(['%%%%%%%',
+                                                      '%  %  %',
+                                                      '%%%%% %',
+                                                      '% %%%%%'])
+
+        self.assertIsNone(graph.calculate_distance((1, 1), (1, 5)))
+        self.assertIsNone(graph.calculate_distance((3, 1), (2, 5)))
+        self.assertIsNone(graph.calculate_next_position((1, 1), (1, 5)))
+
+    def test_one_wide_maze(self):
+        self.assertMatchesBreadthFirstSearch(['%%%%%%%%%',
+                                              '%       %',
+                                              '%%%%%%% %',
+                                              '%       %',
+                                              '% %%%%%%%',
+                                              '%       %',
+                                              '%%%%%%%%%'])
+        self.assertMatchesBreadthFirstSearch(['  ', ' %', '  '])
+
+    def test_single_cells(self):
+        self.assertMatchesBreadthFirstSearch([' '])
+        self.assertMatchesBreadthFirstSearch(['%%%', '% %', '%%%'])
+
+    def test_random_mazes(self):
+        rng = random.Random(0)
+
+        for _ in range(150):
+            self.assertMatchesBreadthFirstSearch(random_maze(rng,
+                rng.randint(1, 9), rng.randint(1, 9), rng.choice([0.2, 0.35, 0.5])))
+
+
+class TestMapDistances(unittest.TestCase):
+    def setUp(self):
+        # Maps share one graph, built for the first walls they see
+        self.graph = state.Map.graph
+        state.Map.graph = None
+
+    def tearDown(self):
+        state.Map.graph = self.graph
+
+    def test_distances_match_breadth_first_search(self):
+        width, height, walls = parse_maze(['%%%%%%%',
+                                           '%   % %',
+                                           '% % % %',
+                                           '%     %',
+                                           '%%%%%%%'])
+        agent_map = state.Map(width, height, walls)
+        expected = breadth_first_distances(width, height, walls, (1, 1))
+
+        for target in open_cells(width, height, walls):
+            self.assertEqual(agent_map.calculate_distance((1, 1), target),
+                expected.get(target, float('inf')))
+
+    def test_walls_and_unreachable_cells_are_infinitely_far(self):
+        width, height, walls = parse_maze(['%%%%%',
+                                           '% % %',
+                                           '%%%%%'])
+        agent_map = state.Map(width, height, walls)
+
+        self.assertEqual(agent_map.calculate_distance((1, 1), (1, 3)),
+            float('inf'))
+        self.assertEqual(agent_map.calculate_distance((1, 1), (0, 1)),
+            float('inf'))
+        self.assertEqual(agent_map.calculate_distance((1, 1), (1, 1)), 0)
+
+    def test_next_positions_follow_a_shortest_path(self):
+        width, height, walls = parse_maze(['%%%%%%%',
+                                           '%   % %',
+                                           '% % % %',
+                                           '%     %',
+                                           '%%%%%%%'])
+        agent_map = state.Map(width, height, walls)
+
+        self.assertEqual(agent_map.calculate_next_position((1, 5), (1, 1)),
+            (2, 5))
+        self.assertEqual(agent_map.calculate_next_position((1, 3), (3, 3)),
+            (2, 3))
+        self.assertIsNone(agent_map.calculate_next_position((1, 1), (0, 1)))
@@ -0,0 +1,109 @@
+import random
+import unittest
+import metrics
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_small_values_have_their_own_bucket(self):
+        histogram = metrics.LatencyHistogram(precision_bits=6)
+
+        for value in range(64):
+            bucket = histogram.get_bucket(value)
+            self.assertEqual(histogram.get_bucket_limit(bucket), value)
+
+    def test_bucket_limits_are_within_the_relative_error(self):
+        histogram = metrics.LatencyHistogram(precision_bits=6)
+        rng = random.Random(0)
+        values = range(1, 5000) + [rng.randint(1, 10 ** 9) for _ in range(5000)]
+
+        for value in values:
+            limit = histogram.get_bucket_limit(histogram.get_bucket(value))
+            self.assertGreaterEqual(limit, value)
+            self.assertLess(limit - value, value * 2 ** (1 - 6))
+
+    def test_buckets_follow_the_order_of_values(self):
+        histogram = metrics.LatencyHistogram(precision_bits=4)
+        buckets = [histogram.get_bucket(value) for value in range(10 ** 5)]
+
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(histogram.get_bucket(histogram.get_bucket_limit(
+            buckets[-1])), buckets[-1])
+
+    def test_percentiles(self):
+        histogram = metrics.LatencyHistogram()
+        for ms in range(1, 101):
+            histogram.record(ms / 1000.0)
+
+        self.assertAlmostEqual(histogram.get_percentile(50), 0.050, delta=0.002)
+        self.assertAlmostEqual(histogram.get_percentile(90), 0.090, delta=0.003)
+        self.assertEqual(histogram.get_percentile(100), 0.1)
+        self.assertAlmostEqual(histogram.get_mean(), 0.0505)
+
+    def test_empty_histogram_summary_is_zero(self):
+        summary = metrics.LatencyHistogram().get_summary()
+
+        self.assertEqual(summary['count'], 0)
+        self.assertEqual([summary[key] for key in
+            ['mean', 'min', 'max', 'p50', 'p99.9']], [0.0] * 5)
+
+    def test_merge_matches_recording_everything_at_once(self):
+        durations = [random.Random(1).expovariate(100) for _ in range(1000)]
+        first, second, both = [metrics.LatencyHistogram() for _ in range(3)]
+
+        for i, duration in enumerate(durations):
+            [first, second][i % 2].record(duration)
+            both.record(duration)
+        first.merge(second)
+
+        self.assertEqual(first.buckets, both.buckets)
+        self.assertEqual((first.count, first.min, first.max),
+            (both.count, both.min, both.max))
+        self.assertAlmostEqual(first.total, both.total)
+
+    def test_merging_an_empty_histogram_keeps_bounds(self):
+        histogram = metrics.LatencyHistogram()
+        histogram.record(0.5)
+        histogram.merge(metrics.LatencyHistogram())
+
+        self.assertEqual((histogram.count, histogram.min, histogram.max),
+            (1, 0.5, 0.5))
+
+
+class TestMessageMetrics(unittest.TestCase):
+    def test_merge_adds_counts_and_histograms(self):
+        first = metrics.MessageMetrics()
+        second = metrics.MessageMetrics()
+        first.count_message('State')
+        first.record('send', 0.001)
+        second.count_message('State')
+        second.count_message('Init')
+        second.record('send', 0.003)
+        second.record('choose_action', 0.002)
+        second.record_message('State', 0.004)
+        second.start_time = first.start_time - 10
+        first.merge(second)
+
+        self.assertEqual(first.message_counts, {'State': 2, 'Init': 1})
+        self.assertEqual(first.phases['send'].count, 2)
+        self.assertEqual(first.phases['send'].max, 0.003)
+        self.assertEqual(first.phases['choose_action'].count, 1)
+        self.assertEqual(first.message_types['State'].count, 1)
+        self.assertEqual(first.start_time, second.start_time)
+
+    def test_timing_records_the_phase(self):
+        message_metrics = metrics.MessageMetrics()
+        with message_metrics.timing('deserialize'):
+            pass
+
+        self.assertEqual(message_metrics.phases['deserialize'].count, 1)
+
+    def test_report_lists_messages_and_phases(self):
+        message_metrics = metrics.MessageMetrics()
+        message_metrics.count_message('State')
+        message_metrics.record('send', 0.002)
+        message_metrics.record_message('State', 0.004)
+        report = message_metrics.format_report()
+
+        self.assertIn('State', report)
+        self.assertIn('send', report)
+        self.assertIn('p99.9', report)
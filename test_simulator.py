@@ -0,0 +1,169 @@
+import StringIO
+import imp
+import os
+import sys
+import unittest
+import agents
+import communication as comm
+import controller
+from simulator import layout as simulator_layout
+from simulator import pacman as pacman_simulator
+from simulator import textDisplay
+
+# The simulator package shadows simulator.py, so the script is loaded by path
+simulator = imp.load_source('simulator_main',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulator.py'))
+
+
+class TestActionPipeline(unittest.TestCase):
+    def setUp(self):
+        self.layout = simulator_layout.Layout(['%%%%%%%',
+                                               '%P...G%',
+                                               '%%%%%%%'])
+        self.client = comm.InProcessClient(controller.MessageRouter())
+        self.pacman = simulator.create_pacman(agents.RandomPacmanAgent,
+            self.client)
+        self.ghosts = simulator.create_ghosts(agents.RandomGhostAgent,
+            [self.client])
+
+        for agent in [self.pacman] + self.ghosts:
+            agent.init_agent()
+            agent.start_game(self.layout.width, self.layout.height)
+
+        self.state = pacman_simulator.GameState()
+        self.state.initialize(self.layout, 1)
+
+    def test_staleness_is_capped_by_the_number_of_agents(self):
+        pipeline = simulator.ActionPipeline([self.pacman] + self.ghosts, 5)
+
+        self.assertEqual(pipeline.max_staleness, 1)
+
+    def test_prefetch_requests_the_next_agent(self):
+        pipeline = simulator.ActionPipeline([self.pacman] + self.ghosts)
+        pipeline.prefetch(self.pacman, self.state)
+
+        self.assertTrue(pipeline.is_prefetched(self.ghosts[0]))
+        self.assertFalse(pipeline.is_prefetched(self.pacman))
+        self.assertEqual(len(self.client.replies), 1)
+
+    def test_record_counts_moves_since_the_request(self):
+        pipeline = simulator.ActionPipeline([self.pacman] + self.ghosts)
+        pipeline.prefetch(self.pacman, self.state)
+        pipeline.tick()
+        pipeline.record(self.ghosts[0], ['East', 'West'], 'West')
+        pipeline.record(self.pacman, ['East', 'Stop'], 'East')
+
+        self.assertEqual(pipeline.get_stats(),
+            {'staleness': {0: 1, 1: 1}, 'stale_invalid_actions': 0})
+        self.assertFalse(pipeline.is_prefetched(self.ghosts[0]))
+
+    def test_record_counts_actions_made_invalid_by_staleness(self):
+        pipeline = simulator.ActionPipeline([self.pacman] + self.ghosts)
+        pipeline.requests[self.ghosts[0].agent_id] = (0, ['East', 'West'])
+        pipeline.record(self.ghosts[0], ['West'], 'East')
+
+        self.assertEqual(pipeline.get_stats()['stale_invalid_actions'], 1)
+
+    def test_drain_discards_prefetched_actions(self):
+        pipeline = simulator.ActionPipeline([self.pacman] + self.ghosts)
+        pipeline.prefetch(self.pacman, self.state)
+        pipeline.drain()
+
+        self.assertFalse(pipeline.is_prefetched(self.ghosts[0]))
+        self.assertEqual(self.client.replies, [])
+
+    def test_every_move_of_a_game_is_recorded(self):
+        pipeline = simulator.ActionPipeline([self.pacman] + self.ghosts)
+        games = pacman_simulator.runGames(self.layout, self.pacman,
+            self.ghosts, textDisplay.NullGraphics(), 1, False,
+            trustAgents=True)
+        pipeline.drain()
+        staleness = pipeline.get_stats()['staleness']
+
+        self.assertTrue(games[0].moveHistory)
+        self.assertEqual(sum(staleness.values()), len(games[0].moveHistory))
+        self.assertEqual(self.client.replies, [])
+
+
+class TestSplitGames(unittest.TestCase):
+    def test_parts_cover_the_games_in_order(self):
+        for num_games in range(12):
+            for num_parts in range(1, 6):
+                parts = simulator.split_games(num_games, num_parts)
+                games = [first + i for first, size in parts for i in range(size)]
+
+                self.assertEqual(games, range(num_games))
+                self.assertLessEqual(len(parts), num_parts)
+
+    def test_parts_differ_by_at_most_one_game(self):
+        self.assertEqual(simulator.split_games(10, 4),
+            [(0, 3), (3, 3), (6, 2), (8, 2)])
+        self.assertEqual(simulator.split_games(2, 4), [(0, 1), (1, 1)])
+
+
+def create_results(learn_scores, test_scores, behavior_count,
+                   staleness=None):
+    results = {'learn_scores': learn_scores, 'test_scores': test_scores,
+        'behavior_count': behavior_count}
+
+    if staleness is not None:
+        results['pipeline'] = {'staleness': staleness,
+            'stale_invalid_actions': 1}
+
+    return results
+
+
+class TestResults(unittest.TestCase):
+    def test_append_results_keeps_game_order(self):
+        results = create_results([1.0], [], {1: {'Flee': [2]}}, {0: 3})
+        simulator.append_results(results, create_results([2.0], [5.0],
+            {1: {'Flee': [4], 'Seek': [1]}}, {0: 1, 1: 2}))
+
+        self.assertEqual(results['learn_scores'], [1.0, 2.0])
+        self.assertEqual(results['test_scores'], [5.0])
+        self.assertEqual(results['behavior_count'],
+            {1: {'Flee': [2, 4], 'Seek': [1]}})
+        self.assertEqual(results['pipeline'],
+            {'staleness': {0: 4, 1: 2}, 'stale_invalid_actions': 2})
+
+    def test_average_values_only_counts_lists_long_enough(self):
+        self.assertEqual(simulator.average_values([[1, 2], [3], [5, 6, 9]]),
+            [3.0, 4.0, 9.0])
+        self.assertEqual(simulator.average_values([]), [])
+
+    def test_average_results_game_by_game(self):
+        results = simulator.average_results([
+            create_results([-100, -50], [10], {1: {'Flee': [2, 4]}}, {0: 3}),
+            create_results([-200, -150], [30, 40],
+                {1: {'Flee': [6, 8], 'Seek': [6]}}, {0: 1, 1: 1})])
+
+        self.assertEqual(results['learn_scores'], [-150.0, -100.0])
+        self.assertEqual(results['test_scores'], [20.0, 40.0])
+        self.assertEqual(results['behavior_count'],
+            {1: {'Flee': [4.0, 6.0], 'Seek': [6.0]}})
+        self.assertEqual(results['pipeline']['staleness'], {0: 4, 1: 1})
+
+    def test_average_of_one_run_is_the_run(self):
+        run = create_results([-100.0, -50.0], [10.0], {1: {'Flee': [2.0]}})
+        results = simulator.average_results([run])
+
+        self.assertEqual(results.pop('seed_results'), [run])
+        self.assertEqual(results, run)
+
+
+class TestCommandLine(unittest.TestCase):
+    def parse_error(self, *argv):
+        """The error main reports for the arguments, before running anything."""
+        old_argv, old_stderr = sys.argv, sys.stderr
+        sys.argv, sys.stderr = ['simulator.py'] + list(argv), StringIO.StringIO()
+        try:
+            self.assertRaises(SystemExit, simulator.main)
+            return sys.stderr.getvalue()
+        finally:
+            sys.argv, sys.stderr = old_argv, old_stderr
+
+    def test_seeds_reject_options_they_cannot_honour(self):
+        self.assertIn('--graphics', self.parse_error('--seeds', '2', '--graphics'))
+        for transport in [comm.TCP, comm.SHARED_MEMORY]:
+            self.assertIn('--transport ' + transport,
+                self.parse_error('--seeds', '2', '--transport', transport))